@@ -0,0 +1,496 @@
+"""
+Single-decode analysis pipeline.
+
+The source is decoded once; every frame is fanned out to the registered
+analyzers that are due at that timestamp (each analyzer has its own sampling
+interval). Frames no analyzer needs are skipped with grab() and never
+converted. Results land in one cached per-video bundle:
+
+    ../data/cache/analysis/<fingerprint>_default.json
+    {
+        "source": ..., "fps": ..., "duration": ...,
+        "analyzers": {"ocr": {"config": {...}, "result": [...]}, ...}
+    }
+
+Requesting an analyzer that is already in the bundle with the same config is
+free; so is one whose cached entry differs only by a finer interval (like
+FrameStore.track, finer samples serve a coarser request). Only missing
+analyzers trigger a (single) new decode pass.
+
+Ingested sources (media_ingest) are decoded from the variant each analyzer's
+`purpose` asks for: the 360p CFR proxy for the metrics, the full-resolution
+mezzanine for OCR and cover frames. Times are mapped back to the source.
+
+Analyzers that only need small frames (lowres = True) are fed from the
+persistent memory-mapped frame store (frame_store) instead: a missing track
+is written during the decode pass above, and every later run reads the stored
+frames without decoding. Each analyzer names the planes it reads, so a fast
+RGB-only scene track does not carry a grayscale plane at the same rate.
+"""
+import os
+import cv2
+import numpy as np
+
+from media_utils import source_fingerprint, cache_path, load_json, save_json
+from media_ingest import resolve_source
+from frame_store import FrameStore
+
+# --- Shared frame metrics (also used by video_qa) ---
+
+def laplacian_sharpness(gray):
+    """Blur detection: variance of the Laplacian (low = blurry)"""
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+def mean_brightness(gray):
+    return float(np.mean(gray))
+
+def motion_energy(gray, prev_gray):
+    """Mean absolute frame difference"""
+    return float(np.mean(cv2.absdiff(gray, prev_gray)))
+
+# --- Lazy OCR reader (EasyOCR model load is expensive) ---
+
+_ocr_reader = None
+
+def get_ocr_reader():
+    global _ocr_reader
+    if _ocr_reader is None:
+        import easyocr
+        try:
+            import torch
+            use_gpu = torch.cuda.is_available()
+        except ImportError:
+            use_gpu = False
+        _ocr_reader = easyocr.Reader(['ch_sim', 'en'], gpu=use_gpu)
+    return _ocr_reader
+
+class FrameContext:
+    """One decoded frame plus lazily computed shared conversions"""
+
+    def __init__(self, frame):
+        self.frame = frame # BGR, full resolution
+        self._gray = None
+        self._thumb = None
+        self._small_hsv = None
+
+    @property
+    def gray(self):
+        if self._gray is None:
+            self._gray = cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY)
+        return self._gray
+
+    @property
+    def thumb(self):
+        """200x150 grayscale thumbnail (static-scene checks)"""
+        if self._thumb is None:
+            self._thumb = cv2.resize(self.gray, (200, 150), interpolation=cv2.INTER_AREA)
+        return self._thumb
+
+    @property
+    def small_hsv(self):
+        """160px wide HSV frame (scene change scoring)"""
+        if self._small_hsv is None:
+            h, w = self.frame.shape[:2]
+            small = cv2.resize(self.frame, (160, max(1, int(h * 160 / w))), interpolation=cv2.INTER_AREA)
+            self._small_hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+        return self._small_hsv
+
+# --- Analyzers ---
+
+class FrameAnalyzer:
+    """Base class: sample every `interval` seconds, collect a JSON-able result"""
+    name = "base"
+    purpose = "analysis" # media_ingest variant to decode (proxy)
+    lowres = False       # True: only uses ctx.gray/thumb/small_hsv, can run from the frame store
+    planes = ("gray",)   # frame store planes a lowres analyzer reads (gray: gray/thumb, rgb: small_hsv)
+
+    def __init__(self, interval):
+        self.interval = interval
+
+    def config(self):
+        return {"interval": self.interval}
+
+    def served_by(self, config):
+        """A cached config serves this analyzer: the same, or the same sampled at least as often"""
+        if config is None:
+            return False
+        mine, cached = dict(self.config()), dict(config)
+        interval, cached_interval = mine.pop("interval"), cached.pop("interval", None)
+        return mine == cached and cached_interval is not None and cached_interval <= interval + 1e-9
+
+    def process(self, t, ctx):
+        raise NotImplementedError
+
+    def result(self):
+        raise NotImplementedError
+
+class OcrAnalyzer(FrameAnalyzer):
+    """On-screen text. Static frames (thumbnail diff < threshold) reuse the previous OCR result."""
+    name = "ocr"
+    purpose = "edit" # Small text needs full resolution
+
+    def __init__(self, interval=1.0, static_threshold=5.0):
+        super().__init__(interval)
+        self.static_threshold = static_threshold
+        self.items = []
+        self.last_thumb = None
+        self.last_words = []
+
+    def config(self):
+        return {"interval": self.interval, "static_threshold": self.static_threshold}
+
+    def process(self, t, ctx):
+        if self.last_thumb is not None and cv2.mean(cv2.absdiff(ctx.thumb, self.last_thumb))[0] < self.static_threshold:
+            words = self.last_words
+        else:
+            words = get_ocr_reader().readtext(ctx.frame, detail=0)
+            self.last_words = words
+            self.last_thumb = ctx.thumb
+            print(f"OCR: {t:.1f}s -> Found {len(' '.join(words))} chars")
+        self.items.append({"time": round(t, 3), "text": " ".join(words), "words": list(words)})
+
+    def result(self):
+        return self.items
+
+class SceneChangeAnalyzer(FrameAnalyzer):
+    """Shot boundaries from the mean HSV difference of consecutive samples (ContentDetector-style)"""
+    name = "scenes"
+    lowres = True
+    planes = ("rgb",)
+
+    def __init__(self, interval=0.1, threshold=27.0, min_scene_len=0.5):
+        super().__init__(interval)
+        self.threshold = threshold
+        self.min_scene_len = min_scene_len
+        self.prev = None
+        self.cuts = []
+        self.last_t = 0.0
+
+    def config(self):
+        return {"interval": self.interval, "threshold": self.threshold, "min_scene_len": self.min_scene_len}
+
+    def process(self, t, ctx):
+        hsv = ctx.small_hsv.astype(np.int16)
+        if self.prev is not None:
+            score = float(np.mean(np.abs(hsv - self.prev)))
+            last_cut = self.cuts[-1] if self.cuts else 0.0
+            if score >= self.threshold and t - last_cut >= self.min_scene_len:
+                self.cuts.append(round(t, 3))
+        self.prev = hsv
+        self.last_t = t
+
+    def result(self):
+        bounds = [0.0] + self.cuts + [round(self.last_t + self.interval, 3)]
+        return {"cuts": self.cuts, "scenes": [[bounds[i], bounds[i + 1]] for i in range(len(bounds) - 1)]}
+
+class SharpnessAnalyzer(FrameAnalyzer):
+    """Laplacian sharpness + brightness samples: [[t, sharpness, brightness], ...]"""
+    name = "sharpness"
+    lowres = True
+
+    def __init__(self, interval=0.5):
+        super().__init__(interval)
+        self.samples = []
+
+    def process(self, t, ctx):
+        self.samples.append([round(t, 3), laplacian_sharpness(ctx.gray), mean_brightness(ctx.gray)])
+
+    def result(self):
+        return self.samples
+
+class MotionAnalyzer(FrameAnalyzer):
+    """Motion energy between consecutive samples: [[t, motion], ...]"""
+    name = "motion"
+    lowres = True
+
+    def __init__(self, interval=0.5):
+        super().__init__(interval)
+        self.prev = None
+        self.samples = []
+
+    def process(self, t, ctx):
+        if self.prev is not None:
+            self.samples.append([round(t, 3), motion_energy(ctx.gray, self.prev)])
+        self.prev = ctx.gray
+
+    def result(self):
+        return self.samples
+
+class CoverCandidateAnalyzer(FrameAnalyzer):
+    """
+    Keeps the top-k cover frames by a sharpness x exposure x colorfulness score.
+    The frames are saved as JPEGs next to the bundle, so covers never seek the source.
+    """
+    name = "covers"
+    purpose = "edit" # Covers are saved at full resolution
+
+    def __init__(self, interval=2.0, top_k=5, output_dir=None):
+        super().__init__(interval)
+        self.top_k = top_k
+        self.output_dir = output_dir
+        self.candidates = [] # (score, t, frame)
+
+    def config(self):
+        return {"interval": self.interval, "top_k": self.top_k}
+
+    def process(self, t, ctx):
+        sharp = laplacian_sharpness(ctx.thumb)
+        exposure = 1.0 - abs(mean_brightness(ctx.thumb) - 128.0) / 128.0
+        hsv = ctx.small_hsv
+        colorfulness = float(np.mean(hsv[:, :, 1])) / 255.0
+        score = np.log1p(sharp) * (0.5 + exposure) * (0.5 + colorfulness)
+
+        self.candidates.append((score, t, ctx.frame.copy()))
+        self.candidates.sort(key=lambda c: c[0], reverse=True)
+        del self.candidates[self.top_k:]
+
+    def result(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        out = []
+        for score, t, frame in self.candidates:
+            path = os.path.join(self.output_dir, f"cover_{t:.1f}.jpg")
+            cv2.imwrite(path, frame, [cv2.IMWRITE_JPEG_QUALITY, 95])
+            out.append({"time": round(t, 3), "score": round(float(score), 4), "path": path})
+        return out
+
+# --- Subject cues (smart crop) ---
+
+_face_cascade = None
+
+def get_face_cascade():
+    global _face_cascade
+    if _face_cascade is None:
+        _face_cascade = cv2.CascadeClassifier(os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml"))
+    return _face_cascade
+
+def spectral_saliency(gray, size=64):
+    """Spectral-residual saliency map (size x size, 0..1)"""
+    small = cv2.resize(gray, (size, size), interpolation=cv2.INTER_AREA).astype(np.float32)
+    spectrum = np.fft.fft2(small)
+    log_amp = np.log1p(np.abs(spectrum)).astype(np.float32)
+    residual = log_amp - cv2.blur(log_amp, (3, 3))
+    sal = np.abs(np.fft.ifft2(np.exp(residual + 1j * np.angle(spectrum)))) ** 2
+    sal = cv2.GaussianBlur(sal.astype(np.float32), (0, 0), 2.5)
+    return sal / (float(sal.max()) + 1e-6)
+
+class SubjectAnalyzer(FrameAnalyzer):
+    """
+    Horizontal subject position for vertical reframing: [{"time", "cx", "weight"}, ...].
+    Saliency, motion against the previous sample and Haar faces are scored on a
+    low-res proxy and collapsed into a column profile; cx (0..1) is the center of
+    the 9:16 window holding most of it, weight how much it stands out.
+    """
+    name = "subject"
+    lowres = True
+    BINS = 64
+    FACE_WEIGHT = 3.0
+
+    def __init__(self, interval=0.25, width=320, aspect=9 / 16, faces=True):
+        super().__init__(interval)
+        self.width = width
+        self.aspect = aspect
+        self.faces = faces
+        self.prev = None
+        self.samples = []
+
+    def config(self):
+        return {"interval": self.interval, "width": self.width, "aspect": round(self.aspect, 4), "faces": self.faces}
+
+    def process(self, t, ctx):
+        h, w = ctx.gray.shape
+        small = cv2.resize(ctx.gray, (self.width, max(1, int(h * self.width / w))), interpolation=cv2.INTER_AREA)
+        bins = self.BINS
+
+        profile = spectral_saliency(small, bins).mean(axis=0)
+        if self.prev is not None:
+            diff = cv2.resize(cv2.absdiff(small, self.prev), (bins, bins), interpolation=cv2.INTER_AREA)
+            motion = diff.mean(axis=0)
+            if motion.max() > 2.0: # Ignore sensor noise / compression flicker
+                profile = profile + motion / motion.max()
+        self.prev = small
+
+        if self.faces:
+            found = get_face_cascade().detectMultiScale(small, scaleFactor=1.15, minNeighbors=4, minSize=(16, 16))
+            for x, _, fw, _ in found:
+                b0, b1 = int(x * bins / self.width), int(np.ceil((x + fw) * bins / self.width))
+                profile[b0:b1] += self.FACE_WEIGHT
+
+        win = int(round(self.aspect * h / w * bins))
+        total = float(profile.sum())
+        if win >= bins or total <= 0:
+            self.samples.append({"time": round(t, 3), "cx": 0.5, "weight": 0.0})
+            return
+        csum = np.concatenate([[0.0], np.cumsum(profile)])
+        sums = csum[win:] - csum[:-win]
+        i = int(np.argmax(sums))
+        # Share of the profile inside the window, above what a uniform frame would give
+        weight = max(0.0, sums[i] / total - win / bins) / (1.0 - win / bins)
+        self.samples.append({"time": round(t, 3), "cx": round((i + win / 2) / bins, 4), "weight": round(float(weight), 4)})
+
+    def result(self):
+        return self.samples
+
+def default_analyzers(ocr_interval=1.0):
+    """Everything the engines consume, in one decode"""
+    return [OcrAnalyzer(interval=ocr_interval), SceneChangeAnalyzer(), SharpnessAnalyzer(),
+            MotionAnalyzer(), CoverCandidateAnalyzer()]
+
+# --- Pipeline ---
+
+def run_analyzers(video_path, analyzers, offset=0.0):
+    """
+    Decode the file once, feeding each analyzer at its own sampling interval.
+    `offset` is the file's time offset from the source (media_ingest); analyzers see source times.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video: {video_path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    duration = frame_count / fps
+
+    print(f"Analysis pass: {len(analyzers)} analyzers ({', '.join(a.name for a in analyzers)}) over {duration:.1f}s")
+    next_due = [0.0] * len(analyzers)
+    half_frame = 0.5 / fps
+    frame_idx = 0
+    while True:
+        t = frame_idx / fps
+        due = [i for i, a in enumerate(analyzers) if t + half_frame >= next_due[i]]
+        if not due:
+            # Nobody needs this frame: advance the demuxer without decoding/converting
+            if not cap.grab():
+                break
+            frame_idx += 1
+            continue
+
+        ret, frame = cap.read()
+        if not ret:
+            break
+        ctx = FrameContext(frame)
+        for i in due:
+            analyzers[i].process(max(0.0, t - offset), ctx)
+            while next_due[i] <= t + half_frame:
+                next_due[i] += analyzers[i].interval
+        frame_idx += 1
+
+    cap.release()
+    return fps, max(0.0, duration - offset)
+
+def run_stored(track, analyzers):
+    """Feed analyzers from a frame store track (no decode), with run_analyzers' scheduling"""
+    print(f"Analysis from frame store: {len(analyzers)} analyzers ({', '.join(a.name for a in analyzers)}), "
+          f"{track.count} samples @ {track.interval:g}s")
+    next_due = [0.0] * len(analyzers)
+    half = 0.5 * track.interval
+    for t, ctx in track.frames():
+        for i, a in enumerate(analyzers):
+            if t + half >= next_due[i]:
+                a.process(t, ctx)
+                while next_due[i] <= t + half:
+                    next_due[i] += a.interval
+
+def _bundle_path(video_path):
+    return cache_path("analysis", source_fingerprint(video_path))
+
+def load_analysis_bundle(video_path):
+    """Cached bundle for this source, or None (never decodes)"""
+    return load_json(_bundle_path(video_path))
+
+def get_analysis_bundle(video_path, analyzers=None):
+    """
+    Return the per-video analysis bundle, running only the analyzers whose
+    results are missing (or were computed with a different config or a
+    coarser interval).
+    """
+    if analyzers is None:
+        analyzers = default_analyzers()
+    path = _bundle_path(video_path)
+    bundle = load_json(path) or {"source": os.path.basename(video_path), "analyzers": {}}
+
+    missing = [a for a in analyzers
+               if not a.served_by(bundle["analyzers"].get(a.name, {}).get("config"))]
+    if not missing:
+        return bundle
+
+    for a in missing:
+        if isinstance(a, CoverCandidateAnalyzer) and a.output_dir is None:
+            a.output_dir = os.path.splitext(path)[0] + "_covers"
+
+    # Low-res analyzers read the frame store, one track per plane set at the rate its
+    # analyzers need; a missing track is recorded in the decode pass
+    stored = {}
+    for a in missing:
+        if a.lowres:
+            stored.setdefault(tuple(a.planes), []).append(a)
+    decoded = [a for a in missing if not a.lowres]
+    tracks = {}
+    writers = {}
+    if stored:
+        from keyframe_index import get_keyframe_index
+        store = FrameStore(video_path)
+        for planes, group in stored.items():
+            interval = min(a.interval for a in group)
+            tracks[planes] = store.track(interval, planes)
+            if tracks[planes] is None:
+                writers[planes] = store.writer(interval, get_keyframe_index(video_path).duration, planes)
+                decoded.append(writers[planes])
+
+    # One decode per variant needed (usually just the proxy)
+    groups = {}
+    for a in decoded:
+        groups.setdefault(resolve_source(video_path, a.purpose), []).append(a)
+    for (src, offset), group in groups.items():
+        fps, duration = run_analyzers(src, group, offset)
+        bundle["fps"] = fps
+        bundle["duration"] = duration
+
+    for planes, group in stored.items():
+        track = writers[planes].close() if planes in writers else tracks[planes]
+        if track is None:
+            raise IOError(f"No frames stored for {video_path}")
+        run_stored(track, group)
+        if "duration" not in bundle:
+            bundle["fps"] = round(1.0 / track.interval, 3)
+            bundle["duration"] = round(float(track.times[-1]) + track.interval, 3)
+    for a in missing:
+        bundle["analyzers"][a.name] = {"config": a.config(), "result": a.result()}
+    save_json(path, bundle)
+    print(f"Analysis bundle saved: {path}")
+    return bundle
+
+def get_cover_frame(video_path, fallback_time=5.0, with_time=False):
+    """
+    Best-scored cover frame (RGB) from the cached bundle; falls back to one
+    keyframe-index seek (exact frame, bounded decode) at `fallback_time` when
+    the source has not been analyzed yet.
+    with_time=True returns (frame, source_time).
+    """
+    covers = bundle_result(load_analysis_bundle(video_path), "covers")
+    if covers:
+        frame = cv2.imread(covers[0]["path"])
+        if frame is not None:
+            print(f"Using analyzed cover candidate at {covers[0]['time']:.1f}s")
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            return (frame, covers[0]["time"]) if with_time else frame
+
+    from keyframe_index import get_keyframe_index, read_frame_at
+    index = get_keyframe_index(video_path)
+    frame = read_frame_at(video_path, fallback_time, index)
+    return (frame, index.frame_time(fallback_time)) if with_time else frame
+
+def bundle_result(bundle, name):
+    """Result of one analyzer from a bundle (None if absent)"""
+    if not bundle:
+        return None
+    entry = bundle.get("analyzers", {}).get(name)
+    return entry["result"] if entry else None
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) < 2:
+        print("Usage: python analysis_pipeline.py <video_path>")
+    else:
+        b = get_analysis_bundle(sys.argv[1])
+        for name, entry in b["analyzers"].items():
+            res = entry["result"]
+            print(f"{name}: {len(res) if isinstance(res, list) else len(res.get('cuts', []))} entries")
@@ -0,0 +1,80 @@
+"""
+ASR timeline index: the spoken-word counterpart of the OCR analysis.
+
+The Whisper transcript is stored as a time-indexed token timeline plus a
+precomputed lookup structure (the concatenated transcript and the start time
+of every character), so keyword matching costs one substring scan per keyword
+instead of re-aggregating tokens for every candidate window.
+"""
+import os
+import numpy as np
+
+from media_utils import source_fingerprint, cache_path, load_json, save_json
+
+ASR_MODEL = "base"
+ASR_LANGUAGE = "zh"
+
+def build_index(tokens):
+    """
+    Precompute the search index for a token list.
+    text:       lower-cased concatenated transcript
+    char_times: start time of the token each character belongs to
+    """
+    text_parts = []
+    char_times = []
+    for tok in tokens:
+        t = tok["text"].lower()
+        text_parts.append(t)
+        char_times.extend([tok["start"]] * len(t))
+    return {"text": "".join(text_parts), "char_times": char_times}
+
+def build_asr_timeline(video_path, model_name=ASR_MODEL, language=ASR_LANGUAGE):
+    """
+    Transcribe the source once and cache the token timeline + index,
+    keyed by source fingerprint and ASR parameters.
+    """
+    params = {"model": model_name, "language": language}
+    path = cache_path("asr", source_fingerprint(video_path), params)
+    cached = load_json(path)
+    if cached is not None:
+        print("Loading cached ASR timeline...")
+        return cached
+
+    # Imported lazily: Whisper is heavy and only needed on cache miss
+    from transcribe import transcribe_words
+    tokens = transcribe_words(video_path, model_name=model_name, language=language)
+
+    timeline = {
+        "source": os.path.basename(video_path),
+        "params": params,
+        "tokens": tokens,
+        "index": build_index(tokens)
+    }
+    save_json(path, timeline)
+    print(f"ASR timeline cached: {len(tokens)} tokens -> {path}")
+    return timeline
+
+def load_asr_timeline(video_path, model_name=ASR_MODEL, language=ASR_LANGUAGE):
+    """Return the cached ASR timeline, or None if it has not been built yet"""
+    params = {"model": model_name, "language": language}
+    return load_json(cache_path("asr", source_fingerprint(video_path), params))
+
+def keyword_hit_times(asr_timeline, keyword):
+    """Sorted start times of every occurrence of `keyword` in the transcript"""
+    index = asr_timeline["index"]
+    text = index["text"]
+    char_times = index["char_times"]
+    kw = keyword.lower()
+    if not kw:
+        return np.empty(0)
+
+    hits = []
+    pos = text.find(kw)
+    while pos != -1:
+        hits.append(char_times[pos])
+        pos = text.find(kw, pos + len(kw))
+    return np.asarray(hits, dtype=float)
+
+def window_text(asr_timeline, start, end):
+    """Transcript spoken inside [start, end) - handy for debugging matches"""
+    return "".join(tok["text"] for tok in asr_timeline["tokens"] if start <= tok["start"] < end)
@@ -1,45 +1,34 @@
 import os
 import json
 import asyncio
-import edge_tts
-# MoviePy v2 compatibility
-try:
-    from moviepy import VideoFileClip, AudioFileClip, concatenate_videoclips, CompositeAudioClip
-except ImportError:
-    # Fallback for older versions
-    from moviepy.editor import VideoFileClip, AudioFileClip, concatenate_videoclips, CompositeAudioClip
 
-from scenedetect import detect, ContentDetector, AdaptiveDetector
+import scene_index
+from timeline import Timeline, Section, ClipRef, AudioTrack, render_timeline
+from media_ingest import prepare_source
+from keyframe_index import planning_index
+from tts_cache import get_voice
+from edit_plan import DRY_RUN
 
 # --- 配置 ---
 VIDEO_FILE = "ai数学助手开发过程.mp4"
 OUTPUT_FILE = "final_video_auto.mp4"
 VOICE = "zh-CN-YunxiNeural"  # 活泼的男声，适合解说
-TEMP_AUDIO_DIR = "temp_audio"
 
 # --- 文案 (可以从 clips.json 读取，但为了简单这里直接定义，方便TTS生成) ---
 # 注意：这里直接硬编码文案，为了确保 TTS 生成的文件名和顺序一致
 # 如果 clips.json 更新了，这里也要更新，或者写个函数读 json。
 # 既然已经有了 clips.json，我们还是读 clips.json 吧。
 
-async def generate_tts(text, output_file):
-    """生成 TTS 音频"""
-    communicate = edge_tts.Communicate(text, VOICE)
-    await communicate.save(output_file)
+async def generate_tts(text, dry_run=False):
+    """TTS 配音：每句只合成一次 (tts_cache)；dry run 只取缓存时长或按字数估算"""
+    return await get_voice(text, VOICE, dry_run=dry_run)
 
-def get_scenes(video_path):
-    """使用 scenedetect 获取场景列表"""
-    print("正在分析视频场景 (这可能需要几分钟)...")
+def get_scenes(video_path, dry_run=False):
+    """使用 scenedetect 获取场景列表 (降采样 + 跳帧检测，按视频指纹缓存)"""
     # 使用 AdaptiveDetector 适应屏幕录制的细微变化
-    scene_list = detect(video_path, AdaptiveDetector(adaptive_threshold=3.0, min_scene_len=15))
-    
-    # 转换为秒 (start, end)
-    scenes_in_seconds = []
-    for scene in scene_list:
-        start, end = scene
-        scenes_in_seconds.append((start.get_seconds(), end.get_seconds()))
-    
-    return scenes_in_seconds
+    if dry_run:
+        return scene_index.load_scenes(video_path, detector="adaptive", threshold=3.0, min_scene_len=15)
+    return scene_index.get_scenes(video_path, detector="adaptive", threshold=3.0, min_scene_len=15)
 
 def select_best_clip(scenes, target_duration, region_start, region_end, used_segments):
     """
@@ -90,9 +79,6 @@ def select_best_clip(scenes, target_duration, region_start, region_end, used_seg
     return selected_start, selected_end
 
 async def main():
-    if not os.path.exists(TEMP_AUDIO_DIR):
-        os.makedirs(TEMP_AUDIO_DIR)
-
     # 1. 读取文案
     with open("clips.json", "r", encoding="utf-8") as f:
         clips_data = json.load(f)
@@ -103,18 +89,15 @@ async def main():
     
     for i, clip in enumerate(clips_data):
         text = clip["text"]
-        audio_path = os.path.join(TEMP_AUDIO_DIR, f"clip_{i}.mp3")
-        await generate_tts(text, audio_path)
+        voice = await generate_tts(text, dry_run=DRY_RUN)
         
-        # 获取音频时长
-        # 需要加载音频文件来获取时长
-        audioclip = AudioFileClip(audio_path)
-        duration = audioclip.duration
+        # 时长来自缓存的合成结果，无需再加载音频文件
+        duration = voice["duration"]
         audio_clips_info.append({
-            "path": audio_path,
+            "path": voice["path"],
             "duration": duration,
             "text": text,
-            "audioclip_obj": audioclip
+            "duration_source": voice["duration_source"]
         })
         print(f"片段 {i+1} 音频时长: {duration:.2f}s")
 
@@ -133,14 +116,17 @@ async def main():
         video_path = VIDEO_FILE
 
     print(f"使用视频源: {video_path}")
-    original_video = VideoFileClip(video_path)
-    total_video_duration = original_video.duration
+    if not DRY_RUN:
+        # 一次性转码：分析用 360p 代理 + 渲染用恒定帧率中间文件（按指纹缓存）
+        prepare_source(video_path)
+    # 关键帧索引 (只解封装，按指纹缓存)：不打开解码器即可拿到时长
+    total_video_duration = planning_index(video_path).duration
     
     # 获取场景分割
-    # 如果视频太长，scenedetect 可能很慢。可以考虑跳过这步直接按比例切。
-    # 为了"不偷懒"，我们还是尝试跑一下，如果失败就fallback。
+    # 检测在低分辨率、跳帧的画面上进行，结果按视频指纹缓存，重复运行直接读缓存。
+    # 如果失败就fallback。
     try:
-        scenes = get_scenes(video_path)
+        scenes = get_scenes(video_path, dry_run=DRY_RUN)
         if not scenes:
             raise Exception("No scenes detected")
     except Exception as e:
@@ -149,7 +135,7 @@ async def main():
         scenes = [(t, t+5) for t in range(0, int(total_video_duration), 5)]
 
     # 4. 智能匹配画面
-    final_clips = []
+    timeline = Timeline(encoder={"codec": "libx264", "audio_codec": "aac"})
     used_segments = []
     
     # 定义大致的画面分布策略
@@ -197,54 +183,18 @@ async def main():
         print(f"  -> 选中: {start:.1f}s - {end:.1f}s")
         used_segments.append((start, end))
         
-        # 剪辑视频
-        # MoviePy v2 compatibility: subclip -> subclipped
-        if hasattr(original_video, 'subclipped'):
-            video_sub = original_video.subclipped(start, end)
-        else:
-            video_sub = original_video.subclip(start, end)
-        
-        # 混合音频: 原声降低音量 + TTS
-        # 如果原视频有声音，保留一点背景音
-        if original_video.audio:
-            # MoviePy v2 compatibility for volumex
-            try:
-                original_audio = video_sub.audio.volumex(0.1) # 1.x style
-            except AttributeError:
-                # 2.x style: might be with_volume_scaled or similar, or just manually
-                # Let's try multiply_volume which is common in v2
-                if hasattr(video_sub.audio, 'multiply_volume'):
-                    original_audio = video_sub.audio.multiply_volume(0.1)
-                elif hasattr(video_sub.audio, 'with_volume_scaled'):
-                    original_audio = video_sub.audio.with_volume_scaled(0.1)
-                else:
-                    # Fallback: assume volumex exists on fx or just skip volume reduction if hard
-                    # Try importing volumex
-                    from moviepy.audio.fx.multiply_volume import multiply_volume
-                    original_audio = multiply_volume(video_sub.audio, 0.1)
-
-            final_audio = CompositeAudioClip([original_audio, info["audioclip_obj"]])
-        else:
-            final_audio = info["audioclip_obj"]
-            
-        # MoviePy v2 compatibility: set_audio -> with_audio
-        if hasattr(video_sub, 'with_audio'):
-            video_sub = video_sub.with_audio(final_audio)
-        else:
-            video_sub = video_sub.set_audio(final_audio)
-        
-        final_clips.append(video_sub)
+        # 原声降低音量保留做背景 (源视频无音轨时渲染器自动忽略) + TTS 配音
+        timeline.sections.append(Section(
+            clips=[ClipRef(video_path, start, end, audio_volume=0.1)],
+            voice=AudioTrack(info["path"], duration=end - start),
+            meta={"text": info["text"], "region": [region_start, region_end],
+                  "duration_source": info["duration_source"]}
+        ))
 
     # 5. 合并导出
     print("正在合并视频...")
-    final_video = concatenate_videoclips(final_clips)
-    final_video.write_videofile(OUTPUT_FILE, codec='libx264', audio_codec='aac')
-    print(f"完成！视频已保存为: {OUTPUT_FILE}")
-
-    # 清理
-    original_video.close()
-    for clip in final_clips:
-        clip.close()
+    output_path = render_timeline(timeline, OUTPUT_FILE)
+    print(f"完成！已保存为: {output_path}")
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -1,31 +1,26 @@
-import cv2
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
 import os
+from analysis_pipeline import get_cover_frame
+from font_registry import get_font
 
 # Configuration
 VIDEO_FILE = "../resources/ai数学老师.mp4"
 OUTPUT_FILE = "../output/cover_horizontal.jpg"
-FONT_PATH = "C:\\Windows\\Fonts\\msyh.ttc" # Microsoft YaHei
 TITLE = "Trae AI 挑战\n手搓数学老师" # Split into two lines for better safety margin
 SUBTITLE = "不会写代码也能做软件？"
 
 def get_video_frame(video_path, time_sec=5.0):
-    """Extract a frame from the video at specific time"""
+    """
+    Cover background frame.
+    Uses the best-scored candidate from the shared analysis bundle when the
+    source has been analyzed (no seek at all), else a single seek at time_sec.
+    """
     if not os.path.exists(video_path):
         print(f"Video not found: {video_path}")
         return None
         
-    cap = cv2.VideoCapture(video_path)
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    cap.set(cv2.CAP_PROP_POS_MSEC, time_sec * 1000)
-    ret, frame = cap.read()
-    cap.release()
-    
-    if ret:
-        # Convert BGR to RGB
-        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    return None
+    return get_cover_frame(video_path, fallback_time=time_sec)
 
 def create_horizontal_cover():
     print(f"Creating horizontal cover for {VIDEO_FILE}...")
@@ -84,12 +79,8 @@ def create_horizontal_cover():
     # 3. Draw Text
     draw = ImageDraw.Draw(img)
     
-    try:
-        font_title = ImageFont.truetype(FONT_PATH, 140) # Bigger for horizontal
-        font_sub = ImageFont.truetype(FONT_PATH, 80)
-    except:
-        font_title = ImageFont.load_default()
-        font_sub = ImageFont.load_default()
+    font_title = get_font(140) # Bigger for horizontal
+    font_sub = get_font(80)
     
     # Draw Title (Centered)
     # Support multi-line title for safe zones
@@ -123,15 +114,12 @@ def create_horizontal_cover():
              # Scale down just for this line if needed
              scale = safe_width / w
              new_size = int(140 * scale)
-             try:
-                 temp_font = ImageFont.truetype(FONT_PATH, new_size)
-                 bbox = draw.textbbox((0, 0), line, font=temp_font)
-                 w = bbox[2] - bbox[0]
-                 h = bbox[3] - bbox[1]
-                 # Use temp_font for this line
-                 font_to_use = temp_font
-             except:
-                 font_to_use = font_title
+             temp_font = get_font(new_size)
+             bbox = draw.textbbox((0, 0), line, font=temp_font)
+             w = bbox[2] - bbox[0]
+             h = bbox[3] - bbox[1]
+             # Use temp_font for this line
+             font_to_use = temp_font
         else:
              font_to_use = font_title
 
@@ -156,7 +144,7 @@ def create_horizontal_cover():
 
     # Add "Trae AI" branding
     branding = "Powered by Trae"
-    font_brand = ImageFont.truetype(FONT_PATH, 50)
+    font_brand = get_font(50)
     bbox_br = draw.textbbox((0, 0), branding, font=font_brand)
     wb = bbox_br[2] - bbox_br[0]
     draw.text(((TARGET_W - wb)/2, TARGET_H - 100), branding, font=font_brand, fill=(200, 200, 200))
@@ -1,32 +1,39 @@
-import cv2
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
 import os
+from analysis_pipeline import get_cover_frame
+from smart_crop import get_crop_path
+from font_registry import get_font
 import textwrap
 
 # Configuration
 VIDEO_FILE = "../resources/ai数学老师.mp4"
 OUTPUT_FILE = "../output/cover_vertical.jpg"
-FONT_PATH = "C:\\Windows\\Fonts\\msyh.ttc" # Microsoft YaHei
+SMART_CROP = True # Crop the cover around the subject (cached smart_crop path) instead of the center
 TITLE = "Trae AI 挑战\n手搓数学老师" # Use \n for manual line break
 SUBTITLE = "不会写代码也能做软件？"
 
 def get_video_frame(video_path, time_sec=5.0):
-    """Extract a frame from the video at specific time"""
+    """
+    Cover background frame and its source time.
+    Uses the best-scored candidate from the shared analysis bundle when the
+    source has been analyzed (no seek at all), else a single seek at time_sec.
+    """
     if not os.path.exists(video_path):
         print(f"Video not found: {video_path}")
-        return None
+        return None, time_sec
         
-    cap = cv2.VideoCapture(video_path)
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    cap.set(cv2.CAP_PROP_POS_MSEC, time_sec * 1000)
-    ret, frame = cap.read()
-    cap.release()
-    
-    if ret:
-        # Convert BGR to RGB
-        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    return None
+    return get_cover_frame(video_path, fallback_time=time_sec, with_time=True)
+
+def subject_center(video_path, t):
+    """Horizontal subject position (0..1) at t from the smart crop path, else the center"""
+    if not SMART_CROP:
+        return 0.5
+    try:
+        return get_crop_path(video_path).center_at(t)
+    except Exception as e:
+        print(f"Smart crop unavailable ({e}), using center crop")
+        return 0.5
 
 def create_vertical_cover():
     print(f"Creating vertical cover for {VIDEO_FILE}...")
@@ -35,7 +42,7 @@ def create_vertical_cover():
     TARGET_W, TARGET_H = 1080, 1920
     
     # 1. Get Background
-    frame = get_video_frame(VIDEO_FILE, time_sec=35.0) # Pick a frame with UI
+    frame, frame_time = get_video_frame(VIDEO_FILE, time_sec=35.0) # Pick a frame with UI
     
     if frame is None:
         print("Using dark background fallback.")
@@ -53,8 +60,9 @@ def create_vertical_cover():
             new_h = TARGET_H
             new_w = int(new_h * img_ratio)
             img = img.resize((new_w, new_h), Image.Resampling.LANCZOS)
-            # Center crop
-            left = (new_w - TARGET_W) // 2
+            # Crop around the subject (center when there is no path)
+            cx = subject_center(VIDEO_FILE, frame_time)
+            left = min(max(int(cx * new_w - TARGET_W / 2), 0), new_w - TARGET_W)
             img = img.crop((left, 0, left + TARGET_W, TARGET_H))
         else:
             # Image is taller than target (unlikely for landscape video), crop height
@@ -77,12 +85,8 @@ def create_vertical_cover():
     # 3. Draw Text
     draw = ImageDraw.Draw(img)
     
-    try:
-        font_title = ImageFont.truetype(FONT_PATH, 100)
-        font_sub = ImageFont.truetype(FONT_PATH, 60)
-    except:
-        font_title = ImageFont.load_default()
-        font_sub = ImageFont.load_default()
+    font_title = get_font(100)
+    font_sub = get_font(60)
     
     # Draw Title
     # Center vertically roughly
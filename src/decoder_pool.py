@@ -0,0 +1,184 @@
+"""
+Decoder pool: many subclips of the same source without backward seeks.
+
+A VideoFileClip has one ffmpeg reader. Cutting dozens of random subclips
+from it makes the render jump that reader back and forth, and every backward
+(or far forward) jump restarts ffmpeg with a new -ss: a seek plus a decode
+from the previous keyframe.
+
+DecoderPool keeps up to `readers` VideoFileClips per source and hands every
+subclip the reader whose playhead sits just before its start (so it only
+decodes forward a little), opening another reader or recycling the least
+recently used one otherwise. Assignment happens while the render is being
+built, in the order the clips will be read, by tracking where each reader's
+playhead will be.
+
+The source's keyframe index (keyframe_index) tells what a seek really costs:
+a reader anywhere inside the GOP before a cut is as good as a seek, so it is
+reused; unavoidable seeks add their bounded decode cost to the plan. The seek
+itself stays MoviePy's: its reader restarts ffmpeg with an input -ss, which
+already jumps to the keyframe before t and decodes forward frame-accurately
+(on the CFR, 1s-GOP mezzanine that is keyframe_index's seek-then-decode).
+Routing reads through keyframe_index.seek_capture would swap MoviePy's
+streaming reader for an OpenCV capture per subclip without saving a frame.
+
+Readers open the ingested variant for the pool's purpose (media_ingest:
+mezzanine for renders, proxy for previews); offset(path) maps source times
+onto it. Preview pools (for_timeline on a preview.py timeline) also decode
+at the preview scale when the variant is larger than that.
+
+Readers are wrapped so real seeks and decoded frames are counted:
+
+    seeks            ffmpeg restarts (backward or > FORWARD_WINDOW frames ahead)
+    frames_decoded   frames decoded, including ones skipped over
+    frames_served    frames returned
+"""
+from keyframe_index import get_keyframe_index
+from media_ingest import resolve_source, source_fps
+
+try:
+    from moviepy import VideoFileClip
+except ImportError:
+    from moviepy.editor import VideoFileClip
+
+READERS_PER_SOURCE = 3
+FORWARD_WINDOW = 100 # Frames a reader decodes forward before restarting ffmpeg (MoviePy's threshold)
+
+class MeteredReader:
+    """Wraps an FFMPEG_VideoReader and counts seeks/decodes per get_frame"""
+
+    def __init__(self, reader, stats):
+        self.reader = reader
+        self.stats = stats
+
+    def get_frame(self, t):
+        before = self.reader.pos
+        frame = self.reader.get_frame(t)
+        after = self.reader.pos
+        self.stats["frames_served"] += 1
+        if after < before or after > before + FORWARD_WINDOW:
+            self.stats["seeks"] += 1
+            self.stats["frames_decoded"] += 1
+        elif after > before:
+            self.stats["frames_decoded"] += after - before
+        return frame
+
+    def __getattr__(self, name):
+        return getattr(self.reader, name)
+
+class DecoderPool:
+    """Per-render pool of readers; get(path) for the audio/metadata clip, acquire() for subclips"""
+
+    def __init__(self, readers=READERS_PER_SOURCE, purpose="edit", scale=None):
+        self.readers = max(1, readers)
+        self.purpose = purpose
+        self.scale = scale # Decode at this fraction of the source size (previews)
+        self.slots = {} # path -> [{"clip", "head", "used"}]
+        self.tick = 0
+        self.variants = {} # path -> (variant path, offset)
+        self.indexes = {}
+        self.stats = {"readers": 0, "assigned": 0, "planned_seeks": 0, "planned_seek_frames": 0,
+                      "seeks": 0, "frames_decoded": 0, "frames_served": 0}
+
+    @classmethod
+    def for_timeline(cls, timeline, **kwargs):
+        """Pool matching a timeline: proxies at the preview scale for preview renders"""
+        preview = timeline.meta.get("preview")
+        if preview:
+            return cls(purpose="preview", scale=preview["scale"], **kwargs)
+        return cls(**kwargs)
+
+    def variant(self, path):
+        if path not in self.variants:
+            self.variants[path] = resolve_source(path, self.purpose)
+        return self.variants[path]
+
+    def offset(self, path):
+        """Add to source times to address the opened variant"""
+        return self.variant(path)[1]
+
+    def fps(self, path):
+        """Exact ingest rate (30000/1001 stays 29.97002997...), else what the reader reports"""
+        return source_fps(path) or self.get(path).fps or 30.0
+
+    def target_resolution(self, path):
+        """(height, None) to scale down while decoding, or None"""
+        if not self.scale:
+            return None
+        from preview import source_size
+        height = int(round(source_size(path)[1] * self.scale / 2)) * 2
+        return (height, None) if source_size(self.variant(path)[0])[1] > height else None
+
+    def _open(self, path, audio):
+        target = self.target_resolution(path)
+        if target is not None:
+            clip = VideoFileClip(self.variant(path)[0], audio=audio, target_resolution=target)
+        else:
+            clip = VideoFileClip(self.variant(path)[0], audio=audio)
+        clip.reader = MeteredReader(clip.reader, self.stats)
+        slot = {"clip": clip, "head": 0.0, "used": self.tick}
+        self.slots.setdefault(path, []).append(slot)
+        self.stats["readers"] += 1
+        return slot
+
+    def get(self, path):
+        """The source's first reader (the only one that opens the audio track)"""
+        if path not in self.slots:
+            self._open(path, audio=True)
+        return self.slots[path][0]["clip"]
+
+    def index(self, path):
+        if path not in self.indexes:
+            try:
+                self.indexes[path] = get_keyframe_index(self.variant(path)[0])
+            except Exception as e:
+                print(f"Warning: no keyframe index for {path} ({e})")
+                self.indexes[path] = None
+        return self.indexes[path]
+
+    def _seek(self, index, start):
+        self.stats["planned_seeks"] += 1
+        if index is not None:
+            self.stats["planned_seek_frames"] += index.decode_cost(start)
+
+    def acquire(self, path, start, end):
+        """Reader to cut [start, end) (source times) from; call in the order the clips will be read"""
+        self.get(path)
+        start, end = start + self.offset(path), end + self.offset(path)
+        slots = self.slots[path]
+        fps = self.fps(path)
+        index = self.index(path)
+        # A seek would decode from this keyframe anyway
+        gop_start = index.keyframe_before(start) if index is not None else start
+        self.tick += 1
+
+        # Closest playhead at or just before the start: decode forward, no seek
+        ahead = [s for s in slots if s["head"] <= start + 0.5 / fps and
+                 ((start - s["head"]) * fps <= FORWARD_WINDOW or s["head"] >= gop_start)]
+        if ahead:
+            slot = max(ahead, key=lambda s: s["head"])
+        elif len(slots) < self.readers:
+            slot = self._open(path, audio=False)
+            if start * fps > FORWARD_WINDOW:
+                self._seek(index, start)
+        else:
+            slot = min(slots, key=lambda s: s["used"])
+            self._seek(index, start)
+
+        slot["head"] = end
+        slot["used"] = self.tick
+        self.stats["assigned"] += 1
+        return slot["clip"]
+
+    def report(self):
+        s = self.stats
+        print(f"Decoder pool: {s['assigned']} subclips on {s['readers']} readers | "
+              f"seeks {s['seeks']} (planned {s['planned_seeks']}, ~{s['planned_seek_frames']} frames from keyframes), "
+              f"decoded {s['frames_decoded']} frames for {s['frames_served']} served")
+        return dict(s)
+
+    def close(self):
+        for slots in self.slots.values():
+            for slot in slots:
+                slot["clip"].close()
+        self.slots.clear()
@@ -0,0 +1,66 @@
+"""
+Plan-only dry runs: resolve the whole edit without TTS, decoding or rendering.
+
+With YUNSHU_DRY_RUN=1 (or --dry-run on an engine's command line) engines
+plan from warm caches only:
+
+    voices     tts_cache: cached duration, else estimated from the text length
+    matching   cached OCR bundle / ASR timeline / scene index / crop path
+               (a missing cache is reported and the engine's fallback used)
+    output     render_timeline() writes <name>.plan.json instead of a video
+
+The plan lists, per section, the text, voice duration and where it came from,
+the source windows, match scores and keywords, plus the total duration; the
+full timeline is included so the plan can be rendered later as is.
+"""
+import os
+import sys
+import json
+
+DRY_RUN = os.environ.get("YUNSHU_DRY_RUN", "") not in ("", "0") or "--dry-run" in sys.argv
+
+def summarize(timeline):
+    """Per-section windows / voices / scores and the total duration of a planned timeline"""
+    sections = []
+    for i, (section, start) in enumerate(zip(timeline.sections, timeline.section_starts())):
+        meta = dict(section.meta)
+        entry = {
+            "index": i,
+            "text": meta.pop("text", None),
+            "start": round(start, 3),
+            "duration": round(section.duration, 3),
+            "windows": [{"source": ref.source, "start": round(ref.start, 3), "end": round(ref.end, 3),
+                         "effects": [e.name for e in ref.effects]} for ref in section.clips],
+        }
+        if section.voice is not None:
+            entry["voice"] = {"path": section.voice.path, "duration": section.voice.duration,
+                              "lead": section.audio_lead}
+        entry.update(meta) # score, keywords, match, duration_source, ...
+        sections.append(entry)
+
+    return {
+        "total_duration": round(timeline.duration, 3),
+        "sections": sections,
+        "estimated_voices": sum(1 for s in sections if s.get("duration_source") == "estimate"),
+    }
+
+def plan_path(output_path):
+    return os.path.splitext(output_path)[0] + ".plan.json"
+
+def write_plan(timeline, output_path):
+    """Save the dry-run plan next to where the video would go; returns its path"""
+    plan = summarize(timeline)
+    plan["output"] = output_path
+    plan["timeline"] = timeline.to_dict()
+    path = plan_path(output_path)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(plan, f, ensure_ascii=False, indent=2)
+
+    print(f"Dry run: {len(plan['sections'])} sections, {plan['total_duration']:.1f}s "
+          f"({plan['estimated_voices']} voice durations estimated) -> {path}")
+    for s in plan["sections"]:
+        windows = ", ".join(f"{w['start']:.1f}-{w['end']:.1f}s" for w in s["windows"])
+        score = f" score {s['score']}" if "score" in s else ""
+        print(f"  [{s['index'] + 1}] {s['duration']:.1f}s{score} | {windows} | {(s['text'] or '')[:20]}")
+    return path
@@ -2,6 +2,24 @@ import ffmpeg
 import json
 import os
 import sys
+import bisect
+import shutil
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from media_utils import find_ffmpeg, probe_media, av_length_mismatch
+from keyframe_index import get_keyframe_index
+
+# 剪辑模式: "smart" = 整 GOP 流复制 + 仅重编码切点处的残缺 GOP;
+#          "parallel" = 每个片段独立进程 (-ss 输入定位) 并行重编码; "reencode" = trim/concat 单进程全量重编码
+CLIP_MODE = "smart"
+# 并行提取的进程数上限 (每个 ffmpeg 进程再分到 cpu / workers 个线程)
+MAX_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+# 可流复制的编码 -> 用于切点重编码的匹配编码器
+SMART_ENCODERS = {"h264": "libx264", "hevc": "libx265"}
+# ffprobe 的 H.264 profile 名 -> x264 参数
+X264_PROFILES = {"Baseline": "baseline", "Constrained Baseline": "baseline", "Main": "main",
+                 "High": "high", "High 10": "high10", "High 4:2:2": "high422", "High 4:4:4 Predictive": "high444"}
 
 def parse_time(time_str):
     """将 HH:MM:SS 格式转换为秒"""
@@ -16,7 +34,214 @@ def parse_time(time_str):
     except ValueError:
         return 0
 
-def clip_video_ffmpeg(video_path, config_path, output_path):
+def load_ranges(clips_data):
+    """配置 -> [(start_sec, end_sec, text)]，跳过无效片段"""
+    ranges = []
+    for i, clip in enumerate(clips_data):
+        start_str = clip.get('start_time')
+        end_str = clip.get('end_time')
+        text = clip.get('text', f'片段_{i+1}')
+        
+        if not start_str or not end_str:
+            continue
+            
+        start_sec = parse_time(start_str)
+        end_sec = parse_time(end_str)
+        
+        if end_sec <= start_sec:
+            print(f"警告: 片段 {i+1} 结束时间小于开始时间，跳过。")
+            continue
+
+        print(f"准备剪辑片段 {i+1}: {text[:30]}... ({start_str} -> {end_str})")
+        ranges.append((start_sec, end_sec, text))
+    return ranges
+
+# --- 智能剪辑 (smart cut) ---
+
+def plan_smart_cut(start, end, keyframes, min_piece=0.02):
+    """
+    把 [start, end) 拆成若干段: [(kind, start, end)]，kind 为 "copy" 或 "encode"。
+    完整落在区间内的 GOP (关键帧 k1 .. k2) 直接流复制，两端残缺 GOP 重编码。
+    """
+    i = bisect.bisect_left(keyframes, start)
+    j = bisect.bisect_right(keyframes, end) - 1
+    if i >= len(keyframes) or j < 0 or keyframes[i] >= keyframes[j]:
+        # 区间内没有完整 GOP
+        return [("encode", start, end)]
+    k1, k2 = keyframes[i], keyframes[j]
+    pieces = []
+    if k1 - start > min_piece:
+        pieces.append(("encode", start, k1))
+    pieces.append(("copy", k1, k2))
+    if end - k2 > min_piece:
+        pieces.append(("encode", k2, end))
+    return pieces
+
+# 编码器私有参数名 (与 -level/-refs/-bf 一起写入, 让切点处的 SPS 与源一致)
+CODEC_PARAMS = {
+    "libx264": {"level": "level", "refs": "ref", "bf": "bframes", "fullrange": ("fullrange", "on", "off")},
+    "libx265": {"level": "level-idc", "refs": "ref", "bf": "bframes", "fullrange": ("range", "full", "limited")},
+}
+# 拼接后音视频时长差超过该值 (秒) 视为失败, 回退到重编码模式
+MAX_AV_DRIFT = 0.1
+
+def _level(video):
+    """ffprobe 的 level 整数 -> 编码器 level 字符串 (H.264: 41 -> 4.1, HEVC: 123 -> 4.1)"""
+    level = video.get("level")
+    if not level or int(level) <= 0:
+        return None
+    value = int(level) / 30.0 if video["codec_name"] == "hevc" else int(level) / 10.0
+    return f"{value:g}"
+
+def encode_params(info):
+    """
+    与源视频一致的视频编码参数: 编码器/profile/level/参考帧/B 帧/色彩描述/像素格式/帧率/码率。
+    重编码的切点 GOP 要与流复制的 GOP 共用一个 avcC, 所以序列参数尽量与源一致。
+    """
+    video = next(s for s in info["streams"] if s.get("codec_type") == "video")
+    encoder = SMART_ENCODERS.get(video["codec_name"], "libx264")
+    names = CODEC_PARAMS[encoder]
+    args = ["-c:v", encoder]
+    if video["codec_name"] == "h264" and video.get("profile") in X264_PROFILES:
+        args += ["-profile:v", X264_PROFILES[video["profile"]]]
+
+    params = {}
+    level = _level(video)
+    if level:
+        args += ["-level", level]
+        params[names["level"]] = level
+    if video.get("refs"):
+        args += ["-refs", str(video["refs"])]
+        params[names["refs"]] = str(video["refs"])
+    # has_b_frames 是重排序深度: 0 = 源无 B 帧
+    if video.get("has_b_frames") is not None:
+        args += ["-bf", str(video["has_b_frames"])]
+        params[names["bf"]] = str(video["has_b_frames"])
+    for key, name in (("color_primaries", "colorprim"), ("color_transfer", "transfer"), ("color_space", "colormatrix")):
+        if video.get(key) not in (None, "unknown", "reserved"):
+            params[name] = video[key]
+    if video.get("color_range") in ("pc", "tv"):
+        name, full, limited = names["fullrange"]
+        params[name] = full if video["color_range"] == "pc" else limited
+    args += ["-x264-params" if encoder == "libx264" else "-x265-params",
+             ":".join(f"{k}={v}" for k, v in params.items())] if params else []
+
+    args += ["-pix_fmt", video.get("pix_fmt", "yuv420p"), "-r", video.get("r_frame_rate", "30")]
+    bitrate = video.get("bit_rate") or info.get("format", {}).get("bit_rate")
+    if bitrate:
+        args += ["-b:v", str(bitrate)]
+    else:
+        args += ["-crf", "18"]
+    return args
+
+def write_piece(video_path, kind, start, end, out_path, enc_args, threads=0):
+    """视频分段 (整 GOP 流复制或重编码); 音频另由 write_audio 整段流复制"""
+    ffmpeg_bin = find_ffmpeg()
+    if threads:
+        enc_args = enc_args + ["-threads", str(threads)]
+    if kind == "copy":
+        # 关键帧上输入定位 (+1ms 防止浮点误差落到上一个关键帧)，整 GOP 流复制
+        cmd = [ffmpeg_bin, "-y", "-v", "error", "-ss", f"{start + 0.001:.3f}", "-i", video_path,
+               "-t", f"{end - start:.3f}", "-map", "0:v:0", "-c", "copy",
+               "-avoid_negative_ts", "make_zero", "-f", "mpegts", out_path]
+    else:
+        cmd = [ffmpeg_bin, "-y", "-v", "error", "-ss", f"{start:.3f}", "-i", video_path,
+               "-t", f"{end - start:.3f}", "-map", "0:v:0"] + enc_args + ["-f", "mpegts", out_path]
+    subprocess.run(cmd, check=True)
+
+def write_audio(video_path, start, end, out_path):
+    """一个配置片段的整段音频流复制: 不重编码, 不引入编码器 priming"""
+    cmd = [find_ffmpeg(), "-y", "-v", "error", "-ss", f"{start:.3f}", "-i", video_path,
+           "-t", f"{end - start:.3f}", "-map", "0:a:0", "-c", "copy",
+           "-avoid_negative_ts", "make_zero", "-f", "mpegts", out_path]
+    subprocess.run(cmd, check=True)
+
+def extract_pieces(video_path, jobs, enc_args, workdir, workers=None, audio_ranges=()):
+    """
+    每段一个 ffmpeg 进程 (-ss 在 -i 之前，快速输入定位)，在有界线程池上并行执行。
+    jobs: [(kind, start, end)] 视频分段; audio_ranges: [(start, end)] 音频整段。
+    返回按原顺序排列的 (视频分段文件, 音频分段文件)。
+    """
+    workers = max(1, min(workers or MAX_WORKERS, len(jobs)))
+    threads = max(1, (os.cpu_count() or 2) // workers)
+    paths = [os.path.join(workdir, f"piece_{i:04d}.ts") for i in range(len(jobs))]
+    audio_paths = [os.path.join(workdir, f"audio_{i:04d}.ts") for i in range(len(audio_ranges))]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(write_piece, video_path, kind, start, end, path, enc_args, threads)
+                   for (kind, start, end), path in zip(jobs, paths)]
+        futures += [pool.submit(write_audio, video_path, start, end, path)
+                    for (start, end), path in zip(audio_ranges, audio_paths)]
+        for f in futures:
+            f.result() # 抛出任一进程的错误
+    return paths, audio_paths
+
+def _concat_list(pieces, list_path):
+    with open(list_path, "w", encoding="utf-8") as f:
+        for piece in pieces:
+            f.write("file '" + piece.replace("'", "'\\''") + "'\n")
+    return list_path
+
+def concat_pieces(pieces, output_path, workdir, audio_pieces=(), audio_codec=None):
+    """concat demuxer 无损拼接 (全部流复制), 再检查音视频时长一致"""
+    cmd = [find_ffmpeg(), "-y", "-v", "error",
+           "-f", "concat", "-safe", "0", "-i", _concat_list(pieces, os.path.join(workdir, "concat.txt"))]
+    if audio_pieces:
+        cmd += ["-f", "concat", "-safe", "0", "-i", _concat_list(audio_pieces, os.path.join(workdir, "audio.txt")),
+                "-map", "0:v:0", "-map", "1:a:0"]
+    cmd += ["-c", "copy"]
+    if audio_codec == "aac":
+        cmd += ["-bsf:a", "aac_adtstoasc"]
+    subprocess.run(cmd + ["-movflags", "+faststart", output_path], check=True)
+
+    drift = av_length_mismatch(output_path)
+    if drift is not None and abs(drift) > MAX_AV_DRIFT:
+        raise ValueError(f"拼接后音视频时长相差 {drift:+.3f}s")
+
+def _audio_codec(info):
+    audio = next((s for s in info["streams"] if s.get("codec_type") == "audio"), None)
+    return audio["codec_name"] if audio else None
+
+def smart_cut(video_path, ranges, output_path, workers=None):
+    """流复制整 GOP，仅重编码切点处的残缺 GOP; 音频整段流复制; 最后用 concat demuxer 拼接"""
+    info = probe_media(video_path)
+    codec = next(s for s in info["streams"] if s.get("codec_type") == "video")["codec_name"]
+    if codec not in SMART_ENCODERS:
+        raise ValueError(f"编码 {codec} 不支持智能剪辑")
+    # 缓存的关键帧索引 (按源指纹, 只需解复用一次); 时间相对首帧, 与 -ss 一致
+    keyframes = get_keyframe_index(video_path).keyframes
+    enc_args = encode_params(info)
+    audio_codec = _audio_codec(info)
+
+    jobs = [piece for start, end, _ in ranges for piece in plan_smart_cut(start, end, keyframes)]
+    copied = sum(e - s for kind, s, e in jobs if kind == "copy")
+    encoded = sum(e - s for kind, s, e in jobs if kind == "encode")
+    print(f"智能剪辑: 流复制 {copied:.1f}s, 重编码 {encoded:.1f}s ({len(jobs)} 段)")
+
+    workdir = tempfile.mkdtemp(prefix="smartcut_", dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        audio_ranges = [(start, end) for start, end, _ in ranges] if audio_codec else []
+        pieces, audio_pieces = extract_pieces(video_path, jobs, enc_args, workdir, workers, audio_ranges)
+        concat_pieces(pieces, output_path, workdir, audio_pieces, audio_codec)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def parallel_cut(video_path, ranges, output_path, workers=None):
+    """每个配置片段独立进程、输入定位后重编码 (音频流复制)，并行执行后无损拼接"""
+    info = probe_media(video_path)
+    enc_args = encode_params(info)
+    audio_codec = _audio_codec(info)
+    jobs = [("encode", start, end) for start, end, _ in ranges]
+    print(f"并行提取: {len(jobs)} 段, {max(1, min(workers or MAX_WORKERS, len(jobs)))} 个进程")
+
+    workdir = tempfile.mkdtemp(prefix="segcut_", dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        audio_ranges = [(start, end) for start, end, _ in ranges] if audio_codec else []
+        pieces, audio_pieces = extract_pieces(video_path, jobs, enc_args, workdir, workers, audio_ranges)
+        concat_pieces(pieces, output_path, workdir, audio_pieces, audio_codec)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def clip_video_ffmpeg(video_path, config_path, output_path, mode=CLIP_MODE, workers=None):
     if not os.path.exists(video_path):
         print(f"错误: 找不到视频文件 {video_path}")
         return
@@ -31,6 +256,20 @@ def clip_video_ffmpeg(video_path, config_path, output_path):
         print(f"错误: 配置文件 {config_path} 格式不正确")
         return
 
+    ranges = load_ranges(clips_data)
+    if not ranges:
+        print("没有有效的剪辑片段。")
+        return
+
+    if mode in ("smart", "parallel"):
+        cut = smart_cut if mode == "smart" else parallel_cut
+        try:
+            cut(video_path, ranges, output_path, workers)
+            print(f"成功！视频已导出至: {output_path}")
+            return
+        except (subprocess.CalledProcessError, OSError, ValueError, StopIteration) as e:
+            print(f"{mode} 剪辑失败 ({e})，改用重编码模式...")
+
     # 探测视频信息，检查是否有音频流
     try:
         probe = ffmpeg.probe(video_path)
@@ -46,24 +285,7 @@ def clip_video_ffmpeg(video_path, config_path, output_path):
     print(f"正在处理视频: {video_path}")
     print(f"音频流检测: {'有' if has_audio else '无'}")
     
-    valid_clips = 0
-    for i, clip in enumerate(clips_data):
-        start_str = clip.get('start_time')
-        end_str = clip.get('end_time')
-        text = clip.get('text', f'片段_{i+1}')
-        
-        if not start_str or not end_str:
-            continue
-            
-        start_sec = parse_time(start_str)
-        end_sec = parse_time(end_str)
-        
-        if end_sec <= start_sec:
-            print(f"警告: 片段 {i+1} 结束时间小于开始时间，跳过。")
-            continue
-
-        print(f"准备剪辑片段 {i+1}: {text[:30]}... ({start_str} -> {end_str})")
-        
+    for start_sec, end_sec, _ in ranges:
         # 视频剪辑
         v = input_stream.video.trim(start=start_sec, end=end_sec).setpts('PTS-STARTPTS')
         streams.append(v)
@@ -72,14 +294,8 @@ def clip_video_ffmpeg(video_path, config_path, output_path):
         if has_audio:
             a = input_stream.audio.filter_('atrim', start=start_sec, end=end_sec).filter_('asetpts', 'PTS-STARTPTS')
             streams.append(a)
-        
-        valid_clips += 1
-
-    if valid_clips == 0:
-        print("没有有效的剪辑片段。")
-        return
 
-    print(f"开始合并 {valid_clips} 个片段...")
+    print(f"开始合并 {len(ranges)} 个片段...")
     
     try:
         # 合并流
@@ -116,5 +332,11 @@ if __name__ == "__main__":
         
     CONFIG_FILE = "clips.json"
     OUTPUT_FILE = "final_video.mp4"
+    # --reencode: 强制 trim/concat 全量重编码; --parallel: 每段独立进程并行重编码
+    mode = CLIP_MODE
+    if "--reencode" in sys.argv:
+        mode = "reencode"
+    elif "--parallel" in sys.argv:
+        mode = "parallel"
     
-    clip_video_ffmpeg(VIDEO_FILE, CONFIG_FILE, OUTPUT_FILE)
+    clip_video_ffmpeg(VIDEO_FILE, CONFIG_FILE, OUTPUT_FILE, mode=mode)
@@ -0,0 +1,120 @@
+"""
+Process-wide font registry.
+
+- Discovers a CJK-capable font once (env override, known Windows/Linux/macOS
+  paths, then fontconfig) and caches the resolved path on disk per host.
+- Keeps loaded FreeTypeFont objects in memory keyed by (path, size).
+- Memoizes rasterized text blocks.
+
+After the first lookup, text rendering never touches the filesystem.
+Set YUNSHU_FONT=/path/to/font.ttc to force a specific font.
+"""
+import os
+import sys
+import platform
+import subprocess
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from media_utils import CACHE_DIR, load_json, save_json
+
+FONT_CACHE_FILE = os.path.join(CACHE_DIR, "fonts.json")
+
+CJK_CANDIDATES = [
+    # Windows
+    "C:\\Windows\\Fonts\\msyh.ttc",   # Microsoft YaHei
+    "C:\\Windows\\Fonts\\msyhbd.ttc",
+    "C:\\Windows\\Fonts\\simhei.ttf",
+    "C:\\Windows\\Fonts\\simsun.ttc",
+    # Linux (render nodes)
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/google-noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",
+    "/usr/share/fonts/wqy-microhei/wqy-microhei.ttc",
+    "/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf",
+    # macOS
+    "/System/Library/Fonts/PingFang.ttc",
+    "/System/Library/Fonts/STHeiti Medium.ttc",
+    "/Library/Fonts/Arial Unicode.ttf",
+]
+
+_resolved = {}
+
+def _fontconfig_cjk():
+    """Ask fontconfig for any font covering Chinese"""
+    try:
+        out = subprocess.run(["fc-list", ":lang=zh", "file"], capture_output=True, text=True, timeout=10).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    paths = sorted(line.split(":")[0].strip() for line in out.splitlines() if line.strip())
+    # Prefer Sans/Hei faces for subtitles
+    paths.sort(key=lambda p: 0 if ("Sans" in p or "Hei" in p or "hei" in p) else 1)
+    return paths[0] if paths else None
+
+def _discover_cjk():
+    env = os.environ.get("YUNSHU_FONT")
+    if env and os.path.exists(env):
+        return env
+    for path in CJK_CANDIDATES:
+        if os.path.exists(path):
+            return path
+    return _fontconfig_cjk()
+
+def resolve_font_path(kind="cjk"):
+    """
+    Path of the font to use (None if nothing usable exists -> PIL default font).
+    Resolved once per process; the result is cached on disk per host.
+    """
+    if kind in _resolved:
+        return _resolved[kind]
+
+    host = platform.node() or sys.platform
+    cache = load_json(FONT_CACHE_FILE) or {}
+    entry = cache.get(host, {}).get(kind)
+    if entry and os.path.exists(entry) and not os.environ.get("YUNSHU_FONT"):
+        path = entry
+    else:
+        path = _discover_cjk()
+        cache.setdefault(host, {})[kind] = path
+        save_json(FONT_CACHE_FILE, cache)
+        print(f"Font registry: {kind} -> {path or 'PIL default'}")
+
+    _resolved[kind] = path
+    return path
+
+@lru_cache(maxsize=64)
+def _load_font(path, size):
+    if path:
+        try:
+            return ImageFont.truetype(path, size)
+        except OSError:
+            pass
+    return ImageFont.load_default()
+
+def get_font(size, path=None):
+    """Loaded FreeTypeFont for (path, size); path defaults to the registry's CJK font"""
+    return _load_font(path or resolve_font_path(), int(size))
+
+@lru_cache(maxsize=256)
+def render_text_block(text, size, fill="white", bg_color=None, padding=20, stroke_width=0, stroke_fill=None):
+    """
+    Rasterize `text` into a padded RGBA block (memoized).
+    The returned array is read-only; copy it before drawing on it.
+    """
+    font = get_font(size)
+    left, top, right, bottom = font.getbbox(text, stroke_width=stroke_width)
+    text_w, text_h = right - left, bottom - top
+    w, h = text_w + 2 * padding, text_h + 2 * padding
+
+    img = Image.new('RGBA', (w, h), bg_color if bg_color else (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    draw.text(((w - text_w) / 2 - left, (h - text_h) / 2 - top), text, font=font, fill=fill,
+              stroke_width=stroke_width, stroke_fill=stroke_fill)
+
+    block = np.array(img)
+    block.setflags(write=False)
+    return block
@@ -0,0 +1,357 @@
+"""
+Shared OpenCV frame effects with a fused per-frame pass.
+
+Every effect used to be its own fl/fl_image stage: a NumPy -> PIL -> NumPy
+round trip, fresh frame allocations, and an ensure_uint8 full-frame max()
+per stage. Here an effect is a kernel that writes into a caller-provided
+uint8 buffer, and FusedChain runs all of a clip's effects (or all of a
+section's overlays) as ONE callable:
+
+    frame -> ensure_uint8 once -> kernel 1 -> buf 1 -> kernel 2 -> buf 2 ...
+             overlays blend in place into the previous stage's buffer
+
+Buffers, resize maps and blur kernels are allocated once per input size.
+
+    KERNELS            effect name (timeline.Effect) -> kernel factory
+    build_chain        [Effect, ...] -> FusedChain
+    overlay_windows    timeline overlays -> [(OverlayPatch, t0, t1)] (shared with render_ffmpeg)
+
+Run `python frame_effects.py` for a per-effect before/after benchmark.
+"""
+import time
+
+import cv2
+import numpy as np
+
+# --- dtype fast paths ---
+
+def ensure_uint8(img, out=None):
+    """
+    uint8 frame. uint8 input is returned untouched (no scan); float/int frames
+    in 0..1 are scaled by 255, anything else is clipped to 0..255. A strided
+    sample settles the common 0..255 case without a full-frame max().
+    """
+    if img.dtype == np.uint8:
+        return img
+    if img.dtype == np.bool_:
+        return np.multiply(img, 255, out=out, dtype=np.uint8, casting="unsafe")
+    if float(img[::16, ::16].max()) <= 1.0 and float(img.max()) <= 1.0:
+        img = np.clip(img, 0, 1) * 255
+    else:
+        img = np.clip(img, 0, 255)
+    if out is None:
+        return img.astype(np.uint8)
+    np.copyto(out, img, casting="unsafe")
+    return out
+
+# --- Kernels ---
+
+class FrameKernel:
+    """One effect stage: apply(src, t, dst) writes the output frame into dst and returns it"""
+    in_place = False # True: modifies dst == src (overlays), no resize
+
+    def out_size(self, size):
+        return size
+
+    def apply(self, src, t, dst):
+        raise NotImplementedError
+
+class Zoom(FrameKernel):
+    """Center crop by `ratio`, resized back to the input size (viral zoom, jump-cut punch-in)"""
+
+    def __init__(self, ratio=1.3, interpolation=cv2.INTER_LINEAR):
+        self.ratio = ratio
+        self.interpolation = interpolation
+
+    def apply(self, src, t, dst):
+        h, w = src.shape[:2]
+        crop_w, crop_h = int(w / self.ratio), int(h / self.ratio)
+        x, y = (w - crop_w) // 2, (h - crop_h) // 2
+        return cv2.resize(src[y:y + crop_h, x:x + crop_w], (w, h), dst=dst, interpolation=self.interpolation)
+
+class BlurredBackdrop:
+    """
+    `box` of the input, cover-scaled to out_size and Gaussian-blurred, computed
+    at 1/downscale resolution and upsampled with precomputed remap tables
+    (same scheme as reframe.VerticalReframer).
+    """
+
+    def __init__(self, box, out_size, sigma, downscale=4):
+        out_w, out_h = out_size
+        self.box = box
+        self.small_size = (max(1, out_w // downscale), max(1, out_h // downscale))
+        self.small = np.empty((self.small_size[1], self.small_size[0], 3), dtype=np.uint8)
+        self.small_blur = np.empty_like(self.small)
+        s = sigma / downscale
+        self.kernel = cv2.getGaussianKernel(int(2 * round(3 * s) + 1), s)
+        sw, sh = self.small_size
+        xs = (np.arange(out_w, dtype=np.float32) + 0.5) * (sw / out_w) - 0.5
+        ys = (np.arange(out_h, dtype=np.float32) + 0.5) * (sh / out_h) - 0.5
+        map_x, map_y = np.meshgrid(xs, ys)
+        self.map1, self.map2 = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+
+    def render(self, frame, dst):
+        x0, y0, x1, y1 = self.box
+        cv2.resize(frame[y0:y1, x0:x1], self.small_size, dst=self.small, interpolation=cv2.INTER_AREA)
+        cv2.sepFilter2D(self.small, -1, self.kernel, self.kernel, dst=self.small_blur, borderType=cv2.BORDER_REFLECT)
+        cv2.remap(self.small_blur, self.map1, self.map2, cv2.INTER_LINEAR, dst=dst, borderMode=cv2.BORDER_REPLICATE)
+        return dst
+
+_backdrops = {}
+
+class SafeVisual(FrameKernel):
+    """Zoomed, blurred copy of the frame behind a scaled-down foreground (commentary 'safe mode')"""
+
+    def __init__(self, bg_zoom=1.2, blur_radius=15, fg_scale=0.85):
+        self.bg_zoom = bg_zoom
+        self.blur_radius = blur_radius
+        self.fg_scale = fg_scale
+
+    def _backdrop(self, w, h):
+        key = (w, h, self.bg_zoom, self.blur_radius)
+        if key not in _backdrops:
+            # Upscale by bg_zoom + center crop == the central 1/bg_zoom of the frame
+            mx, my = int(w * (1 - 1 / self.bg_zoom) / 2), int(h * (1 - 1 / self.bg_zoom) / 2)
+            _backdrops[key] = BlurredBackdrop((mx, my, w - mx, h - my), (w, h), self.blur_radius)
+        return _backdrops[key]
+
+    def apply(self, src, t, dst):
+        h, w = src.shape[:2]
+        self._backdrop(w, h).render(src, dst)
+        fg_w, fg_h = int(w * self.fg_scale), int(h * self.fg_scale)
+        x, y = (w - fg_w) // 2, (h - fg_h) // 2
+        cv2.resize(src, (fg_w, fg_h), dst=dst[y:y + fg_h, x:x + fg_w], interpolation=cv2.INTER_AREA)
+        return dst
+
+class Vertical(FrameKernel):
+    """Blurred-background 9:16 (reframe.VerticalReframer), written straight into the chain buffer"""
+
+    def __init__(self, out_w=720, out_h=1280):
+        self.size = (out_w, out_h)
+
+    def out_size(self, size):
+        return self.size
+
+    def apply(self, src, t, dst):
+        from reframe import get_reframer
+        h, w = src.shape[:2]
+        return get_reframer((w, h), self.size).apply(src, dst)
+
+class SmartCrop(FrameKernel):
+    """Subject-tracking full-height 9:16 crop along a baked [[t, cx], ...] path (smart_crop)"""
+
+    def __init__(self, path, out_w=720, out_h=1280):
+        self.path = path
+        self.size = (out_w, out_h)
+
+    def out_size(self, size):
+        return self.size
+
+    def apply(self, src, t, dst):
+        from smart_crop import smart_crop_frame, interp_path
+        return smart_crop_frame(src, interp_path(self.path, t), self.size, dst)
+
+class PatchTrack(FrameKernel):
+    """Pre-rasterized overlay patches blended in place during their [t0, t1) windows"""
+    in_place = True
+
+    def __init__(self, windows):
+        self.windows = windows
+
+    def apply(self, src, t, dst):
+        for patch, t0, t1 in self.windows:
+            if t0 <= t < t1:
+                patch.apply(dst)
+        return dst
+
+KERNELS = {
+    "vertical_9_16": Vertical,               # Blurred-background vertical (short drama)
+    "smart_crop_9_16": SmartCrop,            # Subject-tracking full-height crop (smart_crop)
+    "zoom": Zoom,                            # Center zoom by ratio (viral)
+    "zoom_jump": lambda: Zoom(1 / 0.85),     # Jump-cut punch-in (short drama)
+    "safe_visual": SafeVisual,               # Blurred frame + scaled foreground (commentary)
+}
+
+# --- Fused chains ---
+
+class FusedChain:
+    """
+    Consecutive kernels run as one per-frame callable. Every resizing stage
+    writes into its own buffer, allocated once per input size; in-place stages
+    reuse the previous buffer. The returned frame is reused by the next call.
+    """
+
+    def __init__(self, kernels):
+        self.kernels = list(kernels)
+        self._plans = {}
+
+    def out_size(self, size):
+        for kernel in self.kernels:
+            size = kernel.out_size(size)
+        return tuple(size)
+
+    def _plan(self, size):
+        if size not in self._plans:
+            stages = []
+            cur = size
+            for i, kernel in enumerate(self.kernels):
+                cur = kernel.out_size(cur)
+                # In-place stages only need a buffer when they would otherwise write into the input
+                buf = None if kernel.in_place and i > 0 else np.empty((cur[1], cur[0], 3), dtype=np.uint8)
+                stages.append((kernel, buf))
+            self._plans[size] = stages
+        return self._plans[size]
+
+    def __call__(self, frame, t=0.0):
+        frame = ensure_uint8(frame)
+        if frame.shape[2] > 3:
+            frame = frame[:, :, :3]
+        h, w = frame.shape[:2]
+        cur = frame
+        for kernel, buf in self._plan((w, h)):
+            if kernel.in_place:
+                if buf is not None:
+                    np.copyto(buf, cur)
+                    cur = buf
+                kernel.apply(cur, t, cur)
+            else:
+                cur = kernel.apply(cur, t, buf)
+        return cur
+
+def build_chain(effects):
+    """FusedChain for a clip's timeline effects (None when there is nothing to apply)"""
+    kernels = []
+    for effect in effects:
+        if effect.name not in KERNELS:
+            print(f"Warning: unknown effect '{effect.name}', skipped")
+            continue
+        kernels.append(KERNELS[effect.name](**effect.params))
+    return FusedChain(kernels) if kernels else None
+
+# --- Overlays: rasterized once to patches ---
+
+def overlay_patches(overlay, frame_size):
+    """[(OverlayPatch, start, end)] relative to the overlay, end None = open"""
+    style = overlay.style
+    if overlay.kind == "subtitle":
+        from subtitle_renderer import get_subtitle_overlay
+        return [(get_subtitle_overlay(overlay.text, tuple(style.get("highlight_keywords", ())),
+                                      style.get("font_size", 40), frame_size), 0.0, None)]
+    if overlay.kind == "caption":
+        from subtitle_renderer import get_caption_overlay
+        return [(get_caption_overlay(overlay.text, frame_size, style.get("font_size", 50)), 0.0, None)]
+    if overlay.kind == "boxed":
+        from subtitle_renderer import get_boxed_caption_overlay
+        return [(get_boxed_caption_overlay(overlay.text, frame_size, style.get("font_size", 30)), 0.0, None)]
+    if overlay.kind == "karaoke":
+        from karaoke_captions import KaraokeCaption
+        style = dict(style)
+        caption = KaraokeCaption(overlay.text, style.pop("words", []), frame_size, **style)
+        patches = [(caption.base, 0.0, None)]
+        starts, ends = caption.word_starts, caption.word_ends
+        for i, word in enumerate(caption.word_patches):
+            # Same hold rule as KaraokeCaption.active_word
+            end = max(ends[i], starts[i + 1]) if i + 1 < len(starts) else ends[i]
+            patches.extend((p, starts[i], end) for p in word)
+        return patches
+    return None
+
+def overlay_windows(overlays, frame_size, duration):
+    """[(OverlayPatch, t0, t1)] in section time for all of a section's overlays"""
+    windows = []
+    for overlay in overlays:
+        patches = overlay_patches(overlay, tuple(frame_size))
+        if patches is None:
+            print(f"Warning: unknown overlay '{overlay.kind}', skipped")
+            continue
+        base = overlay.start or 0.0
+        end = duration if overlay.end is None else overlay.end
+        for patch, p_start, p_end in patches:
+            windows.append((patch, base + p_start, end if p_end is None else min(end, base + p_end)))
+    return windows
+
+# --- Reference implementations (previous per-stage paths), kept for benchmarking ---
+
+def ensure_uint8_full_scan(img):
+    if img.dtype != np.uint8:
+        if img.max() <= 1.0:
+            img = (np.clip(img, 0, 1) * 255).astype(np.uint8)
+        else:
+            img = np.clip(img, 0, 255).astype(np.uint8)
+    return img
+
+def zoom_reference(img, ratio=1.3):
+    img = ensure_uint8_full_scan(img)
+    h, w = img.shape[:2]
+    new_w, new_h = int(w / ratio), int(h / ratio)
+    x1, y1 = (w - new_w) // 2, (h - new_h) // 2
+    return cv2.resize(img[y1:y1 + new_h, x1:x1 + new_w], (w, h))
+
+def zoom_jump_reference(img):
+    from PIL import Image
+    img = ensure_uint8_full_scan(img)
+    h, w = img.shape[:2]
+    new_w, new_h = int(w * 0.85), int(h * 0.85)
+    left, top = (w - new_w) // 2, (h - new_h) // 2
+    pil_img = Image.fromarray(img).crop((left, top, left + new_w, top + new_h))
+    return np.array(pil_img.resize((w, h), Image.Resampling.LANCZOS))
+
+def safe_visual_reference(img):
+    from PIL import Image, ImageFilter
+    img = ensure_uint8_full_scan(img)
+    h, w = img.shape[:2]
+    pil_img = Image.fromarray(img)
+    bg = pil_img.resize((int(w * 1.2), int(h * 1.2)), Image.Resampling.LANCZOS)
+    bg = bg.crop((int(w * 0.1), int(h * 0.1), int(w * 1.1), int(h * 1.1)))
+    bg = bg.filter(ImageFilter.GaussianBlur(radius=15))
+    fg_w, fg_h = int(w * 0.85), int(h * 0.85)
+    bg.paste(pil_img.resize((fg_w, fg_h), Image.Resampling.LANCZOS), ((w - fg_w) // 2, (h - fg_h) // 2))
+    return np.array(bg)
+
+def benchmark(frames=30, size=(1280, 720)):
+    from reframe import reframe_vertical_pil
+    from subtitle_renderer import get_subtitle_overlay
+
+    def fps_of(fn, frame, n=frames):
+        fn(frame) # Warm-up: tables / buffers
+        t0 = time.perf_counter()
+        for _ in range(n):
+            fn(frame)
+        return n / (time.perf_counter() - t0)
+
+    w, h = size
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 255, (h // 16, w // 16, 3), dtype=np.uint8)
+    frame = cv2.resize(base, (w, h), interpolation=cv2.INTER_CUBIC)
+    frame_f = frame.astype(np.float64) # MoviePy composites hand out float frames
+
+    print(f"Per-effect benchmark at {w}x{h} ({frames} frames, fps):")
+    before, after = fps_of(ensure_uint8_full_scan, frame_f), fps_of(ensure_uint8, frame_f)
+    print(f"  ensure_uint8 (float) {before:8.1f} -> {after:8.1f}  ({after / before:.1f}x)")
+
+    cases = [
+        ("zoom", zoom_reference, {}),
+        ("zoom_jump", zoom_jump_reference, {}),
+        ("safe_visual", safe_visual_reference, {}),
+        ("vertical_9_16", reframe_vertical_pil, {}),
+    ]
+    for name, reference, params in cases:
+        chain = FusedChain([KERNELS[name](**params)])
+        before, after = fps_of(reference, frame), fps_of(chain, frame)
+        diff = np.abs(reference(frame).astype(np.int16) - chain(frame).astype(np.int16)).mean()
+        print(f"  {name:<20} {before:8.1f} -> {after:8.1f}  ({after / before:.1f}x), mean abs diff {diff:.2f}")
+
+    # A whole commentary clip: safe visual + zoom + subtitle, separate stages vs one fused pass
+    patch = get_subtitle_overlay("Fused effect chain benchmark", (), 40, (w, h))
+
+    def separate(img):
+        img = safe_visual_reference(img)
+        img = zoom_reference(img, 1.1)
+        return patch.apply(img)
+
+    fused = FusedChain([SafeVisual(), Zoom(1.1), PatchTrack([(patch, 0.0, float("inf"))])])
+    before, after = fps_of(separate, frame), fps_of(fused, frame)
+    print(f"  {'chain (3 stages)':<20} {before:8.1f} -> {after:8.1f}  ({after / before:.1f}x)")
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,233 @@
+"""
+Persistent low-resolution frame store per source (memory-mapped NumPy).
+
+Scene scoring, sharpness, motion and subject cues only ever look at small
+frames, yet every new analyzer (or changed config) used to decode the source
+again. The store keeps sampled, downscaled frames on disk instead:
+
+    ../data/cache/frames/<fingerprint>_default.json          manifest
+    ../data/cache/frames/<fingerprint>_<track>.{times,gray,rgb}.npy
+
+Each (sample rate, planes) pair is a "track": GRAY_WIDTH px grayscale and/or
+RGB_WIDTH px RGB frames and their source times. Planes are stored only at the
+rate their analyzers need: scene change scoring (RGB, every 0.1s) would
+otherwise drag ~1 MB/s of grayscale along. Tracks are written once, during a
+normal analysis decode (TrackWriter is fed like any analyzer, growing its
+files when the source runs longer than estimated), and new tracks are
+appended; existing ones are never rewritten.
+
+Reads are zero-copy: arrays are opened with mmap_mode="r" and gray_at(t) /
+rgb_at(t) return views into the page cache, so reruns and new low-res
+analyzers (analysis_pipeline, FrameAnalyzer.lowres) never decode the source.
+"""
+import bisect
+import os
+
+import cv2
+import numpy as np
+
+from media_utils import source_fingerprint, cache_path, load_json, save_json
+
+GRAY_WIDTH = 320 # Scene detection / subject proxy width
+RGB_WIDTH = 160  # Scene change (HSV) width
+THUMB_SIZE = (200, 150)
+
+def _scaled(shape, width):
+    h, w = shape[:2]
+    return width, max(1, int(round(h * width / w)))
+
+PLANES = ("gray", "rgb")
+
+def _track_key(interval, planes=PLANES):
+    return f"{interval:g}" if tuple(planes) == PLANES else f"{interval:g}:{'+'.join(planes)}"
+
+class StoredFrame:
+    """
+    FrameContext stand-in backed by store views. There is no full-resolution
+    frame: only analyzers with lowres = True are fed from the store, and only
+    the planes of their track are set.
+    """
+
+    def __init__(self, gray, rgb):
+        self.gray = gray # GRAY_WIDTH px
+        self.rgb = rgb   # RGB_WIDTH px
+        self._thumb = None
+        self._small_hsv = None
+
+    @property
+    def thumb(self):
+        if self._thumb is None:
+            self._thumb = cv2.resize(self.gray, THUMB_SIZE, interpolation=cv2.INTER_AREA)
+        return self._thumb
+
+    @property
+    def small_hsv(self):
+        if self._small_hsv is None:
+            self._small_hsv = cv2.cvtColor(self.rgb, cv2.COLOR_RGB2HSV)
+        return self._small_hsv
+
+class Track:
+    """One sample rate of a source (some or all planes), memory-mapped read-only"""
+
+    def __init__(self, entry):
+        self.interval = entry["interval"]
+        self.count = entry["count"]
+        self.planes = tuple(entry.get("planes", PLANES))
+        self.times = np.load(entry["times"], mmap_mode="r")[:self.count]
+        self.gray = np.load(entry["gray"], mmap_mode="r")[:self.count] if "gray" in self.planes else None
+        self.rgb = np.load(entry["rgb"], mmap_mode="r")[:self.count] if "rgb" in self.planes else None
+        self._times = self.times.tolist() # bisect on a list beats numpy scalar access
+
+    def index(self, t):
+        """Sample at or before source time t"""
+        return min(self.count - 1, max(0, bisect.bisect_right(self._times, t + 1e-4) - 1))
+
+    def gray_at(self, t):
+        return self.gray[self.index(t)]
+
+    def rgb_at(self, t):
+        return self.rgb[self.index(t)]
+
+    def frames(self):
+        """(t, StoredFrame) for every sample, in order"""
+        for i, t in enumerate(self._times):
+            yield t, StoredFrame(self.gray[i] if self.gray is not None else None,
+                                 self.rgb[i] if self.rgb is not None else None)
+
+class TrackWriter:
+    """
+    Appends one sample-rate track while another pass decodes the source: it has
+    an analyzer's interface (interval / purpose / process(t, ctx)), so
+    run_analyzers feeds it from the same decode.
+    """
+    name = "frame_store"
+    purpose = "analysis"
+    lowres = False
+
+    def __init__(self, store, interval, capacity, planes=PLANES):
+        self.store = store
+        self.interval = interval
+        self.capacity = max(1, capacity)
+        self.planes = tuple(planes)
+        self.kinds = ("times",) + self.planes
+        self.count = 0
+        self.paths = {kind: store.array_path(interval, kind, self.planes) for kind in self.kinds}
+        self.parts = {kind: path + ".part" for kind, path in self.paths.items()}
+        self.generation = 0
+        self.times = self.gray = self.rgb = None
+
+    def _shapes(self, frame):
+        gw, gh = _scaled(frame.shape, GRAY_WIDTH)
+        rw, rh = _scaled(frame.shape, RGB_WIDTH)
+        return {"times": (np.float64, ()), "gray": (np.uint8, (gh, gw)), "rgb": (np.uint8, (rh, rw, 3))}
+
+    def _allocate(self, frame):
+        open_mm = np.lib.format.open_memmap
+        for kind, (dtype, shape) in self._shapes(frame).items():
+            if kind in self.kinds:
+                setattr(self, kind, open_mm(self.parts[kind], mode="w+", dtype=dtype, shape=(self.capacity,) + shape))
+
+    def _grow(self):
+        """The source ran past the estimated capacity: copy into files twice the size"""
+        open_mm = np.lib.format.open_memmap
+        self.capacity *= 2
+        self.generation += 1
+        for kind in self.kinds:
+            old, old_part = getattr(self, kind), self.parts[kind]
+            part = f"{self.paths[kind]}.part{self.generation}"
+            grown = open_mm(part, mode="w+", dtype=old.dtype, shape=(self.capacity,) + old.shape[1:])
+            grown[:self.count] = old[:self.count]
+            setattr(self, kind, grown)
+            del old # Unmap before removing the smaller file
+            try:
+                os.remove(old_part)
+            except OSError:
+                pass
+            self.parts[kind] = part
+
+    def process(self, t, ctx):
+        if self.times is None:
+            self._allocate(ctx.frame)
+        elif self.count >= self.capacity:
+            self._grow()
+        i = self.count
+        # Resize straight into the mapped rows
+        if self.gray is not None:
+            gh, gw = self.gray.shape[1:]
+            cv2.resize(ctx.gray, (gw, gh), dst=self.gray[i], interpolation=cv2.INTER_AREA)
+        if self.rgb is not None:
+            rh, rw = self.rgb.shape[1:3]
+            small = cv2.resize(ctx.frame, (rw, rh), interpolation=cv2.INTER_AREA)
+            cv2.cvtColor(small, cv2.COLOR_BGR2RGB, dst=self.rgb[i])
+        self.times[i] = t
+        self.count += 1
+
+    def close(self):
+        """Flush, publish the files and register the track in the manifest"""
+        if self.times is None:
+            return None
+        for kind in self.kinds:
+            getattr(self, kind).flush()
+            setattr(self, kind, None) # Drop the writable maps before the rename
+            os.replace(self.parts[kind], self.paths[kind])
+        return self.store.add_track(self.interval, self.count, self.paths, self.planes)
+
+class FrameStore:
+    """All stored tracks of one source"""
+
+    def __init__(self, video_path):
+        self.video_path = video_path
+        self.fingerprint = source_fingerprint(video_path)
+        self.manifest_path = cache_path("frames", self.fingerprint)
+        self.manifest = load_json(self.manifest_path) or {"gray_width": GRAY_WIDTH, "rgb_width": RGB_WIDTH, "tracks": {}}
+        self._tracks = {}
+
+    def array_path(self, interval, kind, planes=PLANES):
+        params = {"interval": interval, "gray_width": GRAY_WIDTH, "rgb_width": RGB_WIDTH}
+        if tuple(planes) != PLANES:
+            params["planes"] = list(planes)
+        return cache_path("frames", self.fingerprint, params, ext=f".{kind}.npy")
+
+    def _usable(self, entry):
+        return all(os.path.exists(entry[k]) for k in ("times",) + tuple(entry.get("planes", PLANES)))
+
+    def track(self, interval, planes=PLANES):
+        """
+        Coarsest stored track that samples at least every `interval` seconds
+        and has all `planes`, or None. A finer track serves any slower analyzer.
+        """
+        fits = [e for e in self.manifest["tracks"].values()
+                if e["interval"] <= interval + 1e-9 and e["count"] > 0 and self._usable(e)
+                and set(planes) <= set(e.get("planes", PLANES))]
+        if not fits:
+            return None
+        entry = max(fits, key=lambda e: (e["interval"], -len(e.get("planes", PLANES))))
+        key = _track_key(entry["interval"], entry.get("planes", PLANES))
+        if key not in self._tracks:
+            self._tracks[key] = Track(entry)
+        return self._tracks[key]
+
+    def writer(self, interval, duration, planes=PLANES):
+        """TrackWriter for a new track (initial capacity from the source duration)"""
+        return TrackWriter(self, interval, int(duration / interval) + 2, planes)
+
+    def add_track(self, interval, count, paths, planes=PLANES):
+        self.manifest["tracks"][_track_key(interval, planes)] = {"interval": interval, "count": count,
+                                                                 "planes": list(planes), **paths}
+        save_json(self.manifest_path, self.manifest)
+        print(f"Frame store: {os.path.basename(self.video_path)} +{count} samples @ {interval:g}s "
+              f"({'+'.join(planes)})")
+        return self.track(interval, planes)
+
+    def describe(self):
+        return {k: {"interval": e["interval"], "count": e["count"], "planes": e.get("planes", list(PLANES))}
+                for k, e in self.manifest["tracks"].items()}
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) < 2:
+        print("Usage: python frame_store.py <video_path>")
+    else:
+        store = FrameStore(sys.argv[1])
+        for key, info in store.describe().items():
+            print(f"  track {key}: {info['count']} samples ({'+'.join(info['planes'])})")
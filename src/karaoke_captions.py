@@ -0,0 +1,195 @@
+"""
+Word-by-word highlighted ("karaoke") captions driven by TTS word boundaries.
+
+1. synthesize_with_timings() streams edge_tts and keeps the WordBoundary
+   events (normally discarded by Communicate.save) next to the mp3.
+2. A GlyphAtlas per (font, size, stroke) rasterizes each character once.
+3. KaraokeCaption lays a line out by blitting cached glyph masks with NumPy,
+   pre-builds the base caption patch plus one highlight patch per word, and
+   per frame blends the base patch and the active word's patch - so animated
+   highlighting costs about the same as a static subtitle.
+"""
+import os
+import json
+import bisect
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageColor
+
+from subtitle_renderer import OverlayPatch, load_font, ensure_uint8
+
+# --- TTS with word timings ---
+
+async def synthesize_with_timings(text, output_path, voice, rate="+0%", pitch=None):
+    """
+    Stream TTS audio to `output_path` and record word timings (seconds).
+    Timings are also saved as <output_path>.words.json.
+    """
+    import edge_tts
+    kwargs = {"rate": rate}
+    if pitch:
+        kwargs["pitch"] = pitch
+    try:
+        # edge-tts >= 7 emits sentence boundaries unless asked for words
+        communicate = edge_tts.Communicate(text, voice, boundary="WordBoundary", **kwargs)
+    except TypeError:
+        communicate = edge_tts.Communicate(text, voice, **kwargs)
+
+    words = []
+    with open(output_path, "wb") as f:
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                f.write(chunk["data"])
+            elif chunk["type"] == "WordBoundary":
+                # offset/duration are in 100ns ticks
+                start = chunk["offset"] / 1e7
+                words.append({"start": round(start, 3),
+                              "end": round(start + chunk["duration"] / 1e7, 3),
+                              "text": chunk["text"]})
+
+    with open(output_path + ".words.json", "w", encoding="utf-8") as f:
+        json.dump(words, f, ensure_ascii=False)
+    return output_path, words
+
+def load_word_timings(audio_path):
+    path = audio_path + ".words.json"
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+# --- Glyph atlas ---
+
+class GlyphAtlas:
+    """Per-character fill/stroke masks for one font, size and stroke width"""
+
+    def __init__(self, font_size, stroke_width=3):
+        self.font = load_font(font_size)
+        self.stroke_width = stroke_width
+        ascent, descent = self.font.getmetrics() if hasattr(self.font, "getmetrics") else (font_size, 0)
+        self.line_height = ascent + descent + 2 * stroke_width
+        self.glyphs = {}
+
+    def glyph(self, ch):
+        """(fill_mask, stroke_mask, advance) for one character, rasterized once"""
+        if ch not in self.glyphs:
+            advance = int(round(self.font.getlength(ch))) if hasattr(self.font, "getlength") else self.font.getsize(ch)[0]
+            w = advance + 2 * self.stroke_width + 2
+            fill = Image.new("L", (w, self.line_height), 0)
+            stroke = Image.new("L", (w, self.line_height), 0)
+            origin = (self.stroke_width, self.stroke_width)
+            ImageDraw.Draw(fill).text(origin, ch, font=self.font, fill=255)
+            ImageDraw.Draw(stroke).text(origin, ch, font=self.font, fill=255,
+                                        stroke_width=self.stroke_width, stroke_fill=255)
+            self.glyphs[ch] = (np.array(fill), np.array(stroke), advance)
+        return self.glyphs[ch]
+
+@lru_cache(maxsize=16)
+def get_atlas(font_size, stroke_width=3):
+    return GlyphAtlas(font_size, stroke_width)
+
+# --- Caption ---
+
+def _word_spans(text, words):
+    """Map TTS words to [start, end) character spans of `text` (in order)"""
+    spans = []
+    cursor = 0
+    for w in words:
+        idx = text.find(w["text"], cursor)
+        if idx == -1:
+            continue
+        spans.append((idx, idx + len(w["text"]), w["start"], w["end"]))
+        cursor = idx + len(w["text"])
+    return spans
+
+class KaraokeCaption:
+    def __init__(self, text, words, frame_size, font_size=None, y_ratio=0.75, max_width_ratio=0.9,
+                 base_color="white", highlight_color="#FFD700", stroke_color="black", stroke_width=3):
+        W, H = frame_size
+        font_size = font_size or max(24, H // 18)
+        atlas = get_atlas(font_size, stroke_width)
+        max_width = int(W * max_width_ratio)
+
+        # 1. Layout: greedy wrap on advances, per-character positions
+        positions = [] # (x, y) within the caption block
+        lines_w = []
+        x = y = 0
+        for ch in text:
+            _, _, adv = atlas.glyph(ch)
+            if x and x + adv > max_width:
+                lines_w.append(x)
+                x, y = 0, y + atlas.line_height
+            positions.append((x, y))
+            x += adv
+        lines_w.append(x)
+        block_h = y + atlas.line_height
+
+        # Center every line
+        line_offsets = [(max_width - lw) // 2 for lw in lines_w]
+        positions = [(px + line_offsets[py // atlas.line_height], py) for px, py in positions]
+
+        # 2. Blit glyph masks into block-sized alpha planes
+        block_w = max_width + 2 * stroke_width + 2
+        fill_a = np.zeros((block_h, block_w), dtype=np.uint8)
+        stroke_a = np.zeros((block_h, block_w), dtype=np.uint8)
+        char_boxes = []
+        for ch, (px, py) in zip(text, positions):
+            f_mask, s_mask, _ = atlas.glyph(ch)
+            gh, gw = f_mask.shape
+            gw = min(gw, block_w - px)
+            np.maximum(fill_a[py:py + gh, px:px + gw], f_mask[:, :gw], out=fill_a[py:py + gh, px:px + gw])
+            np.maximum(stroke_a[py:py + gh, px:px + gw], s_mask[:, :gw], out=stroke_a[py:py + gh, px:px + gw])
+            char_boxes.append((px, py, px + gw, py + gh))
+
+        ox = (W - block_w) // 2
+        oy = int(H * y_ratio)
+        self.base = OverlayPatch(self._compose(fill_a, stroke_a, base_color, stroke_color), ox, oy)
+        highlight = self._compose(fill_a, stroke_a, highlight_color, stroke_color)
+
+        # 3. One highlight patch per word (union of its characters' boxes, per line)
+        self.word_starts = []
+        self.word_ends = []
+        self.word_patches = []
+        for c0, c1, start, end in _word_spans(text, words):
+            boxes = char_boxes[c0:c1]
+            if not boxes:
+                continue
+            patches = []
+            for line_y in sorted({b[1] for b in boxes}):
+                line_boxes = [b for b in boxes if b[1] == line_y]
+                x0, x1 = min(b[0] for b in line_boxes), max(b[2] for b in line_boxes)
+                y0, y1 = line_y, max(b[3] for b in line_boxes)
+                patches.append(OverlayPatch(highlight[y0:y1, x0:x1], ox + x0, oy + y0))
+            self.word_starts.append(start)
+            self.word_ends.append(end)
+            self.word_patches.append(patches)
+
+    @staticmethod
+    def _compose(fill_a, stroke_a, fill_color, stroke_color):
+        """Stroke under fill, as one straight-alpha RGBA image"""
+        fc = np.array(ImageColor.getrgb(fill_color)[:3], dtype=np.float32)
+        sc = np.array(ImageColor.getrgb(stroke_color)[:3], dtype=np.float32)
+        fa = fill_a.astype(np.float32)[:, :, None] / 255.0
+        rgb = fc * fa + sc * (1.0 - fa)
+        alpha = np.maximum(stroke_a, fill_a)
+        return np.dstack([rgb.astype(np.uint8), alpha])
+
+    def active_word(self, t):
+        i = bisect.bisect_right(self.word_starts, t) - 1
+        if i >= 0 and t < max(self.word_ends[i], self.word_starts[i + 1] if i + 1 < len(self.word_starts) else self.word_ends[i]):
+            return i
+        return -1
+
+    def apply(self, frame, t):
+        frame = self.base.apply(ensure_uint8(frame))
+        i = self.active_word(t)
+        if i >= 0:
+            for patch in self.word_patches[i]:
+                frame = patch.apply(frame)
+        return frame
+
+def karaoke_filter(text, words, frame_size, **style):
+    """fl()-style filter (get_frame, t) -> frame; layout is built once here"""
+    caption = KaraokeCaption(text, words, frame_size, **style)
+    return lambda get_frame, t: caption.apply(get_frame(t), t)
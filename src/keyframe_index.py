@@ -0,0 +1,221 @@
+"""
+Keyframe / packet index per source, for frame-accurate random access.
+
+OpenCV's CAP_PROP_POS_MSEC and MoviePy's t -> frame mapping both assume a
+constant frame rate, so seeks on VFR screen recordings land on the wrong
+frame, and every seek decodes an unknown amount from the previous keyframe.
+
+The ingest step demuxes the video stream once with ffprobe (no decoding) and
+caches, per source fingerprint:
+
+    ../data/cache/keyframes/<fingerprint>_default.json
+    {"origin": first pts, "pts": [...], "pos": [...], "key": [...], "duration": ...}
+
+pts are presentation times of every frame (sorted, relative to the first
+frame, i.e. the t that MoviePy / ffmpeg -ss use), pos the packet byte
+offsets, key the indices of keyframes. With it:
+
+    frame_time(t)        exact pts of the frame shown at t
+    keyframe_before(t)   where a seek lands; decode_cost(t) = frames decoded after it
+    read_frame_at(t)     seek to that keyframe, decode forward until the decoder's
+                         pts reaches frame_time(t)
+
+so every random access is accurate and costs at most one GOP of decoding.
+
+Engines plan through planning_index(), which falls back to MoviePy's duration
+(no frame snapping) when ffprobe is not available. Renders read through
+decoder_pool, which uses the index to decide when a cut needs a seek at all;
+the seek is MoviePy's ffmpeg -ss, the same keyframe seek + forward decode.
+
+CLI (ingest ahead of time):
+    python keyframe_index.py video1.mp4 [video2.mp4 ...]
+"""
+import bisect
+import subprocess
+
+from media_utils import source_fingerprint, cache_path, load_json, save_json, find_ffprobe
+
+EPS = 1e-4 # Timestamps within this are the same instant
+
+def probe_packets(path, stream="v:0"):
+    """[(pts, pos, is_key)] for every packet of the stream, in presentation order (demux only)"""
+    cmd = [find_ffprobe(), "-v", "error", "-select_streams", stream,
+           "-show_entries", "packet=pts_time,pos,flags", "-of", "csv=p=0", path]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    packets = []
+    for line in result.stdout.splitlines():
+        parts = line.strip().split(",")
+        if len(parts) < 3 or parts[0] in ("", "N/A"):
+            continue
+        pos = int(parts[1]) if parts[1] not in ("", "N/A") else -1
+        packets.append((float(parts[0]), pos, "K" in parts[2]))
+    packets.sort(key=lambda p: p[0])
+    return packets
+
+def build_index(path):
+    packets = probe_packets(path)
+    if not packets:
+        raise ValueError(f"No video packets in {path}")
+    origin = packets[0][0]
+    pts = [round(p[0] - origin, 6) for p in packets]
+    frame_dur = (pts[-1] / (len(pts) - 1)) if len(pts) > 1 else 0.0
+    return {
+        "origin": origin,
+        "pts": pts,
+        "pos": [p[1] for p in packets],
+        "key": [i for i, p in enumerate(packets) if p[2]] or [0],
+        "duration": round(pts[-1] + frame_dur, 6),
+    }
+
+class KeyframeIndex:
+    def __init__(self, data):
+        self.origin = data["origin"]
+        self.pts = data["pts"]
+        self.pos = data["pos"]
+        self.key = data["key"]
+        self.duration = data["duration"]
+        self.keyframes = [self.pts[i] for i in self.key]
+
+    @property
+    def fps(self):
+        """Average frame rate (VFR sources have no single true one)"""
+        return len(self.pts) / self.duration if self.duration else 30.0
+
+    def frame_index(self, t):
+        """Index of the frame displayed at time t"""
+        return min(len(self.pts) - 1, max(0, bisect.bisect_right(self.pts, t + EPS) - 1))
+
+    def frame_time(self, t):
+        """Exact pts of the frame displayed at time t"""
+        return self.pts[self.frame_index(t)]
+
+    def keyframe_before(self, t):
+        """Last keyframe at or before t: where a seek to t lands"""
+        i = bisect.bisect_right(self.keyframes, t + EPS) - 1
+        return self.keyframes[max(0, i)]
+
+    def keyframe_after(self, t):
+        """First keyframe at or after t (None past the last one)"""
+        i = bisect.bisect_left(self.keyframes, t - EPS)
+        return self.keyframes[i] if i < len(self.keyframes) else None
+
+    def byte_offset(self, t):
+        """Packet byte offset of the keyframe a seek to t starts decoding from"""
+        i = max(0, bisect.bisect_right(self.keyframes, t + EPS) - 1)
+        return self.pos[self.key[i]]
+
+    def decode_cost(self, t):
+        """Frames decoded after a seek before the frame at t is reached (bounded by the GOP)"""
+        return self.frame_index(t) - self.frame_index(self.keyframe_before(t))
+
+def _index_path(video_path):
+    return cache_path("keyframes", source_fingerprint(video_path))
+
+def load_keyframe_index(video_path):
+    """Cached index, or None (never probes)"""
+    data = load_json(_index_path(video_path))
+    return KeyframeIndex(data) if data else None
+
+_memo = {}
+
+def get_keyframe_index(video_path):
+    """Index for a source, built (demux only) on first use and cached by fingerprint"""
+    path = _index_path(video_path)
+    if path not in _memo:
+        data = load_json(path)
+        if data is None:
+            print(f"Indexing keyframes: {video_path}")
+            data = build_index(video_path)
+            save_json(path, data)
+            print(f"Keyframe index saved: {len(data['pts'])} frames, {len(data['key'])} keyframes")
+        _memo[path] = KeyframeIndex(data)
+    return _memo[path]
+
+class DurationOnly:
+    """Planning stand-in for an unindexable source: MoviePy's duration, times left as they are"""
+
+    def __init__(self, duration):
+        self.duration = duration
+
+    def frame_time(self, t):
+        return t
+
+def planning_index(video_path):
+    """
+    Index for planners (duration + frame_time). Without ffprobe (only
+    ffmpeg.exe is bundled) falls back to DurationOnly, cuts not frame-snapped.
+    """
+    try:
+        return get_keyframe_index(video_path)
+    except (OSError, subprocess.CalledProcessError, ValueError) as e:
+        print(f"Warning: no keyframe index for {video_path} ({e}); cuts are not frame-snapped")
+        try:
+            from moviepy import VideoFileClip
+        except ImportError:
+            from moviepy.editor import VideoFileClip
+        clip = VideoFileClip(video_path, audio=False)
+        try:
+            return DurationOnly(clip.duration)
+        finally:
+            clip.close()
+
+# --- Seek-then-decode-forward access (OpenCV) ---
+
+def _position(cap):
+    """pts (seconds) of the frame a cv2.VideoCapture grabbed last, from the decoder itself"""
+    import cv2
+    return cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+
+def seek_capture(cap, index, t):
+    """
+    Grab the frame shown at t into a cv2.VideoCapture (cap.retrieve() returns it).
+    OpenCV maps a CAP_PROP_POS_MSEC seek through a constant fps, so on VFR
+    sources the seek only lands near the keyframe before t: frames are grabbed
+    (demux + decode, no conversion) until the decoder's own pts reaches the
+    indexed pts of the frame. A seek that overshoots retries from an earlier
+    keyframe. Returns False when the frame cannot be reached.
+    """
+    import cv2
+    target = index.frame_time(t)
+    anchor = index.keyframe_before(t)
+    while True:
+        cap.set(cv2.CAP_PROP_POS_MSEC, anchor * 1000.0)
+        if not cap.grab():
+            return False
+        if _position(cap) <= target + EPS or anchor <= 0.0:
+            break
+        earlier = index.keyframe_before(anchor - 2 * EPS)
+        anchor = earlier if earlier < anchor else 0.0
+    while _position(cap) < target - EPS:
+        if not cap.grab():
+            return False
+    return True
+
+def read_frame_at(video_path, t, index=None, cap=None):
+    """Exact frame (RGB) shown at t, or None. Pass an open `cap` to reuse the decoder."""
+    import cv2
+    index = index or get_keyframe_index(video_path)
+    own = cap is None
+    if own:
+        cap = cv2.VideoCapture(video_path)
+    try:
+        frame = cap.retrieve()[1] if seek_capture(cap, index, t) else None
+    finally:
+        if own:
+            cap.release()
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) if frame is not None else None
+
+def ingest(video_paths):
+    """Build (or load) the index of every source ahead of rendering"""
+    for path in video_paths:
+        index = get_keyframe_index(path)
+        gops = [b - a for a, b in zip(index.keyframes, index.keyframes[1:] + [index.duration])]
+        print(f"{path}: {len(index.pts)} frames, {len(index.keyframes)} keyframes, "
+              f"avg {index.fps:.2f} fps, max GOP {max(gops):.2f}s")
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) < 2:
+        print("Usage: python keyframe_index.py <video_path> [...]")
+    else:
+        ingest(sys.argv[1:])
@@ -0,0 +1,207 @@
+"""
+Proxy + mezzanine ingest for long / VFR / sparse-keyframe source recordings.
+
+Each source is transcoded once into two variants, cached by source
+fingerprint under ../data/cache/ingest/:
+
+    proxy       360p, constant frame rate, keyframe every 0.5s, ultrafast:
+                analysis decodes (scenes, motion, sharpness, subject) and previews
+    mezzanine   full resolution, constant frame rate, 1s GOP, near-lossless:
+                editing / rendering (cheap, accurate seeks anywhere)
+
+A source that is already CFR with short GOPs is its own mezzanine.
+
+Time mapping is exact: both variants are resampled onto the source's own
+timeline (fps filter = the source frame shown at t) at the source's exact
+rational rate (30000/1001 stays 30000/1001; only VFR or out-of-range rates are
+rounded), so no frame is duplicated or dropped and a time on any variant
+is the same instant on the original. The only difference is where the first
+video frame sits in each file's seek timeline (video start_time relative to
+the container start), measured per file and stored as `lead`:
+
+    map_time(path, t, purpose) = t + variant.lead - source.lead
+
+Engines call ingest() when planning; renderers and analyzers only call
+resolve_source(path, purpose), which returns (variant_path, offset) and falls
+back to the original (offset 0) for anything that was never ingested.
+
+CLI:
+    python media_ingest.py video1.mp4 [video2.mp4 ...]
+"""
+import os
+import subprocess
+from fractions import Fraction
+from concurrent.futures import ThreadPoolExecutor
+
+from media_utils import source_fingerprint, cache_path, load_json, save_json, find_ffmpeg, probe_media
+
+PROXY_HEIGHT = 360
+PROXY_KEYINT = 0.5   # Seconds between proxy keyframes
+MEZZ_KEYINT = 1.0    # Seconds between mezzanine keyframes
+MEZZ_CRF = 16
+MAX_SOURCE_GOP = 2.0 # Sources with longer GOPs (or VFR) get a mezzanine
+AUTO_INGEST = True   # Engines ingest their sources before analysis / planning
+
+# purpose -> variant
+PURPOSES = {
+    "analysis": "proxy",
+    "preview": "proxy",
+    "edit": "mezzanine",
+    "render": "mezzanine",
+    "original": None,
+}
+
+def _video_timing(path):
+    """(lead, rate, is_cfr, width, height) of a file's first video stream; rate is a Fraction"""
+    info = probe_media(path)
+    video = next(s for s in info["streams"] if s.get("codec_type") == "video")
+    fmt_start = float(info.get("format", {}).get("start_time", 0) or 0)
+    v_start = float(video.get("start_time", fmt_start) or fmt_start)
+
+    def rate(r):
+        try:
+            return Fraction(r or "0")
+        except (ValueError, ZeroDivisionError):
+            return Fraction(0)
+
+    avg, real = rate(video.get("avg_frame_rate")), rate(video.get("r_frame_rate"))
+    is_cfr = avg > 0 and abs(avg - real) < 0.01
+    return (round(v_start - fmt_start, 6), (real if is_cfr else avg or real) or Fraction(30), is_cfr,
+            int(video["width"]), int(video["height"]))
+
+def _target_rate(rate, is_cfr):
+    """CFR rate of the variants: the source's exact rate, rounded only for VFR or out-of-range sources"""
+    if is_cfr and 1 <= rate <= 60:
+        return rate
+    return Fraction(max(1, min(60, int(round(rate)))))
+
+def _variant_params(kind, fps):
+    if kind == "proxy":
+        return {"height": PROXY_HEIGHT, "fps": fps, "keyint": PROXY_KEYINT}
+    return {"fps": fps, "keyint": MEZZ_KEYINT, "crf": MEZZ_CRF}
+
+def _transcode(src, dst, kind, rate):
+    """One ffmpeg pass: CFR resample on the source timeline (rate: "30" or "30000/1001"), fixed GOP"""
+    gop = max(1, int(round(float(Fraction(rate)) * (PROXY_KEYINT if kind == "proxy" else MEZZ_KEYINT))))
+    vf = f"fps={rate}"
+    if kind == "proxy":
+        vf += f",scale=-2:{PROXY_HEIGHT}"
+    cmd = [find_ffmpeg(), "-y", "-v", "error", "-i", src, "-map", "0:v:0", "-map", "0:a:0?",
+           "-vf", vf, "-c:v", "libx264", "-g", str(gop), "-keyint_min", str(gop), "-sc_threshold", "0",
+           "-pix_fmt", "yuv420p"]
+    if kind == "proxy":
+        cmd += ["-preset", "ultrafast", "-crf", "30", "-c:a", "aac", "-b:a", "96k"]
+    else:
+        cmd += ["-preset", "veryfast", "-crf", str(MEZZ_CRF), "-c:a", "aac", "-b:a", "192k"]
+    tmp = dst + ".part.mp4"
+    subprocess.run(cmd + ["-movflags", "+faststart", tmp], check=True)
+    os.replace(tmp, dst)
+
+def _needs_mezzanine(path, is_cfr):
+    if not is_cfr:
+        return True
+    from keyframe_index import get_keyframe_index
+    index = get_keyframe_index(path)
+    gops = [b - a for a, b in zip(index.keyframes, index.keyframes[1:] + [index.duration])]
+    return max(gops) > MAX_SOURCE_GOP
+
+def _manifest_path(path):
+    return cache_path("ingest", source_fingerprint(path))
+
+_manifests = {}
+
+def load_manifest(path):
+    """Ingest manifest of a source, or None (never transcodes)"""
+    if not os.path.exists(path):
+        return None
+    mpath = _manifest_path(path)
+    if mpath not in _manifests:
+        manifest = load_json(mpath)
+        if manifest is None or "rate" not in manifest:
+            return None # Written before exact rates were kept: re-ingest
+        _manifests[mpath] = manifest
+    return _manifests[mpath]
+
+def ingest(path, variants=("proxy", "mezzanine")):
+    """Transcode the missing variants of a source (in parallel) and return its manifest"""
+    mpath = _manifest_path(path)
+    manifest = load_json(mpath)
+    if manifest is None or "rate" not in manifest:
+        lead, rate, is_cfr, w, h = _video_timing(path)
+        rate = _target_rate(rate, is_cfr)
+        # fps: exact value for frame math (int when whole); rate: the same as ffmpeg reads it
+        fps = int(rate) if rate.denominator == 1 else float(rate)
+        manifest = {"source": os.path.abspath(path), "lead": lead, "fps": fps, "rate": str(rate),
+                    "cfr": is_cfr, "size": [w, h], "variants": {}}
+
+    jobs = []
+    for kind in variants:
+        if kind in manifest["variants"] and os.path.exists(manifest["variants"][kind]["path"]):
+            continue
+        if kind == "mezzanine" and not _needs_mezzanine(path, manifest["cfr"]):
+            manifest["variants"][kind] = {"path": os.path.abspath(path), "lead": manifest["lead"]}
+            print(f"Ingest: {os.path.basename(path)} is CFR with short GOPs, used as its own mezzanine")
+            continue
+        dst = os.path.abspath(cache_path(kind, source_fingerprint(path), _variant_params(kind, manifest["fps"]), ext=".mp4"))
+        if os.path.exists(dst):
+            manifest["variants"][kind] = {"path": dst, "lead": _video_timing(dst)[0]}
+            continue
+        jobs.append((kind, dst))
+
+    if jobs:
+        print(f"Ingest: {os.path.basename(path)} -> {', '.join(k for k, _ in jobs)} @ {manifest['rate']} fps CFR")
+        with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+            futures = [pool.submit(_transcode, path, dst, kind, manifest["rate"]) for kind, dst in jobs]
+            for f in futures:
+                f.result()
+        for kind, dst in jobs:
+            manifest["variants"][kind] = {"path": dst, "lead": _video_timing(dst)[0]}
+
+    save_json(mpath, manifest)
+    _manifests[mpath] = manifest
+    return manifest
+
+def prepare_source(path):
+    """Engine entry point: ingest once (cached afterwards); failures fall back to the original"""
+    if not AUTO_INGEST:
+        return None
+    try:
+        return ingest(path)
+    except (subprocess.CalledProcessError, OSError, ValueError, StopIteration) as e:
+        print(f"Ingest skipped for {path}, using the original: {e}")
+        return None
+
+def source_fps(path):
+    """Exact frame rate of an ingested source's variants (e.g. 29.97002997...), or None"""
+    manifest = load_manifest(path)
+    return manifest["fps"] if manifest else None
+
+def resolve_source(path, purpose="edit"):
+    """
+    (path_to_read, offset) for a purpose: add `offset` to source times to get
+    times in the returned file. Never-ingested files resolve to themselves.
+    """
+    kind = PURPOSES.get(purpose)
+    manifest = load_manifest(path) if kind else None
+    variant = manifest["variants"].get(kind) if manifest else None
+    if variant is None or not os.path.exists(variant["path"]):
+        return path, 0.0
+    return variant["path"], round(variant["lead"] - manifest["lead"], 6)
+
+def map_time(path, t, purpose="edit"):
+    """Source time -> time in the variant used for `purpose`"""
+    return t + resolve_source(path, purpose)[1]
+
+def to_source_time(path, t, purpose="analysis"):
+    """Time measured on a variant (e.g. a proxy cut list) -> source time"""
+    return t - resolve_source(path, purpose)[1]
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) < 2:
+        print("Usage: python media_ingest.py <video_path> [...]")
+    else:
+        for p in sys.argv[1:]:
+            m = ingest(p)
+            for kind, v in m["variants"].items():
+                print(f"  {kind}: {v['path']} (lead {v['lead'] - m['lead']:+.3f}s)")
@@ -0,0 +1,137 @@
+"""
+Shared media helpers: source fingerprints, on-disk JSON caches and
+ffmpeg/ffprobe lookup.
+
+Every analysis result that is expensive to compute (ASR, scenes, OCR, ...)
+is cached under ../data/cache/<kind>/ keyed by the source fingerprint and the
+parameters used to compute it, so reruns never redo work on unchanged inputs.
+"""
+import os
+import json
+import hashlib
+
+DATA_DIR = "../data"
+CACHE_DIR = os.path.join(DATA_DIR, "cache")
+
+_fingerprint_memo = {}
+
+def source_fingerprint(path, sample_bytes=1024 * 1024):
+    """
+    Cheap content fingerprint of a media file.
+    Hashes the size plus the first and last `sample_bytes`, which is enough to
+    tell recordings apart without reading multi-GB files.
+    """
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    if memo_key in _fingerprint_memo:
+        return _fingerprint_memo[memo_key]
+
+    h = hashlib.sha1()
+    h.update(str(stat.st_size).encode())
+    with open(path, "rb") as f:
+        h.update(f.read(sample_bytes))
+        if stat.st_size > sample_bytes:
+            f.seek(max(sample_bytes, stat.st_size - sample_bytes))
+            h.update(f.read(sample_bytes))
+
+    fingerprint = h.hexdigest()[:16]
+    _fingerprint_memo[memo_key] = fingerprint
+    return fingerprint
+
+def params_key(params):
+    """Stable short hash of a parameter dict"""
+    if not params:
+        return "default"
+    blob = json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()[:10]
+
+def cache_path(kind, fingerprint, params=None, ext=".json"):
+    """Path of a cache entry, e.g. ../data/cache/asr/<fingerprint>_<params>.json"""
+    directory = os.path.join(CACHE_DIR, kind)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{fingerprint}_{params_key(params)}{ext}")
+
+def load_json(path):
+    """Load a JSON cache entry, or None if missing/corrupt"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_json(path, data):
+    """Atomically write a JSON cache entry (no half-written files on crash)"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return path
+
+def moviepy_is_v2():
+    """MoviePy >= 2 (the `moviepy` namespace API), from package metadata - nothing is imported"""
+    from importlib.metadata import version, PackageNotFoundError
+    try:
+        return int(version("moviepy").split(".")[0]) >= 2
+    except (PackageNotFoundError, ValueError):
+        return False
+
+def moviepy_module():
+    """MoviePy's clip API on first use: `moviepy` (v2) or `moviepy.editor` (v1); both expose .vfx"""
+    import importlib
+    return importlib.import_module("moviepy" if moviepy_is_v2() else "moviepy.editor")
+
+def find_ffmpeg():
+    """Prefer the bundled ffmpeg in ../resources, else whatever is on PATH"""
+    local = "../resources/ffmpeg.exe"
+    return local if os.path.exists(local) else "ffmpeg"
+
+def find_ffprobe():
+    local = "../resources/ffprobe.exe"
+    return local if os.path.exists(local) else "ffprobe"
+
+def probe_media(path):
+    """ffprobe container + stream metadata as a dict (raises CalledProcessError on failure)"""
+    import subprocess
+    cmd = [find_ffprobe(), "-v", "error", "-show_format", "-show_streams", "-of", "json", path]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+def av_length_mismatch(path):
+    """
+    Video stream duration minus audio stream duration (seconds), or None when
+    the file has no audio or cannot be probed (e.g. no ffprobe).
+    """
+    import subprocess
+    try:
+        streams = probe_media(path)["streams"]
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return None
+    durations = {}
+    for stream in streams:
+        kind = stream.get("codec_type")
+        if kind in ("video", "audio") and kind not in durations and stream.get("duration") not in (None, "N/A"):
+            durations[kind] = float(stream["duration"])
+    if len(durations) < 2:
+        return None
+    return durations["video"] - durations["audio"]
+
+def probe_keyframes(path, stream="v:0"):
+    """
+    Keyframe timestamps (seconds) from the packet index.
+    Only demuxes - no frame is decoded, so this is fast even on long files.
+    """
+    import subprocess
+    cmd = [find_ffprobe(), "-v", "error", "-select_streams", stream,
+           "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", path]
+    result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    keyframes = []
+    for line in result.stdout.splitlines():
+        parts = line.strip().split(",")
+        if len(parts) < 2 or parts[0] in ("", "N/A"):
+            continue
+        if "K" in parts[1]:
+            keyframes.append(float(parts[0]))
+    return sorted(keyframes)
@@ -0,0 +1,136 @@
+"""
+Double-buffered writer: frame generation and encoding overlap.
+
+write_videofile generates a frame, blocks while it is written into the
+ffmpeg pipe, and only then generates the next one. Here the producer
+(clip.get_frame + effects, main thread) and the consumer (pipe writes,
+writer thread) are connected by a bounded ring of preallocated frame
+buffers, so the encoder works on frame N while Python builds frame N+1.
+
+Stall accounting tells what bounds a render:
+    producer_wait   time the producer waited for a free buffer -> encoder-bound
+    consumer_wait   time the writer waited for a finished frame -> effects-bound
+"""
+import os
+import time
+import queue
+import shutil
+import threading
+import subprocess
+import tempfile
+
+import numpy as np
+
+from media_utils import find_ffmpeg
+from subtitle_renderer import ensure_uint8
+
+BUFFERS = 4 # Frames in flight between producer and writer
+
+def _ffmpeg_cmd(output_path, size, fps, codec="libx264", bitrate=None, preset=None,
+                ffmpeg_params=None, audio_path=None, threads=None):
+    w, h = size
+    cmd = [find_ffmpeg(), "-y", "-loglevel", "error",
+           "-f", "rawvideo", "-vcodec", "rawvideo", "-pix_fmt", "rgb24",
+           "-s", f"{w}x{h}", "-r", f"{fps}", "-i", "-"]
+    if audio_path:
+        # Audio is pre-encoded once, so it is only muxed here
+        cmd += ["-i", audio_path, "-map", "0:v:0", "-map", "1:a:0", "-c:a", "copy"]
+    cmd += ["-c:v", codec]
+    if bitrate:
+        cmd += ["-b:v", bitrate]
+    if preset:
+        cmd += ["-preset", preset]
+    if threads:
+        cmd += ["-threads", str(threads)]
+    params = list(ffmpeg_params or [])
+    if "-pix_fmt" not in params:
+        params += ["-pix_fmt", "yuv420p"]
+    cmd += params + [output_path]
+    return cmd
+
+def write_pipelined(clip, output_path, fps=None, codec="libx264", audio_codec="aac", bitrate=None,
+                    preset=None, ffmpeg_params=None, audio=True, threads=None, buffers=BUFFERS, logger=None):
+    """
+    Drop-in for clip.write_videofile(...) with overlapped generation/encoding.
+    Returns the stall statistics.
+    """
+    fps = fps or getattr(clip, "fps", None) or 30
+    w, h = int(clip.w), int(clip.h)
+    n_frames = int(round(clip.duration * fps))
+
+    audio_path = None
+    workdir = None
+    if audio and clip.audio is not None:
+        workdir = tempfile.mkdtemp(prefix="pipe_", dir=os.path.dirname(os.path.abspath(output_path)))
+        audio_path = os.path.join(workdir, "audio.m4a")
+        clip.audio.write_audiofile(audio_path, fps=44100, codec=audio_codec, logger=None)
+
+    cmd = _ffmpeg_cmd(output_path, (w, h), fps, codec, bitrate, preset, ffmpeg_params, audio_path, threads)
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    ring = [np.empty((h, w, 3), dtype=np.uint8) for _ in range(buffers)]
+    free = queue.Queue()
+    filled = queue.Queue()
+    for i in range(buffers):
+        free.put(i)
+
+    stats = {"frames": 0, "producer_wait": 0.0, "consumer_wait": 0.0, "produce": 0.0, "write": 0.0}
+    error = []
+
+    def writer():
+        try:
+            while True:
+                t0 = time.perf_counter()
+                idx = filled.get()
+                stats["consumer_wait"] += time.perf_counter() - t0
+                if idx is None:
+                    break
+                t0 = time.perf_counter()
+                proc.stdin.write(ring[idx].data) # Releases the GIL while ffmpeg reads
+                stats["write"] += time.perf_counter() - t0
+                free.put(idx)
+        except Exception as e:
+            error.append(e)
+            free.put(None) # Unblock the producer
+
+    thread = threading.Thread(target=writer, name="pipelined-writer", daemon=True)
+    start = time.perf_counter()
+    thread.start()
+    try:
+        for i in range(n_frames):
+            t0 = time.perf_counter()
+            idx = free.get()
+            stats["producer_wait"] += time.perf_counter() - t0
+            if idx is None:
+                break
+            t0 = time.perf_counter()
+            frame = ensure_uint8(clip.get_frame(i / fps))
+            if frame.shape[:2] != (h, w):
+                raise ValueError(f"Frame {i} is {frame.shape[1]}x{frame.shape[0]}, expected {w}x{h}")
+            np.copyto(ring[idx], frame[:, :, :3])
+            stats["produce"] += time.perf_counter() - t0
+            stats["frames"] += 1
+            filled.put(idx)
+    finally:
+        filled.put(None)
+        thread.join()
+        proc.stdin.close()
+        stderr = proc.stderr.read().decode("utf-8", "ignore")
+        proc.wait()
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if error or proc.returncode != 0:
+        raise IOError(f"ffmpeg failed writing {output_path}: {error[0] if error else ''} {stderr.strip()}")
+
+    stats["elapsed"] = time.perf_counter() - start
+    stats["fps"] = stats["frames"] / stats["elapsed"] if stats["elapsed"] else 0.0
+    stats["bound"] = "encoder" if stats["producer_wait"] > stats["consumer_wait"] else "effects"
+    print_stats(stats, output_path)
+    return stats
+
+def print_stats(stats, output_path=""):
+    print(f"Pipelined write {os.path.basename(output_path)}: {stats['frames']} frames in {stats['elapsed']:.1f}s "
+          f"({stats['fps']:.1f} fps) | produce {stats['produce']:.1f}s, write {stats['write']:.1f}s | "
+          f"stalls: producer {stats['producer_wait']:.1f}s, writer {stats['consumer_wait']:.1f}s "
+          f"-> {stats['bound']}-bound")
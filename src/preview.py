@@ -0,0 +1,102 @@
+"""
+Preview renders: the same timeline at reduced resolution and frame rate.
+
+preview_timeline() derives a cheap copy of a planned Timeline for checking
+captions and cuts without a full-quality encode:
+
+    size       longest side PREVIEW_MAX_SIDE; explicit sizes, the 9:16 kernels'
+               output sizes and caption font sizes are scaled by the same factor
+    fps        the final rate: a lower rate would move cuts (and per-section
+               frame snapping) onto a coarser grid than the final render's
+    encoder    x264 ultrafast, CRF 30
+    sources    renderers see meta["preview"] and read the ingested 360p proxy
+               (media_ingest purpose "preview"); sources without one are
+               scaled down while decoding (MoviePy target_resolution / ffmpeg scale)
+    effects    PREVIEW_SKIP_EFFECTS are dropped (cosmetic, expensive, and
+               size-preserving, so the layout does not move)
+
+Sections, clip windows, transitions, voices and overlay times are untouched
+and the frame rate is kept, so cuts land on the same frames as in the final
+render.
+
+Enabled per call with render_timeline(..., preview=True) or for every engine
+with YUNSHU_PREVIEW=1; previews are written next to the output as
+<name>_preview<ext>.
+"""
+import os
+
+from timeline import Timeline
+
+PREVIEW_MAX_SIDE = 640
+PREVIEW_ENCODER = {"codec": "libx264", "preset": "ultrafast", "ffmpeg_params": ["-crf", "30"]}
+PREVIEW_SKIP_EFFECTS = {"safe_visual"} # Full-frame blur per frame; output size unchanged without it
+FONT_KEYS = ("font_size", "stroke_width")
+# Pixel font sizes frame_effects.overlay_patches uses when a style sets none (karaoke scales with H)
+DEFAULT_FONT_SIZES = {"subtitle": 40, "caption": 50, "boxed": 30}
+
+_sizes = {}
+
+def source_size(path):
+    """(width, height) of a media file's first video stream, probed once"""
+    if path not in _sizes:
+        from media_utils import probe_media
+        video = next(s for s in probe_media(path)["streams"] if s.get("codec_type") == "video")
+        _sizes[path] = (int(video["width"]), int(video["height"]))
+    return _sizes[path]
+
+def final_size(timeline):
+    """Output frame size of the full render: explicit, set by a resizing effect, or the first source's"""
+    if timeline.width and timeline.height:
+        return timeline.width, timeline.height
+    ref = timeline.sections[0].clips[0]
+    size = source_size(ref.source)
+    from frame_effects import build_chain
+    chain = build_chain(ref.effects)
+    return chain.out_size(size) if chain is not None else size
+
+def _even(v):
+    return max(2, int(round(v / 2)) * 2)
+
+def _scale_effect_params(effect, scale):
+    """Fixed output sizes (out_w/out_h of the 9:16 kernels) follow the preview scale"""
+    from frame_effects import KERNELS
+    kernel = KERNELS[effect.name](**effect.params) if effect.name in KERNELS else None
+    size = getattr(kernel, "size", None)
+    if size is None:
+        return effect.params
+    return {**effect.params, "out_w": _even(size[0] * scale), "out_h": _even(size[1] * scale)}
+
+def preview_timeline(timeline, max_side=PREVIEW_MAX_SIDE):
+    """Reduced copy of `timeline` (see module docstring); the original is not modified"""
+    w, h = final_size(timeline)
+    scale = min(1.0, max_side / max(w, h))
+    preview = Timeline.from_dict(timeline.to_dict())
+
+    if preview.width and preview.height:
+        preview.width, preview.height = _even(preview.width * scale), _even(preview.height * scale)
+    audio_codec = timeline.encoder.get("audio_codec")
+    preview.encoder = dict(PREVIEW_ENCODER, **({"audio_codec": audio_codec} if audio_codec else {}))
+
+    skipped = 0
+    for section in preview.sections:
+        for ref in section.clips:
+            kept = [e for e in ref.effects if e.name not in PREVIEW_SKIP_EFFECTS]
+            skipped += len(ref.effects) - len(kept)
+            for e in kept:
+                e.params = _scale_effect_params(e, scale)
+            ref.effects = kept
+        for overlay in section.overlays:
+            for key in FONT_KEYS:
+                if key in overlay.style:
+                    overlay.style[key] = max(1, int(round(overlay.style[key] * scale)))
+            if overlay.kind in DEFAULT_FONT_SIZES and "font_size" not in overlay.style:
+                overlay.style["font_size"] = max(1, int(round(DEFAULT_FONT_SIZES[overlay.kind] * scale)))
+
+    preview.meta = dict(timeline.meta, preview={"scale": round(scale, 4), "size": [_even(w * scale), _even(h * scale)]})
+    print(f"Preview: {w}x{h} -> {_even(w * scale)}x{_even(h * scale)} @ {preview.fps or 'source'} fps, "
+          f"ultrafast, {skipped} expensive effects skipped")
+    return preview
+
+def preview_path(output_path):
+    base, ext = os.path.splitext(output_path)
+    return f"{base}_preview{ext or '.mp4'}"
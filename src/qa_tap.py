@@ -0,0 +1,134 @@
+"""
+Inline QA tap for renders.
+
+Wraps the final clip so the frames and audio blocks MoviePy pulls during
+write_videofile are measured on the way to the encoder (blur, brightness,
+motion, cut rate, hook motion, hook volume). The QA report is ready the moment
+the export finishes, without decoding the output file again.
+
+    tap = RenderQATap()
+    final_video = tap.attach(final_video)
+    final_video.write_videofile(output_path, fps=30, ...)
+    tap.finish(output_path)
+
+Parallel renders tap every section in its worker (export()) and the mixed
+audio in the parent; from_sections() merges the parts on the timeline, so
+the report still needs no second decode of the output.
+"""
+import cv2
+import numpy as np
+
+from analysis_pipeline import laplacian_sharpness, mean_brightness, motion_energy
+from video_qa import SAMPLE_INTERVAL, HOOK_SECONDS, build_report, print_report, save_report
+
+def _transform_compat(clip, func):
+    # MoviePy v2 renamed fl -> transform
+    if hasattr(clip, "transform"):
+        return clip.transform(func)
+    return clip.fl(func)
+
+def _set_audio_compat(clip, audio):
+    if hasattr(clip, "with_audio"):
+        return clip.with_audio(audio)
+    return clip.set_audio(audio)
+
+class RenderQATap:
+    def __init__(self, sample_interval=SAMPLE_INTERVAL, hook_seconds=HOOK_SECONDS):
+        self.sample_interval = sample_interval
+        self.hook_seconds = hook_seconds
+        self.samples = [] # (t, blur, brightness, motion_or_None), same shape as video_qa
+        self.prev_gray = None
+        self.first_gray = None
+        self.next_t = 0.0
+        self.hook_peak = 0.0
+        self.audio_seen = False
+        self.size = None
+        self.duration = None
+
+    def _on_frame(self, t, frame):
+        if t + 1e-6 < self.next_t:
+            return frame
+        gray = cv2.cvtColor(np.asarray(frame, dtype=np.uint8), cv2.COLOR_RGB2GRAY)
+        motion = motion_energy(gray, self.prev_gray) if self.prev_gray is not None else None
+        if self.first_gray is None:
+            self.first_gray = gray
+        self.samples.append((float(t), laplacian_sharpness(gray), mean_brightness(gray), motion))
+        self.prev_gray = gray
+        while self.next_t <= t + 1e-6:
+            self.next_t += self.sample_interval
+        return frame
+
+    def _on_audio(self, t, block):
+        times = np.atleast_1d(t)
+        if len(times) and times[0] < self.hook_seconds:
+            self.audio_seen = True
+            values = np.asarray(block)
+            in_hook = times < self.hook_seconds
+            if values.ndim > 1:
+                values = values[in_hook]
+            elif values.shape == in_hook.shape:
+                values = values[in_hook]
+            if values.size:
+                self.hook_peak = max(self.hook_peak, float(np.max(np.abs(values))))
+        return block
+
+    def attach(self, clip):
+        """Return `clip` with video frames and audio blocks routed through the tap"""
+        self.size = clip.size
+        self.duration = clip.duration
+        tapped = _transform_compat(clip, lambda gf, t: self._on_frame(t, gf(t)))
+        if clip.audio is not None:
+            tapped = _set_audio_compat(tapped, self.attach_audio(clip.audio))
+        return tapped
+
+    def attach_audio(self, audio):
+        """Return `audio` with its blocks routed through the tap (hook volume)"""
+        return _transform_compat(audio, lambda gf, t: self._on_audio(t, gf(t)))
+
+    def export(self):
+        """Picklable measurements of one section render (worker process), for from_sections"""
+        return {"samples": list(self.samples), "size": [int(v) for v in self.size],
+                "duration": float(self.duration), "first_gray": self.first_gray, "last_gray": self.prev_gray}
+
+    @classmethod
+    def from_sections(cls, parts, starts, duration):
+        """
+        One tap from per-section exports: sample times shifted to the section
+        starts, the motion across each section boundary (the cut) measured from
+        the neighbouring edge frames, hook metrics from the first section(s).
+        """
+        tap = cls()
+        tap.size = next(part["size"] for part in parts if part is not None)
+        tap.duration = duration
+        prev = None
+        for part, start in zip(parts, starts):
+            if part is None: # Measurements lost (cache pruned mid-run): leave a gap
+                prev = None
+                continue
+            samples = [(t + start, blur, bright, motion) for t, blur, bright, motion in part["samples"]]
+            first = part["first_gray"]
+            if samples and prev is not None and first is not None and prev.shape == first.shape:
+                t, blur, bright, _ = samples[0]
+                samples[0] = (t, blur, bright, motion_energy(first, prev))
+            tap.samples.extend(samples)
+            prev = part["last_gray"]
+        return tap
+
+    def report(self, output_path, fps):
+        meta = {
+            "width": int(self.size[0]),
+            "height": int(self.size[1]),
+            "fps": float(fps),
+            "duration": float(self.duration)
+        }
+        hook_volume = self.hook_peak if self.audio_seen else None
+        return build_report(output_path, meta, sorted(self.samples, key=lambda s: s[0]), hook_volume)
+
+    def finish(self, output_path, fps=30, save=True):
+        """Print (and save) the QA report for the just-finished render"""
+        print("\n🤖 Inline QA (measured during render):")
+        report = self.report(output_path, fps)
+        print_report(report)
+        if save:
+            save_report(report, output_path)
+        return report
@@ -0,0 +1,387 @@
+"""
+FFmpeg filtergraph renderer for timeline.Timeline.
+
+The whole timeline is compiled into one filter_complex and rendered by a
+single ffmpeg process - no frame ever passes through Python:
+
+    video   per clip: input-seeked (-ss/-t) source -> native effect chain
+            (scale/crop/boxblur/overlay) -> fps/scale/format normalize;
+            sections concat, fade in, subtitles overlaid as pre-rasterized
+            PNG patches (enable='between(t,a,b)', karaoke = one patch per word);
+            sections joined with concat or xfade (crossfade transitions)
+    audio   source audio, section voices (J/L-cut placed with adelay) and
+            global tracks (looped BGM, optionally ducked with
+            sidechaincompress under the voices) mixed with amix
+
+Effects without a native equivalent are the only Python path: the section
+using one is pre-rendered (video only) by the MoviePy backend and enters the
+graph as a plain clip. If ffmpeg itself fails, the whole timeline falls back
+to MoviePy.
+
+CLI:
+    python render_ffmpeg.py plan.timeline.json out.mp4 [--compare | --preview]
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+
+from timeline import Timeline, ClipRef, register_renderer
+from media_utils import find_ffmpeg, probe_media
+from frame_effects import overlay_windows
+from media_ingest import resolve_source
+
+DUCK_FILTER = "sidechaincompress=threshold=0.03:ratio=8:attack=20:release=400"
+SAMPLE_RATE = 44100
+
+_probe_cache = {}
+
+def source_info(path):
+    """(width, height, fps, has_audio) of a source, probed once"""
+    if path not in _probe_cache:
+        info = probe_media(path)
+        video = next(s for s in info["streams"] if s.get("codec_type") == "video")
+        num, _, den = video.get("avg_frame_rate", "30/1").partition("/")
+        fps = float(num) / float(den or 1) if float(den or 1) else 30.0
+        has_audio = any(s.get("codec_type") == "audio" for s in info["streams"])
+        _probe_cache[path] = (int(video["width"]), int(video["height"]), fps or 30.0, has_audio)
+    return _probe_cache[path]
+
+def _even(v):
+    return int(v) // 2 * 2
+
+# --- Native effects: (src, dst, uid, size, **params) -> (filters, size) ---
+
+def _vertical_9_16(src, dst, uid, size, out_w=720, out_h=1280):
+    """Blurred cover background + full-width foreground (frame_effects "vertical_9_16")"""
+    return [
+        f"[{src}]split[{uid}a][{uid}b]",
+        f"[{uid}a]scale={out_w}:{out_h}:force_original_aspect_ratio=increase,crop={out_w}:{out_h},boxblur=20:2[{uid}bg]",
+        f"[{uid}b]scale={out_w}:-2[{uid}fg]",
+        f"[{uid}bg][{uid}fg]overlay=0:(H-h)/2[{dst}]",
+    ], (out_w, out_h)
+
+def _smart_crop_9_16(src, dst, uid, size, path, out_w=720, out_h=1280):
+    """Subject-tracking crop: the baked path becomes a per-frame crop x expression"""
+    from smart_crop import crop_window, crop_x_expr
+    w, h = size
+    crop_w, crop_h = crop_window(w, h, out_w / out_h)
+    crop_w, crop_h = _even(crop_w), _even(crop_h)
+    x = crop_x_expr(path, w, crop_w)
+    return [f"[{src}]crop={crop_w}:{crop_h}:'{x}':(ih-{crop_h})/2,scale={out_w}:{out_h}[{dst}]"], (out_w, out_h)
+
+def _zoom(src, dst, uid, size, ratio=1.3):
+    w, h = size
+    return [f"[{src}]crop={_even(w / ratio)}:{_even(h / ratio)},scale={w}:{h}[{dst}]"], size
+
+def _zoom_jump(src, dst, uid, size):
+    return _zoom(src, dst, uid, size, ratio=1 / 0.85)
+
+def _safe_visual(src, dst, uid, size):
+    """Zoomed, blurred background + 85% foreground (frame_effects "safe_visual")"""
+    w, h = size
+    return [
+        f"[{src}]split[{uid}a][{uid}b]",
+        f"[{uid}a]scale={_even(w * 1.2)}:{_even(h * 1.2)},crop={w}:{h},boxblur=15:2[{uid}bg]",
+        f"[{uid}b]scale={_even(w * 0.85)}:{_even(h * 0.85)}[{uid}fg]",
+        f"[{uid}bg][{uid}fg]overlay=(W-w)/2:(H-h)/2[{dst}]",
+    ], size
+
+NATIVE_EFFECTS = {
+    "vertical_9_16": _vertical_9_16,
+    "smart_crop_9_16": _smart_crop_9_16,
+    "zoom": _zoom,
+    "zoom_jump": _zoom_jump,
+    "safe_visual": _safe_visual,
+}
+
+def native_section(section):
+    return (all(e.name in NATIVE_EFFECTS for c in section.clips for e in c.effects) and
+            all(o.kind in ("subtitle", "caption", "boxed", "karaoke") for o in section.overlays))
+
+class FilterGraph:
+    def __init__(self, workdir):
+        self.workdir = workdir
+        self.inputs = [] # argument lists, one per input
+        self.filters = []
+        self.n = 0
+
+    def add_input(self, *args):
+        self.inputs.append(list(args))
+        return len(self.inputs) - 1
+
+    def label(self, prefix):
+        self.n += 1
+        return f"{prefix}{self.n}"
+
+    def add(self, stmt):
+        self.filters.append(stmt)
+
+    def patch_input(self, patch):
+        from PIL import Image
+        path = os.path.join(self.workdir, f"patch_{len(self.inputs)}.png")
+        Image.fromarray(patch.rgba).save(path)
+        return self.add_input("-i", path)
+
+class TimelineCompiler:
+    def __init__(self, timeline, workdir, purpose=None):
+        self.timeline = timeline
+        # Preview timelines (preview.py) read proxies, scaled to the preview size
+        self.preview = timeline.meta.get("preview")
+        self.purpose = purpose or ("preview" if self.preview else "render")
+        self.g = FilterGraph(workdir)
+        first = self.variant(timeline.sections[0].clips[0].source)[0]
+        w, h, fps, _ = source_info(first)
+        self.fps = timeline.fps or fps
+        self.size = (timeline.width, timeline.height) if timeline.width and timeline.height else None
+
+    def variant(self, path):
+        """(file to read, offset) - the ingested mezzanine/proxy when there is one (media_ingest)"""
+        return resolve_source(path, self.purpose)
+
+    def input_size(self, ref, scale_input=True):
+        """(file size, decode size): previews scale inputs larger than the preview scale down"""
+        w, h, _, _ = source_info(self.variant(ref.source)[0])
+        if not self.preview or not scale_input:
+            return (w, h), (w, h)
+        sw, sh, _, _ = source_info(ref.source)
+        th = _even(sh * self.preview["scale"])
+        return (w, h), ((_even(w * th / h), th) if h > th else (w, h))
+
+    def clip_size(self, ref):
+        """Frame size after the clip's native effects (the output size when the timeline has none)"""
+        size = self.input_size(ref)[1]
+        for e in ref.effects:
+            if e.name in NATIVE_EFFECTS:
+                _, size = NATIVE_EFFECTS[e.name]("in", "out", "u", size, **e.params)
+        return size
+
+    def compile_clip(self, ref, size, scale_input=True):
+        g = self.g
+        src, off = self.variant(ref.source)
+        idx = g.add_input("-ss", f"{ref.start + off:.3f}", "-t", f"{ref.duration:.3f}", "-i", src)
+        lab = g.label("c")
+        g.add(f"[{idx}:v:0]setpts=PTS-STARTPTS[{lab}]")
+        size_in, cur = self.input_size(ref, scale_input)
+        if cur != size_in:
+            out = g.label("p")
+            g.add(f"[{lab}]scale={cur[0]}:{cur[1]}[{out}]")
+            lab = out
+        for e in ref.effects:
+            out = g.label("e")
+            stmts, cur = NATIVE_EFFECTS[e.name](lab, out, g.label("u"), cur, **e.params)
+            for stmt in stmts:
+                g.add(stmt)
+            lab = out
+        out = g.label("n")
+        g.add(f"[{lab}]fps={self.fps},scale={size[0]}:{size[1]},setsar=1,format=yuv420p[{out}]")
+        return out
+
+    def compile_section(self, section, size):
+        g = self.g
+        parts = [self.compile_clip(ref, size) for ref in section.clips]
+        lab = g.label("s")
+        if len(parts) == 1:
+            g.add(f"[{parts[0]}]null[{lab}]")
+        else:
+            g.add("".join(f"[{p}]" for p in parts) + f"concat=n={len(parts)}:v=1:a=0[{lab}]")
+
+        transition = section.transition or {}
+        if transition.get("type") == "fadein":
+            out = g.label("f")
+            g.add(f"[{lab}]fade=t=in:st=0:d={transition.get('duration', 1.0)}[{out}]")
+            lab = out
+
+        # Same pre-rasterized patches and windows as the MoviePy backend (frame_effects)
+        for patch, t0, t1 in overlay_windows(section.overlays, size, section.duration):
+            idx = g.patch_input(patch)
+            out = g.label("o")
+            g.add(f"[{lab}][{idx}:v]overlay={patch.x}:{patch.y}:enable='between(t,{t0:.3f},{t1:.3f})'[{out}]")
+            lab = out
+        return lab
+
+    def prerendered_section(self, section, size, index):
+        """Python fallback: render one section (video only) with MoviePy, use it as a clip"""
+        import render_moviepy
+        from decoder_pool import DecoderPool
+        path = os.path.join(self.g.workdir, f"section_{index}.mp4")
+        print(f"Section {index + 1}: no native equivalent for its effects, pre-rendering with MoviePy")
+        sources = DecoderPool.for_timeline(self.timeline)
+        try:
+            clip = render_moviepy.build_section(section, sources)
+            clip.write_videofile(path, fps=self.fps, codec="libx264", audio=False, preset="ultrafast",
+                                 ffmpeg_params=["-crf", "12"], logger=None)
+        finally:
+            sources.close()
+        # Already rendered at the preview scale
+        return self.compile_clip(ClipRef(path, 0.0, section.duration), size, scale_input=False)
+
+    def compile_video(self):
+        g = self.g
+        sections = self.timeline.sections
+        size = self.size or self.clip_size(sections[0].clips[0])
+        labels = [self.compile_section(s, size) if native_section(s) else self.prerendered_section(s, size, i)
+                  for i, s in enumerate(sections)]
+
+        lab = labels[0]
+        starts = self.timeline.section_starts()
+        for i in range(1, len(labels)):
+            out = g.label("j")
+            overlap = sections[i].overlap
+            if overlap:
+                kind = sections[i].transition.get("transition", "fade")
+                g.add(f"[{lab}][{labels[i]}]xfade=transition={kind}:duration={overlap:.3f}:offset={starts[i]:.3f}[{out}]")
+            else:
+                g.add(f"[{lab}][{labels[i]}]concat=n=2:v=1:a=0[{out}]")
+            lab = out
+        return lab
+
+    def audio_layer(self, label, start, volume=1.0, duration=None):
+        """Trim, level, resample and place one audio stream at `start` on the timeline"""
+        g = self.g
+        chain = []
+        if duration is not None:
+            chain.append(f"atrim=end={duration:.3f}")
+        chain.append("asetpts=PTS-STARTPTS")
+        if volume != 1.0:
+            chain.append(f"volume={volume}")
+        chain.append(f"aformat=sample_rates={SAMPLE_RATE}:channel_layouts=stereo")
+        if start > 0:
+            ms = int(round(start * 1000))
+            chain.append(f"adelay={ms}|{ms}")
+        out = g.label("a")
+        g.add(f"[{label}]" + ",".join(chain) + f"[{out}]")
+        return out
+
+    def compile_audio(self):
+        g = self.g
+        timeline = self.timeline
+        total = timeline.duration
+        source_layers, voices, tracks, ducked = [], [], [], []
+
+        for section, start in zip(timeline.sections, timeline.section_starts()):
+            t = start
+            for ref in section.clips:
+                src, off = self.variant(ref.source)
+                if ref.audio_volume > 0 and source_info(src)[3]:
+                    idx = g.add_input("-ss", f"{ref.start + off:.3f}", "-t", f"{ref.duration:.3f}", "-i", src)
+                    source_layers.append(self.audio_layer(f"{idx}:a:0", t, ref.audio_volume, ref.duration))
+                t += ref.duration
+
+        for section, start in zip(timeline.sections, timeline.voice_starts()):
+            if section.voice is not None:
+                v = section.voice
+                idx = g.add_input("-i", v.path)
+                voices.append(self.audio_layer(f"{idx}:a:0", start, v.volume, v.duration))
+
+        for track in timeline.audio_tracks:
+            if not os.path.exists(track.path):
+                print(f"Warning: {track.role} track not found: {track.path}")
+                continue
+            idx = g.add_input(*(["-stream_loop", "-1"] if track.loop else []), "-i", track.path)
+            length = total - track.start if track.loop else track.duration
+            layer = self.audio_layer(f"{idx}:a:0", track.start, track.volume, length)
+            (ducked if track.duck and voices else tracks).append(layer)
+
+        if ducked:
+            # Voices drive the compressor on the ducked tracks
+            mixed = g.label("vm")
+            g.add("".join(f"[{v}]" for v in voices) + f"amix=inputs={len(voices)}:normalize=0[{mixed}]")
+            keys = [g.label("vk") for _ in ducked]
+            out_voice = g.label("vo")
+            g.add(f"[{mixed}]asplit={len(ducked) + 1}[{out_voice}]" + "".join(f"[{k}]" for k in keys))
+            voices = [out_voice]
+            for layer, key in zip(ducked, keys):
+                out = g.label("d")
+                g.add(f"[{layer}][{key}]{DUCK_FILTER}[{out}]")
+                tracks.append(out)
+
+        layers = source_layers + voices + tracks
+        if not layers:
+            return None
+        out = g.label("mix")
+        g.add("".join(f"[{l}]" for l in layers) +
+              f"amix=inputs={len(layers)}:duration=longest:normalize=0,atrim=end={total:.3f}[{out}]")
+        return out
+
+def encoder_args(timeline, fps):
+    enc = {"codec": "libx264", "audio_codec": "aac"}
+    enc.update(timeline.encoder)
+    args = ["-c:v", enc["codec"]]
+    if enc.get("bitrate"):
+        args += ["-b:v", enc["bitrate"]]
+    if enc.get("preset"):
+        args += ["-preset", enc["preset"]]
+    params = list(enc.get("ffmpeg_params") or [])
+    if "-pix_fmt" not in params:
+        params += ["-pix_fmt", "yuv420p"]
+    args += params + ["-r", f"{fps}", "-c:a", enc["audio_codec"]]
+    return args
+
+def build_command(timeline, output_path, workdir):
+    compiler = TimelineCompiler(timeline, workdir)
+    video = compiler.compile_video()
+    audio = compiler.compile_audio()
+
+    script = os.path.join(workdir, "graph.txt")
+    with open(script, "w", encoding="utf-8") as f:
+        f.write(";\n".join(compiler.g.filters))
+
+    cmd = [find_ffmpeg(), "-y", "-hide_banner", "-loglevel", "error", "-stats"]
+    for args in compiler.g.inputs:
+        cmd += args
+    cmd += ["-filter_complex_script", script, "-map", f"[{video}]"]
+    if audio:
+        cmd += ["-map", f"[{audio}]"]
+    cmd += encoder_args(timeline, compiler.fps)
+    cmd += ["-t", f"{timeline.duration:.3f}", output_path]
+    return cmd
+
+@register_renderer("ffmpeg")
+def render(timeline, output_path, qa=False, keep_temp=False):
+    """Render in one ffmpeg process; falls back to MoviePy if the graph fails"""
+    workdir = tempfile.mkdtemp(prefix="timeline_")
+    try:
+        cmd = build_command(timeline, output_path, workdir)
+        print(f"FFmpeg render: {len(timeline.sections)} sections, {len(cmd)} args -> {output_path}")
+        subprocess.run(cmd, check=True)
+    except (subprocess.CalledProcessError, OSError, StopIteration, KeyError) as e:
+        print(f"⚠️ FFmpeg render failed ({e}), falling back to MoviePy")
+        import render_moviepy
+        return render_moviepy.render(timeline, output_path, qa=qa)
+    finally:
+        if not keep_temp:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if qa:
+        # Frames never pass through Python here, so QA runs on the finished file
+        from video_qa import analyze_video_quality
+        analyze_video_quality(output_path)
+    return output_path
+
+def compare(timeline, output_path):
+    """Render with both backends and print wall-clock times"""
+    import render_moviepy
+    base, ext = os.path.splitext(output_path)
+    times = {}
+    for name, fn in (("ffmpeg", render), ("moviepy", render_moviepy.render)):
+        t0 = time.perf_counter()
+        fn(timeline, f"{base}_{name}{ext}")
+        times[name] = time.perf_counter() - t0
+    print(f"ffmpeg {times['ffmpeg']:.1f}s vs moviepy {times['moviepy']:.1f}s "
+          f"({times['moviepy'] / max(times['ffmpeg'], 1e-6):.1f}x)")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python render_ffmpeg.py <plan.timeline.json> <output.mp4> [--compare | --preview]")
+        sys.exit(1)
+    plan = Timeline.load(sys.argv[1])
+    if "--compare" in sys.argv:
+        compare(plan, sys.argv[2])
+    elif "--preview" in sys.argv:
+        from preview import preview_timeline, preview_path
+        render(preview_timeline(plan), preview_path(sys.argv[2]))
+    else:
+        render(plan, sys.argv[2])
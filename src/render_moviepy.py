@@ -0,0 +1,391 @@
+"""
+MoviePy renderer for timeline.Timeline.
+
+Sources are cut with subclips; clip effects and
+overlays are looked up by name in frame_effects, where each clip's effects
+(and each section's overlays) run as one fused in-place pass, so a saved
+<name>.timeline.json renders without the engine that planned it.
+
+Sources are read through a decoder_pool.DecoderPool: several readers per
+file, each cut served by the reader whose playhead is closest before it.
+
+Audio is laid out on the timeline rather than per clip: source audio is
+placed where its clips land, each section's voice starts at section start -
+audio_lead (J/L-cuts), global tracks (BGM) are looped/cropped to the edit
+(duck=True dips them under the voices with a gain envelope),
+and the mix is trimmed to the picture.
+
+render(..., parallel=True) encodes every section (video only) in its own
+worker process with identical encoder settings, mixes the audio once in the
+parent, and joins the sections with the concat demuxer without re-encoding.
+Inline QA taps each section in its worker and the mix in the parent.
+With incremental=True the encoded sections are cached by content hash
+(section_cache), so a rerun after a small edit only encodes the sections
+whose inputs changed before the stream-copy join.
+"""
+import os
+import shutil
+import tempfile
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from timeline import Timeline, register_renderer
+from decoder_pool import DecoderPool
+
+# Overlap frame generation and encoding (pipelined_writer) instead of write_videofile
+PIPELINED_WRITER = True
+# Ducked tracks under a voice (render_ffmpeg uses sidechaincompress instead)
+DUCK_GAIN = 0.5
+DUCK_ATTACK = 0.02 # Seconds to dip before a voice starts
+DUCK_RELEASE = 0.4 # Seconds to come back after it ends
+AV_TOLERANCE = 0.05 # Seconds (beyond one frame) the joined picture may differ from the mix: AAC framing
+
+try:
+    from moviepy import AudioFileClip, concatenate_videoclips, CompositeVideoClip, CompositeAudioClip, vfx
+    MOVIEPY_V2 = True
+except ImportError:
+    from moviepy.editor import AudioFileClip, concatenate_videoclips, CompositeVideoClip, CompositeAudioClip
+    import moviepy.video.fx.all as vfx
+    MOVIEPY_V2 = False
+
+# Helpers for v1/v2 compatibility
+def subclip_compat(clip, start, end):
+    if MOVIEPY_V2:
+        return clip.subclipped(start, end)
+    else:
+        return clip.subclip(start, end)
+
+def set_audio_compat(clip, audio):
+    if MOVIEPY_V2:
+        return clip.with_audio(audio)
+    else:
+        return clip.set_audio(audio)
+
+def set_start_compat(clip, start):
+    if MOVIEPY_V2:
+        return clip.with_start(start)
+    else:
+        return clip.set_start(start)
+
+def volume_compat(audio, vol):
+    if MOVIEPY_V2:
+        return audio.with_volume_scaled(vol)
+    else:
+        return audio.volumex(vol)
+
+def loop_audio_compat(audio, duration):
+    if MOVIEPY_V2:
+        return audio.with_effects([vfx.Loop(duration=duration)])
+    else:
+        from moviepy.audio.fx.all import audio_loop
+        return audio_loop(audio, duration=duration)
+
+def fl_compat(clip, func):
+    if MOVIEPY_V2:
+        return clip.transform(func)
+    else:
+        return clip.fl(func)
+
+def fl_image_compat(clip, func):
+    if MOVIEPY_V2:
+        return clip.image_transform(func)
+    else:
+        return clip.fl_image(func)
+
+def fadein_compat(clip, duration):
+    if MOVIEPY_V2:
+        return clip.with_effects([vfx.FadeIn(duration)])
+    else:
+        return clip.fadein(duration)
+
+def crossfadein_compat(clip, duration):
+    if MOVIEPY_V2:
+        return clip.with_effects([vfx.CrossFadeIn(duration)])
+    else:
+        return clip.crossfadein(duration)
+
+def set_size_compat(clip, size):
+    """Frame filters that change the resolution must update the clip's metadata"""
+    try:
+        clip.size = size
+        if not MOVIEPY_V2:
+            clip.w, clip.h = size
+    except Exception as e:
+        print(f"Warning: Could not update clip metadata: {e}")
+    return clip
+
+# --- Effects and overlays: one fused frame_effects pass per clip / per section ---
+
+def apply_effects(clip, effects):
+    """All of a clip's effects as a single fl stage (frame_effects.FusedChain)"""
+    from frame_effects import build_chain
+    chain = build_chain(effects)
+    if chain is None:
+        return clip
+    size = tuple(clip.size)
+    out_size = chain.out_size(size)
+    clip = fl_compat(clip, lambda gf, t: chain(gf(t), t))
+    if out_size != size:
+        clip = set_size_compat(clip, out_size)
+    return clip
+
+def apply_overlays(clip, overlays):
+    """Every overlay of a section, pre-rasterized and blended in one in-place stage"""
+    from frame_effects import FusedChain, PatchTrack, overlay_windows
+    windows = overlay_windows(overlays, clip.size, clip.duration)
+    if not windows:
+        return clip
+    chain = FusedChain([PatchTrack(windows)])
+    return fl_compat(clip, lambda gf, t: chain(gf(t), t))
+
+def build_section(section, sources):
+    """Picture for one section (audio is mixed separately, see mix_audio)"""
+    parts = []
+    for ref in section.clips:
+        # Each cut comes from the pooled reader positioned closest before its start,
+        # on the ingested variant (source times shifted by its offset)
+        reader = sources.acquire(ref.source, ref.start, ref.end)
+        off = sources.offset(ref.source)
+        sub = subclip_compat(reader, ref.start + off, ref.end + off).without_audio()
+        parts.append(apply_effects(sub, ref.effects))
+
+    clip = parts[0] if len(parts) == 1 else concatenate_videoclips(parts)
+
+    transition = section.transition or {}
+    if transition.get("type") == "fadein":
+        clip = fadein_compat(clip, transition.get("duration", 1.0))
+
+    return apply_overlays(clip, section.overlays)
+
+def load_track(track, duration):
+    audio = AudioFileClip(track.path)
+    if track.loop:
+        audio = loop_audio_compat(audio, duration)
+    elif track.duration is not None and track.duration < audio.duration:
+        audio = subclip_compat(audio, 0, track.duration)
+    if track.volume != 1.0:
+        audio = volume_compat(audio, track.volume)
+    return audio
+
+def duck_compat(audio, intervals):
+    """Scale `audio` by DUCK_GAIN inside the voice intervals, with attack/release ramps"""
+    def gain(t):
+        t = np.asarray(t, dtype=np.float64)
+        depth = np.zeros_like(t)
+        for start, end in intervals:
+            attack = np.clip((t - (start - DUCK_ATTACK)) / DUCK_ATTACK, 0.0, 1.0)
+            release = np.clip((end + DUCK_RELEASE - t) / DUCK_RELEASE, 0.0, 1.0)
+            depth = np.maximum(depth, np.minimum(attack, release))
+        return 1.0 - depth * (1.0 - DUCK_GAIN)
+
+    def duck(gf, t):
+        frames = gf(t)
+        g = gain(t)
+        return frames * (g[:, None] if np.ndim(frames) == 2 else g)
+    return fl_compat(audio, duck)
+
+def mix_audio(timeline, sources, duration):
+    """Source audio + section voices (J/L-cut placed) + global tracks, trimmed to the picture"""
+    layers = []
+    for section, start in zip(timeline.sections, timeline.section_starts()):
+        t = start
+        for ref in section.clips:
+            src = sources.get(ref.source)
+            if ref.audio_volume > 0 and src.audio is not None:
+                off = sources.offset(ref.source)
+                audio = subclip_compat(src.audio, ref.start + off, ref.end + off)
+                if ref.audio_volume != 1.0:
+                    audio = volume_compat(audio, ref.audio_volume)
+                layers.append(set_start_compat(audio, t))
+            t += ref.duration
+
+    voiced = []
+    for section, start in zip(timeline.sections, timeline.voice_starts()):
+        if section.voice is not None:
+            voice = load_track(section.voice, duration)
+            voiced.append((start, start + voice.duration))
+            layers.append(set_start_compat(voice, start))
+
+    for track in timeline.audio_tracks:
+        try:
+            audio = load_track(track, duration - track.start)
+            if track.duck and voiced:
+                # Envelope in track time
+                audio = duck_compat(audio, [(s - track.start, e - track.start) for s, e in voiced])
+            layers.append(set_start_compat(audio, track.start))
+        except Exception as e:
+            print(f"Warning: Failed to load {track.role} track {track.path}: {e}")
+
+    if not layers:
+        return None
+    return subclip_compat(CompositeAudioClip(layers), 0, duration)
+
+def join_sections(timeline, clips):
+    """Butt-join sections, or lay them out on a composite when any of them crossfades"""
+    if len(clips) == 1:
+        return clips[0]
+    if not any(s.overlap for s in timeline.sections[1:]):
+        return concatenate_videoclips(clips)
+    layers = []
+    for i, (clip, section, start) in enumerate(zip(clips, timeline.sections, timeline.section_starts())):
+        if i > 0 and section.overlap:
+            clip = crossfadein_compat(clip, section.overlap)
+        layers.append(set_start_compat(clip, start))
+    return CompositeVideoClip(layers, size=clips[0].size)
+
+def build_clip(timeline, sources):
+    video = join_sections(timeline, [build_section(s, sources) for s in timeline.sections])
+    audio = mix_audio(timeline, sources, video.duration)
+    if audio is not None:
+        video = set_audio_compat(video, audio)
+    return video
+
+def write_video(clip, output_path, **kwargs):
+    if PIPELINED_WRITER:
+        from pipelined_writer import write_pipelined
+        return write_pipelined(clip, output_path, **kwargs)
+    clip.write_videofile(output_path, **kwargs)
+
+def write_kwargs(timeline):
+    kwargs = {"codec": "libx264", "audio_codec": "aac"}
+    kwargs.update(timeline.encoder)
+    if timeline.fps:
+        kwargs["fps"] = timeline.fps
+    return kwargs
+
+def _render_section(plan, index, path, qa=False):
+    """
+    Worker process: encode one section's picture with the timeline's encoder settings.
+    Returns (path, RenderQATap export or None).
+    """
+    timeline = Timeline.from_dict(plan)
+    sources = DecoderPool.for_timeline(timeline)
+    try:
+        clip = build_section(timeline.sections[index], sources)
+        qa_tap = None
+        if qa:
+            from qa_tap import RenderQATap
+            qa_tap = RenderQATap()
+            clip = qa_tap.attach(clip)
+        kwargs = write_kwargs(timeline)
+        kwargs.pop("audio_codec", None)
+        write_video(clip, path, audio=False, logger=None, **kwargs)
+        sources.report()
+    finally:
+        sources.close()
+    return path, qa_tap.export() if qa_tap is not None else None
+
+def render_parallel(timeline, output_path, workers=None, incremental=False, qa=False):
+    """
+    Sections in worker processes, audio mixed once, joined by the concat demuxer (no re-encode).
+    incremental=True keeps sections as content-hashed artifacts (section_cache) and only
+    renders the ones whose inputs changed since an earlier render.
+    qa=True taps every section in its worker and the mix in the parent (qa_tap); returns the report.
+    """
+    from media_utils import find_ffmpeg, av_length_mismatch
+    if not timeline.fps:
+        # Sections are only joinable (and frame-snappable) at one rate: the first source's exact one
+        sources = DecoderPool.for_timeline(timeline)
+        try:
+            fps = sources.fps(timeline.sections[0].clips[0].source)
+        finally:
+            sources.close()
+        timeline = Timeline.from_dict(timeline.to_dict())
+        timeline.fps = fps
+    # Each section encodes to whole frames; the mix is laid out on the same snapped starts
+    timeline.snap_to_frames()
+    workdir = tempfile.mkdtemp(prefix="sections_", dir=os.path.dirname(os.path.abspath(output_path)))
+    ext = os.path.splitext(output_path)[1] or ".mp4"
+    try:
+        plan = timeline.to_dict()
+        if incremental:
+            from section_cache import plan_sections, save_qa, load_qa
+            paths, todo = plan_sections(timeline, ext, qa=qa)
+            print(f"Incremental render: {len(paths) - len(todo)}/{len(paths)} sections unchanged")
+        else:
+            paths = [os.path.join(workdir, f"section_{i:03d}{ext}") for i in range(len(timeline.sections))]
+            todo = list(range(len(paths)))
+        parts = [None] * len(paths)
+        # Workers write next to the output; artifacts are published only once complete
+        targets = [os.path.join(workdir, f"section_{i:03d}{ext}") for i in todo]
+        if todo:
+            workers = max(1, min(workers or os.cpu_count() or 1, len(todo)))
+            print(f"Rendering {len(todo)} sections on {workers} processes...")
+            n = len(todo)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for i, (path, part) in zip(todo, pool.map(_render_section, [plan] * n, todo, targets, [qa] * n)):
+                    if path != paths[i]:
+                        shutil.move(path, paths[i] + ".part") # May cross filesystems
+                        os.replace(paths[i] + ".part", paths[i])
+                    if incremental and part is not None:
+                        save_qa(paths[i], part)
+                    parts[i] = part
+                    print(f"  section ready: {os.path.basename(paths[i])}")
+
+        qa_tap = None
+        if qa:
+            from qa_tap import RenderQATap
+            if incremental:
+                parts = [part if part is not None else load_qa(path) for part, path in zip(parts, paths)]
+            qa_tap = RenderQATap.from_sections(parts, timeline.section_starts(), timeline.duration)
+
+        audio_path = None
+        sources = DecoderPool.for_timeline(timeline)
+        try:
+            audio = mix_audio(timeline, sources, timeline.duration)
+            if audio is not None:
+                if qa_tap is not None:
+                    audio = qa_tap.attach_audio(audio)
+                audio_path = os.path.join(workdir, "mix.m4a")
+                audio.write_audiofile(audio_path, fps=44100, codec=write_kwargs(timeline)["audio_codec"], logger=None)
+        finally:
+            sources.close()
+
+        list_path = os.path.join(workdir, "concat.txt")
+        with open(list_path, "w", encoding="utf-8") as f:
+            for path in paths:
+                f.write("file '" + path.replace("'", "'\\''") + "'\n")
+        cmd = [find_ffmpeg(), "-y", "-v", "error", "-f", "concat", "-safe", "0", "-i", list_path]
+        if audio_path:
+            cmd += ["-i", audio_path, "-map", "0:v:0", "-map", "1:a:0"]
+        cmd += ["-c", "copy", "-movflags", "+faststart", output_path]
+        subprocess.run(cmd, check=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    drift = av_length_mismatch(output_path)
+    if drift is not None and abs(drift) > 1.0 / timeline.fps + AV_TOLERANCE:
+        print(f"Warning: {os.path.basename(output_path)} picture and audio lengths differ by {drift:+.3f}s")
+    if qa_tap is not None:
+        return qa_tap.finish(output_path, fps=timeline.fps or 30)
+    return None
+
+@register_renderer("moviepy")
+def render(timeline, output_path, qa=False, parallel=False, workers=None, incremental=False):
+    """
+    Render with MoviePy. qa=True measures the render inline (qa_tap) and saves its report.
+    parallel=True renders sections in worker processes (crossfaded timelines render sequentially).
+    incremental=True renders sections that way too, reusing cached section artifacts.
+    """
+    if (incremental or parallel and len(timeline.sections) > 1) and not any(s.overlap for s in timeline.sections[1:]):
+        # QA is measured in the section workers and merged, no decode of the finished file
+        render_parallel(timeline, output_path, workers, incremental=incremental, qa=qa)
+        return output_path
+
+    sources = DecoderPool.for_timeline(timeline)
+    try:
+        video = build_clip(timeline, sources)
+        qa_tap = None
+        if qa:
+            from qa_tap import RenderQATap
+            qa_tap = RenderQATap()
+            video = qa_tap.attach(video)
+        write_video(video, output_path, **write_kwargs(timeline))
+        if qa_tap is not None:
+            qa_tap.finish(output_path, fps=timeline.fps or 30)
+        sources.report()
+    finally:
+        sources.close()
+    return output_path
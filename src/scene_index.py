@@ -0,0 +1,124 @@
+"""
+Shared scene index: shot boundaries detected once per source and cached.
+
+Detection runs on a downscaled, frame-skipped decode, and the resulting
+scene list is cached by source fingerprint + detector parameters. Engines
+call get_scene_boundaries()/snap_to_boundary() to place cuts on real shot
+changes without re-running the detector.
+"""
+import bisect
+
+from media_utils import source_fingerprint, cache_path, load_json, save_json
+from media_ingest import resolve_source
+
+# Defaults tuned for screen recordings (subtle changes -> adaptive detector)
+DETECTOR = "adaptive"
+ADAPTIVE_THRESHOLD = 3.0
+CONTENT_THRESHOLD = 27.0
+MIN_SCENE_LEN = 15
+TARGET_WIDTH = 320 # Detection width after downscale
+FRAME_SKIP = 1     # Decode every (FRAME_SKIP + 1)-th frame
+
+def _scene_params(detector, threshold, min_scene_len, target_width, frame_skip):
+    if threshold is None:
+        threshold = ADAPTIVE_THRESHOLD if detector == "adaptive" else CONTENT_THRESHOLD
+    return {
+        "detector": detector,
+        "threshold": threshold,
+        "min_scene_len": min_scene_len,
+        "target_width": target_width,
+        "frame_skip": frame_skip
+    }
+
+def _scene_cache_path(video_path, params):
+    return cache_path("scenes", source_fingerprint(video_path), params)
+
+def detect_scenes(video_path, params):
+    """Run PySceneDetect with downscaling + frame skipping. Returns [(start, end), ...] in seconds."""
+    from scenedetect import open_video, SceneManager, AdaptiveDetector, ContentDetector
+
+    # Detect on the 360p proxy when the source was ingested (same timeline, shifted by offset)
+    proxy, offset = resolve_source(video_path, "analysis")
+    video = open_video(proxy)
+    manager = SceneManager()
+    width = video.frame_size[0]
+    manager.auto_downscale = False
+    manager.downscale = max(1, width // params["target_width"])
+
+    if params["detector"] == "adaptive":
+        detector = AdaptiveDetector(adaptive_threshold=params["threshold"], min_scene_len=params["min_scene_len"])
+    else:
+        detector = ContentDetector(threshold=params["threshold"], min_scene_len=params["min_scene_len"])
+    manager.add_detector(detector)
+
+    manager.detect_scenes(video, frame_skip=params["frame_skip"], show_progress=False)
+    return [(max(0.0, start.get_seconds() - offset), max(0.0, end.get_seconds() - offset))
+            for start, end in manager.get_scene_list()]
+
+def get_scenes(video_path, detector=DETECTOR, threshold=None, min_scene_len=MIN_SCENE_LEN,
+               target_width=TARGET_WIDTH, frame_skip=FRAME_SKIP, use_cache=True):
+    """Scene list [(start, end), ...] in seconds, computed at most once per source/params"""
+    params = _scene_params(detector, threshold, min_scene_len, target_width, frame_skip)
+    path = _scene_cache_path(video_path, params)
+
+    if use_cache:
+        cached = load_json(path)
+        if cached is not None:
+            print(f"Loading cached scenes ({len(cached['scenes'])} shots)...")
+            return [tuple(s) for s in cached["scenes"]]
+
+    print(f"Detecting scenes (downscaled to ~{target_width}px, frame_skip={frame_skip})...")
+    scenes = detect_scenes(video_path, params)
+    save_json(path, {"params": params, "scenes": scenes})
+    return scenes
+
+def load_scenes(video_path, detector=DETECTOR, threshold=None, min_scene_len=MIN_SCENE_LEN,
+                target_width=TARGET_WIDTH, frame_skip=FRAME_SKIP):
+    """Cached scene list, or None if detection has never run with these params (never decodes)"""
+    params = _scene_params(detector, threshold, min_scene_len, target_width, frame_skip)
+    cached = load_json(_scene_cache_path(video_path, params))
+    return [tuple(s) for s in cached["scenes"]] if cached is not None else None
+
+def load_scene_boundaries(video_path, **kwargs):
+    """Cached shot boundaries (cut times), or None if detection has never run for this source"""
+    params = _scene_params(kwargs.get("detector", DETECTOR), kwargs.get("threshold"),
+                           kwargs.get("min_scene_len", MIN_SCENE_LEN),
+                           kwargs.get("target_width", TARGET_WIDTH), kwargs.get("frame_skip", FRAME_SKIP))
+    cached = load_json(_scene_cache_path(video_path, params))
+    if cached is not None:
+        return boundaries_from_scenes(cached["scenes"])
+
+    # The single-decode analysis pass also records shot changes
+    from analysis_pipeline import load_analysis_bundle, bundle_result
+    scenes = bundle_result(load_analysis_bundle(video_path), "scenes")
+    if scenes:
+        return list(scenes["cuts"])
+    return None
+
+def get_scene_boundaries(video_path, **kwargs):
+    """Sorted shot boundary times (scene starts, excluding 0). Detects on cache miss."""
+    return boundaries_from_scenes(get_scenes(video_path, **kwargs))
+
+def boundaries_from_scenes(scenes):
+    return sorted(start for start, _ in scenes if start > 0)
+
+def snap_to_boundary(t, boundaries, max_shift=1.0):
+    """Move `t` to the nearest shot boundary if one lies within `max_shift` seconds"""
+    if not boundaries:
+        return t
+    i = bisect.bisect_left(boundaries, t)
+    best = t
+    best_dist = max_shift
+    for j in (i - 1, i):
+        if 0 <= j < len(boundaries):
+            dist = abs(boundaries[j] - t)
+            if dist <= best_dist:
+                best, best_dist = boundaries[j], dist
+    return best
+
+def snap_segment(start, duration, boundaries, video_duration, max_shift=1.0):
+    """Snap a cut's start to a shot boundary while keeping it inside the source"""
+    snapped = snap_to_boundary(start, boundaries, max_shift)
+    if snapped < 0 or snapped + duration > video_duration:
+        return start
+    return snapped
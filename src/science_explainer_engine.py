@@ -1,7 +1,8 @@
 import os
 import sys
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
+from font_registry import render_text_block
 import math
 
 try:
@@ -31,50 +32,11 @@ def create_text_clip_compat(text, fontsize=70, color='white', font='Arial', dura
     """
     Creates a TextClip compatible with MoviePy v1 and v2.
     Uses PIL to generate text image to avoid ImageMagick dependency issues.
+    The CJK font is resolved once by font_registry and the rasterized block is
+    memoized, so repeated calls never probe fonts or touch the filesystem.
     """
-    # Create text image using PIL
-    # Estimate size
-    try:
-        # Try to use a font that supports Chinese if possible, otherwise default
-        # Windows: msyh.ttc (Microsoft YaHei), SimHei.ttf
-        font_path = "arial.ttf" # Default
-        if sys.platform == "win32":
-             # Common Chinese fonts on Windows
-             possible_fonts = ["msyh.ttc", "simhei.ttf", "arial.ttf"]
-             for f in possible_fonts:
-                 try:
-                     # Check if we can load it (requires path or system look up, PIL does system lookup well)
-                     ImageFont.truetype(f, fontsize)
-                     font_path = f
-                     break
-                 except:
-                     continue
-        
-        pil_font = ImageFont.truetype(font_path, fontsize)
-    except IOError:
-        pil_font = ImageFont.load_default()
-
-    # Get text size
-    left, top, right, bottom = pil_font.getbbox(text)
-    w = right - left
-    h = bottom - top
-    
-    # Add some padding
-    w += 40
-    h += 40
-
-    # Create image
-    if bg_color:
-        img = Image.new('RGBA', (w, h), bg_color)
-    else:
-        img = Image.new('RGBA', (w, h), (0, 0, 0, 0))
-    
-    draw = ImageDraw.Draw(img)
-    # Draw text centered
-    draw.text(((w - (right-left))/2, (h - (bottom-top))/2 - top), text, font=pil_font, fill=color)
-
-    # Convert to numpy array for MoviePy
-    img_np = np.array(img)
+    # Convert to numpy array for MoviePy (copy: the memoized block is read-only)
+    img_np = np.array(render_text_block(text, fontsize, fill=color, bg_color=bg_color, padding=20))
     
     # Create clip
     if MOVIEPY_V2:
@@ -0,0 +1,98 @@
+"""
+Content-hashed section artifacts for incremental re-renders.
+
+Every rendered section (picture only, see render_moviepy.render_parallel) is
+kept under ../data/cache/sections/ as
+
+    <key>_default.mp4
+    <key>_default.qa.npz    inline QA measurements of that render (qa_tap)
+
+where the key hashes everything that decides its frames:
+
+    section    clip windows, effects, overlays (caption text, word timings),
+               transition, and the voice line (tts_cache paths are already
+               keyed by text / voice / rate / pitch)
+    sources    fingerprint of each source and of the ingested variant read
+               (media_ingest: mezzanine, or the proxy for previews)
+    encoder    the timeline's encoder settings, fps, size and preview meta
+
+Editing one line of an engine config therefore only re-renders the sections
+whose inputs changed; unchanged ones are reused and everything is joined again
+by stream copy. Planning metadata (Section.meta: text, scores) is not part of
+the key. Bump RENDER_VERSION when a change to the renderer or the frame
+effects alters pixels.
+"""
+import os
+import json
+import hashlib
+from dataclasses import asdict
+
+import numpy as np
+
+from media_utils import cache_path, source_fingerprint
+from media_ingest import resolve_source
+
+RENDER_VERSION = 1
+
+def _sources(timeline, section):
+    purpose = "preview" if timeline.meta.get("preview") else "edit"
+    sources = {}
+    for ref in section.clips:
+        if ref.source not in sources:
+            variant = resolve_source(ref.source, purpose)[0]
+            sources[ref.source] = [source_fingerprint(ref.source),
+                                   source_fingerprint(variant) if variant != ref.source else None]
+    return sources
+
+def section_key(timeline, index):
+    """Content hash of one section's rendered picture"""
+    section = asdict(timeline.sections[index])
+    section.pop("meta", None)
+    blob = json.dumps({
+        "version": RENDER_VERSION,
+        "section": section,
+        "sources": _sources(timeline, timeline.sections[index]),
+        "encoder": timeline.encoder,
+        "fps": timeline.fps,
+        "size": [timeline.width, timeline.height],
+        "preview": timeline.meta.get("preview"),
+    }, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()[:16]
+
+def artifact_path(timeline, index, ext=".mp4"):
+    return cache_path("sections", section_key(timeline, index), ext=ext)
+
+def qa_path(path):
+    return os.path.splitext(path)[0] + ".qa.npz"
+
+def save_qa(path, part):
+    """Keep a section's RenderQATap.export() next to its artifact"""
+    samples = np.array([[t, blur, bright, np.nan if motion is None else motion]
+                        for t, blur, bright, motion in part["samples"]], dtype=np.float64).reshape(-1, 4)
+    arrays = {k: part[k] for k in ("first_gray", "last_gray") if part[k] is not None}
+    tmp = qa_path(path) + ".part.npz"
+    np.savez_compressed(tmp, samples=samples, size=np.array(part["size"]),
+                        duration=np.array(part["duration"]), **arrays)
+    os.replace(tmp, qa_path(path))
+
+def load_qa(path):
+    """The export saved with a section artifact, or None"""
+    try:
+        with np.load(qa_path(path)) as data:
+            samples = [(t, blur, bright, None if np.isnan(motion) else motion)
+                       for t, blur, bright, motion in data["samples"].tolist()]
+            return {"samples": samples, "size": data["size"].tolist(), "duration": float(data["duration"]),
+                    "first_gray": data["first_gray"] if "first_gray" in data else None,
+                    "last_gray": data["last_gray"] if "last_gray" in data else None}
+    except (OSError, ValueError, KeyError):
+        return None
+
+def plan_sections(timeline, ext=".mp4", qa=False):
+    """
+    (artifact paths, indexes of the sections that still have to be rendered).
+    With qa=True an artifact without saved QA measurements counts as missing.
+    """
+    paths = [artifact_path(timeline, i, ext) for i in range(len(timeline.sections))]
+    missing = [i for i, path in enumerate(paths)
+               if not os.path.exists(path) or qa and not os.path.exists(qa_path(path))]
+    return paths, missing
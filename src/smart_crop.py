@@ -0,0 +1,191 @@
+"""
+Subject-tracking smart crop for vertical (9:16) output.
+
+Alternative to the blurred letterbox (reframe.py): instead of shrinking the
+whole landscape frame into a band, a full-height 9:16 window follows the
+subject.
+
+    analysis   SubjectAnalyzer (analysis_pipeline) scores saliency, motion and
+               faces on a 320px proxy every 0.25s, in the shared single-decode
+               pass (shot cuts come from the same pass)
+    path       per shot: low-confidence samples hold the shot's anchor, then a
+               median + moving average, a deadzone and a pan speed limit; shots
+               that barely move get a locked-off crop; cuts reset the path
+    cache      ../data/cache/smartcrop/<fingerprint>_<params>.json
+    render     a plain crop + resize. Planners bake the clip's part of the path
+               into the effect params (Effect("smart_crop_9_16", {"path": ...})),
+               so renders never touch the analysis again.
+
+Analysis and path solving run once per source; every later render and cover
+reads the cached path.
+"""
+import bisect
+
+import cv2
+import numpy as np
+
+from media_utils import source_fingerprint, cache_path, load_json, save_json
+
+OUT_SIZE = (720, 1280)
+MIN_WEIGHT = 0.08     # Samples below this confidence hold the shot's anchor
+MEDIAN_TAPS = 5       # Outlier rejection (samples)
+SMOOTH_TAPS = 7       # Moving average (samples)
+DEADZONE = 0.04       # Ignore subject moves smaller than this (fraction of width)
+MAX_SPEED = 0.25      # Max pan speed (fraction of width per second)
+MAX_EXPR_POINTS = 24  # Keyframes per clip baked into plans / ffmpeg expressions
+
+def _path_params():
+    return {"min_weight": MIN_WEIGHT, "median": MEDIAN_TAPS, "smooth": SMOOTH_TAPS,
+            "deadzone": DEADZONE, "max_speed": MAX_SPEED}
+
+def _filter(x, taps, reducer):
+    if len(x) < 3 or taps < 2:
+        return x
+    taps = min(taps, len(x) if len(x) % 2 else len(x) - 1)
+    pad = taps // 2
+    windows = np.lib.stride_tricks.sliding_window_view(np.pad(x, pad, mode="edge"), taps)
+    return reducer(windows, axis=1)
+
+def solve_shot(times, cx, weight):
+    """Smoothed crop centers for the samples of one shot"""
+    x = np.asarray(cx, dtype=np.float64)
+    wgt = np.asarray(weight, dtype=np.float64)
+    confident = wgt >= MIN_WEIGHT
+    anchor = float(np.median(x[confident])) if confident.any() else 0.5
+    x = np.where(confident, x, anchor)
+    x = _filter(x, MEDIAN_TAPS, np.median)
+    x = _filter(x, SMOOTH_TAPS, np.mean)
+
+    if np.ptp(x) <= 2 * DEADZONE:
+        # Static shot: a locked-off crop reads better than micro-pans
+        return np.full(len(x), float(np.median(x)))
+
+    out = np.empty(len(x))
+    out[0] = x[0]
+    for i in range(1, len(x)):
+        d = x[i] - out[i - 1]
+        d = 0.0 if abs(d) <= DEADZONE else d - np.sign(d) * DEADZONE
+        step = MAX_SPEED * (times[i] - times[i - 1])
+        out[i] = out[i - 1] + float(np.clip(d, -step, step))
+    return out
+
+def solve_path(samples, cuts, duration):
+    """Split subject samples at shot cuts and solve each shot independently"""
+    bounds = [0.0] + [c for c in cuts if 0 < c < duration] + [duration]
+    shots = []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        inside = [s for s in samples if start <= s["time"] < end]
+        if not inside:
+            shots.append({"start": start, "end": end, "times": [start], "cx": [0.5]})
+            continue
+        times = [s["time"] for s in inside]
+        cx = solve_shot(times, [s["cx"] for s in inside], [s["weight"] for s in inside])
+        shots.append({"start": round(start, 3), "end": round(end, 3), "times": times,
+                      "cx": [round(float(v), 4) for v in cx]})
+    return shots
+
+class CropPath:
+    """Cached per-source crop path: center_at(t) -> horizontal center (0..1)"""
+
+    def __init__(self, data):
+        self.shots = data["shots"]
+        self.starts = [s["start"] for s in self.shots]
+
+    def center_at(self, t):
+        i = max(0, bisect.bisect_right(self.starts, t) - 1)
+        shot = self.shots[i]
+        return float(np.interp(t, shot["times"], shot["cx"]))
+
+    def keyframes(self, start, end, max_points=MAX_EXPR_POINTS):
+        """[[t, cx], ...] for a clip (t relative to its start), simplified to <= max_points"""
+        times = {start, end}
+        for shot in self.shots:
+            if shot["end"] <= start or shot["start"] >= end:
+                continue
+            times.update(t for t in shot["times"] if start < t < end)
+            if start < shot["start"] < end:
+                # Hard cut inside the clip: the crop jumps with it
+                times.update((shot["start"] - 1e-3, shot["start"]))
+        points = [[round(t - start, 3), round(self.center_at(t), 4)] for t in sorted(times)]
+
+        tolerance = 0.005
+        simplified = simplify(points, tolerance)
+        while len(simplified) > max_points:
+            tolerance *= 2
+            simplified = simplify(points, tolerance)
+        return simplified
+
+def simplify(points, tolerance):
+    """Drop keyframes that linear interpolation between their neighbours reproduces"""
+    if len(points) <= 2:
+        return points
+    kept = [points[0]]
+    for i in range(1, len(points) - 1):
+        (t0, x0), (t1, x1), (t2, x2) = kept[-1], points[i], points[i + 1]
+        predicted = x0 + (x2 - x0) * (t1 - t0) / (t2 - t0) if t2 > t0 else x2
+        if abs(predicted - x1) > tolerance:
+            kept.append(points[i])
+    kept.append(points[-1])
+    return kept
+
+def _crop_cache_path(video_path):
+    return cache_path("smartcrop", source_fingerprint(video_path), _path_params())
+
+def load_crop_path(video_path):
+    """Cached crop path, or None (never decodes)"""
+    data = load_json(_crop_cache_path(video_path))
+    return CropPath(data) if data else None
+
+def get_crop_path(video_path):
+    """Crop path for a source; runs the subject analysis on the first call only"""
+    path = _crop_cache_path(video_path)
+    data = load_json(path)
+    if data is None:
+        from analysis_pipeline import get_analysis_bundle, bundle_result, SubjectAnalyzer, SceneChangeAnalyzer
+        bundle = get_analysis_bundle(video_path, [SubjectAnalyzer(), SceneChangeAnalyzer()])
+        samples = bundle_result(bundle, "subject") or []
+        cuts = (bundle_result(bundle, "scenes") or {}).get("cuts", [])
+        data = {"params": _path_params(), "shots": solve_path(samples, cuts, bundle["duration"])}
+        save_json(path, data)
+        print(f"Smart crop path saved: {path} ({len(data['shots'])} shots)")
+    return CropPath(data)
+
+# --- Render-time application ---
+
+def crop_window(w, h, aspect=OUT_SIZE[0] / OUT_SIZE[1]):
+    """(crop_w, crop_h) of the largest `aspect` window inside a w x h frame"""
+    if w / h > aspect:
+        return int(round(h * aspect)), h
+    return w, int(round(w / aspect))
+
+def crop_left(cx, w, crop_w):
+    return int(np.clip(round(cx * w - crop_w / 2), 0, w - crop_w))
+
+def interp_path(path, t):
+    """Crop center at clip time t from baked [[t, cx], ...] keyframes"""
+    if len(path) == 1:
+        return path[0][1]
+    return float(np.interp(t, [p[0] for p in path], [p[1] for p in path]))
+
+def smart_crop_frame(frame, cx, out_size=OUT_SIZE, dst=None):
+    """Full-height crop centered on cx, resized to out_size (into dst when given)"""
+    h, w = frame.shape[:2]
+    out_w, out_h = out_size
+    crop_w, crop_h = crop_window(w, h, out_w / out_h)
+    left = crop_left(cx, w, crop_w)
+    top = (h - crop_h) // 2
+    region = frame[top:top + crop_h, left:left + crop_w, :3]
+    interp = cv2.INTER_AREA if out_w < crop_w else cv2.INTER_LINEAR
+    return cv2.resize(region, (out_w, out_h), dst=dst, interpolation=interp)
+
+def crop_x_expr(path, w, crop_w):
+    """ffmpeg crop `x` expression: the baked path, piecewise linear in t"""
+    pts = [(t, crop_left(cx, w, crop_w)) for t, cx in path]
+    expr = str(pts[-1][1])
+    for (t0, x0), (t1, x1) in reversed(list(zip(pts[:-1], pts[1:]))):
+        if t1 <= t0 or x0 == x1:
+            seg = str(x0)
+        else:
+            seg = f"{x0}+{x1 - x0}*(t-{t0})/{t1 - t0:.3f}"
+        expr = f"if(lt(t,{t1}),{seg},{expr})"
+    return expr
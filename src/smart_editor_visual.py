@@ -2,84 +2,46 @@ import os
 import json
 import asyncio
 import numpy as np
-import cv2
-import easyocr
-import edge_tts
-import torch
-# MoviePy v2 compatibility
-try:
-    from moviepy import VideoFileClip, concatenate_videoclips, CompositeAudioClip, AudioFileClip
-except ImportError:
-    from moviepy.editor import VideoFileClip, concatenate_videoclips, CompositeAudioClip, AudioFileClip
+from timeline import Timeline, Section, ClipRef, AudioTrack, render_timeline
+from media_ingest import prepare_source
+from keyframe_index import planning_index
+from tts_cache import get_voice
+from edit_plan import DRY_RUN
 
 # --- 配置 ---
 VIDEO_FILE = "ai数学助手开发过程.mp4"
 OUTPUT_FILE = "final_video_visual.mp4"
 ANALYSIS_FILE = "video_analysis.json"
 CLIPS_FILE = "clips.json"
-TEMP_AUDIO_DIR = "temp_audio"
 VOICE = "zh-CN-YunxiNeural"
 
-# 检查 CUDA
-USE_GPU = torch.cuda.is_available()
-print(f"使用 GPU 加速 OCR: {USE_GPU}")
+async def generate_tts(text, dry_run=False):
+    """TTS 配音：每句只合成一次 (tts_cache)；dry run 只取缓存时长或按字数估算"""
+    return await get_voice(text, VOICE, dry_run=dry_run)
 
-# 初始化 EasyOCR
-reader = easyocr.Reader(['en', 'ch_sim'], gpu=USE_GPU)
-
-async def generate_tts(text, output_file):
-    """生成 TTS 音频"""
-    communicate = edge_tts.Communicate(text, VOICE)
-    await communicate.save(output_file)
-
-def analyze_video(video_path, interval=2.0):
+def analyze_video(video_path, interval=2.0, dry_run=False):
     """
     分析视频内容：每隔 interval 秒提取一帧并识别文字
     """
+    # OpenCV 分析管线只在需要 OCR 时加载
+    from analysis_pipeline import get_analysis_bundle, load_analysis_bundle, bundle_result, default_analyzers
     if os.path.exists(ANALYSIS_FILE):
         print(f"发现已有分析结果 {ANALYSIS_FILE}，直接加载...")
         with open(ANALYSIS_FILE, 'r', encoding='utf-8') as f:
             return json.load(f)
 
-    print(f"开始分析视频 (间隔 {interval}s)... 这可能需要一点时间")
-    cap = cv2.VideoCapture(video_path)
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    duration = total_frames / fps
-    
-    results = []
-    
-    current_sec = 0
-    while current_sec < duration:
-        # 跳转到指定时间
-        cap.set(cv2.CAP_PROP_POS_MSEC, current_sec * 1000)
-        ret, frame = cap.read()
-        if not ret:
-            break
-            
-        # 缩小图片以加快 OCR (可选)
-        # frame = cv2.resize(frame, (0, 0), fx=0.5, fy=0.5)
-        
-        try:
-            # EasyOCR 识别
-            # detail=0 只返回文本列表
-            text_list = reader.readtext(frame, detail=0)
-            
-            # 简单的图像哈希 (判断画面变化) - 这里暂时只存 OCR 结果
-            # 也可以加 perceptual hash
-            
-            results.append({
-                "timestamp": round(current_sec, 2),
-                "text": text_list
-            })
-            print(f"已分析: {current_sec:.1f}s / {duration:.1f}s -> 识别到 {len(text_list)} 个词")
-            
-        except Exception as e:
-            print(f"分析出错 ({current_sec}s): {e}")
+    if dry_run:
+        # 只读缓存的分析包，绝不解码
+        ocr = bundle_result(load_analysis_bundle(video_path), "ocr")
+        if ocr is None:
+            print("Dry run: 没有缓存的 OCR 分析结果，不用画面文字匹配")
+        return [{"timestamp": round(item["time"], 2), "text": item["words"]} for item in ocr or []]
 
-        current_sec += interval
-    
-    cap.release()
+    print(f"开始分析视频 (间隔 {interval}s)... 这可能需要一点时间")
+    # 单次解码分析管线：OCR 与场景/清晰度/封面等分析共用一次解码，结果进入同一个缓存包
+    bundle = get_analysis_bundle(video_path, default_analyzers(ocr_interval=interval))
+    results = [{"timestamp": round(item["time"], 2), "text": item["words"]}
+               for item in bundle_result(bundle, "ocr")]
     
     # 保存结果
     with open(ANALYSIS_FILE, 'w', encoding='utf-8') as f:
@@ -87,28 +49,49 @@ def analyze_video(video_path, interval=2.0):
         
     return results
 
-def find_best_segment(analysis_data, keywords, target_duration, video_duration, used_segments):
+def find_best_segment(analysis_data, keywords, target_duration, video_duration, used_segments, asr_timeline=None, modality="ocr"):
     """
     根据关键词寻找最佳片段
+    modality: "ocr" (画面文字) / "asr" (语音转写) / "both" (两者得分相加)
     """
+    if modality in ("asr", "both") and asr_timeline is None:
+        modality = "ocr"
+
     # 1. 给每个时间点打分
-    scores = [] # (timestamp, score)
-    
-    for frame in analysis_data:
-        ts = frame['timestamp']
-        text_content = " ".join(frame['text']).lower()
-        
-        score = 0
-        match_count = 0
-        for kw in keywords:
-            kw = kw.lower()
-            if kw in text_content:
-                score += 1
-                match_count += 1
-        
-        # 额外加分：如果关键词多，分数高
-        if match_count > 0:
-            scores.append((ts, score))
+    ocr_scores = {} # timestamp -> score
+
+    if modality in ("ocr", "both"):
+        for frame in analysis_data:
+            ts = frame['timestamp']
+            text_content = " ".join(frame['text']).lower()
+
+            score = 0
+            for kw in keywords:
+                kw = kw.lower()
+                if kw in text_content:
+                    score += 1
+
+            # 额外加分：如果关键词多，分数高
+            if score > 0:
+                ocr_scores[ts] = score
+
+    if modality in ("asr", "both"):
+        # 语音命中：以 ts 为开始的窗口内说到的关键词数 (预计算索引，二分查找)
+        from asr_timeline import keyword_hit_times
+        hit_times = [np.sort(keyword_hit_times(asr_timeline, kw)) for kw in keywords]
+        candidate_ts = set(ocr_scores)
+        for hits in hit_times:
+            candidate_ts.update(round(float(h), 2) for h in hits)
+        scores = []
+        for ts in candidate_ts:
+            asr_score = sum(1 for hits in hit_times
+                            if np.searchsorted(hits, ts + target_duration) > np.searchsorted(hits, ts))
+            total = ocr_scores.get(ts, 0) + asr_score
+            if total > 0:
+                scores.append((ts, total))
+        scores.sort(key=lambda x: x[0])
+    else:
+        scores = list(ocr_scores.items())
     
     # 按分数排序
     scores.sort(key=lambda x: x[1], reverse=True)
@@ -165,9 +148,6 @@ def find_best_segment(analysis_data, keywords, target_duration, video_duration,
     return best_start, best_start + target_duration, best_score
 
 async def main():
-    if not os.path.exists(TEMP_AUDIO_DIR):
-        os.makedirs(TEMP_AUDIO_DIR)
-
     # 1. 准备资源
     if not os.path.exists(VIDEO_FILE):
         # 查找 mp4
@@ -183,18 +163,29 @@ async def main():
         video_path = VIDEO_FILE
         
     print(f"使用视频: {video_path}")
+    if not DRY_RUN:
+        # 一次性转码：分析用 360p 代理 + 渲染用恒定帧率中间文件（按指纹缓存）
+        prepare_source(video_path)
     
     # 2. 视觉分析 (OCR)
-    analysis_data = analyze_video(video_path, interval=2.0)
+    analysis_data = analyze_video(video_path, interval=2.0, dry_run=DRY_RUN)
+
+    # 2.1 语音分析 (ASR 时间轴，与 OCR 并列的第二匹配信号)
+    try:
+        from asr_timeline import build_asr_timeline, load_asr_timeline
+        asr_data = load_asr_timeline(video_path) if DRY_RUN else build_asr_timeline(video_path)
+    except Exception as e:
+        print(f"语音转写不可用，仅使用 OCR 匹配: {e}")
+        asr_data = None
     
     # 3. 加载文案
     with open(CLIPS_FILE, 'r', encoding='utf-8') as f:
         clips_data = json.load(f)
 
-    original_video = VideoFileClip(video_path)
-    video_duration = original_video.duration
+    # 关键帧索引 (只解封装，按指纹缓存)：不打开解码器即可拿到时长
+    video_duration = planning_index(video_path).duration
     
-    final_clips = []
+    timeline = Timeline(encoder={"codec": "libx264", "audio_codec": "aac"})
     used_segments = [] # (start, end)
     
     print("\n开始智能匹配...")
@@ -203,61 +194,34 @@ async def main():
         text = clip['text']
         keywords = clip.get('keywords', [])
         
-        # 生成语音
-        audio_path = os.path.join(TEMP_AUDIO_DIR, f"visual_clip_{i}.mp3")
-        await generate_tts(text, audio_path)
-        audioclip = AudioFileClip(audio_path)
-        duration = audioclip.duration
+        # 生成语音 (时长来自缓存的合成结果)
+        voice = await generate_tts(text, dry_run=DRY_RUN)
+        audio_path, duration = voice["path"], voice["duration"]
         
         print(f"\n片段 {i+1}: '{text[:15]}...' (时长 {duration:.1f}s)")
         print(f"  关键词: {keywords}")
         
-        # 寻找最佳片段
-        start, end, score = find_best_segment(analysis_data, keywords, duration, video_duration, used_segments)
+        # 寻找最佳片段 (画面文字 + 语音)
+        modality = clip.get('match', "both" if asr_data else "ocr")
+        start, end, score = find_best_segment(analysis_data, keywords, duration, video_duration, used_segments,
+                                              asr_timeline=asr_data, modality=modality)
         
         print(f"  -> 匹配结果: {start:.1f}s - {end:.1f}s (匹配分: {score})")
         
         used_segments.append((start, end))
         
-        # 剪辑
-        # MoviePy v2 check
-        if hasattr(original_video, 'subclipped'):
-            video_sub = original_video.subclipped(start, end)
-        else:
-            video_sub = original_video.subclip(start, end)
-            
-        # 音频处理
-        if original_video.audio:
-             # MoviePy v2 compatibility for volumex
-             try:
-                 original_audio = video_sub.audio.volumex(0.1) 
-             except AttributeError:
-                 if hasattr(video_sub.audio, 'multiply_volume'):
-                     original_audio = video_sub.audio.multiply_volume(0.1)
-                 else:
-                     # fallback
-                     original_audio = video_sub.audio
-             
-             final_audio = CompositeAudioClip([original_audio, audioclip])
-        else:
-             final_audio = audioclip
-             
-        if hasattr(video_sub, 'with_audio'):
-            video_sub = video_sub.with_audio(final_audio)
-        else:
-            video_sub = video_sub.set_audio(final_audio)
-            
-        final_clips.append(video_sub)
+        # 原声降低音量保留做背景 + TTS 配音
+        timeline.sections.append(Section(
+            clips=[ClipRef(video_path, start, end, audio_volume=0.1)],
+            voice=AudioTrack(audio_path, duration=end - start),
+            meta={"text": text, "keywords": keywords, "score": score, "match": modality,
+                  "duration_source": voice["duration_source"]}
+        ))
         
     # 4. 合成
     print("\n正在合成最终视频...")
-    final_video = concatenate_videoclips(final_clips)
-    final_video.write_videofile(OUTPUT_FILE, codec='libx264', audio_codec='aac')
-    print(f"完成！请查看: {OUTPUT_FILE}")
-    
-    original_video.close()
-    for c in final_clips:
-        c.close()
+    output_path = render_timeline(timeline, OUTPUT_FILE)
+    print(f"完成！请查看: {output_path}")
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,226 @@
+"""
+Timeline intermediate representation (an edit decision list).
+
+Engines plan an edit as a Timeline instead of building MoviePy graphs
+directly; pluggable renderers turn it into a file. Because the plan is plain
+data it can be inspected, saved as JSON, diffed, cached per section and
+handed to whichever backend is fastest for it.
+
+    Timeline
+      sections[]            consecutive blocks on the video track
+        clips[]             ClipRef: source range + effects + source-audio level
+        overlays[]          Overlay: subtitles/captions, times relative to the section
+        voice               AudioTrack placed at section start - audio_lead
+        audio_lead          J-cut (> 0, voice leads the picture) / L-cut (< 0)
+        transition          {"type": "fadein", "duration": 1.0} or
+                            {"type": "crossfade", "duration": 0.5} (overlaps the previous section)
+      audio_tracks[]        global tracks (BGM), timeline time; duck=True ducks under the voices
+      width/height/fps      output format (None = source)
+      encoder               codec, bitrate, preset, ffmpeg_params ...
+
+Renderers register with @register_renderer("name") and are loaded lazily by
+render_timeline(timeline, output_path, backend="moviepy"). preview=True (or
+YUNSHU_PREVIEW=1) renders a reduced copy instead (see preview.py); dry runs
+(edit_plan.py) only write the plan.
+"""
+import os
+import json
+import importlib
+from dataclasses import dataclass, field, asdict
+from typing import List, Optional
+
+@dataclass
+class Effect:
+    name: str
+    params: dict = field(default_factory=dict)
+
+@dataclass
+class ClipRef:
+    source: str
+    start: float
+    end: float
+    effects: List[Effect] = field(default_factory=list)
+    audio_volume: float = 0.0 # Level of the source's own audio (0 = muted)
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+@dataclass
+class Overlay:
+    kind: str # "subtitle" | "karaoke" | "caption" | "boxed"
+    text: str
+    start: float = 0.0 # Relative to the section start
+    end: Optional[float] = None # None = until the section ends
+    style: dict = field(default_factory=dict)
+
+@dataclass
+class AudioTrack:
+    path: str
+    start: float = 0.0 # Timeline time (global tracks only; voices are placed by their section)
+    volume: float = 1.0
+    loop: bool = False # Loop (or crop) to the timeline duration
+    duration: Optional[float] = None # Truncate to this length
+    role: str = "voice" # "voice" | "bgm" | "sfx"
+    duck: bool = False # Dip under the section voices (ffmpeg: sidechaincompress, MoviePy: gain envelope)
+
+@dataclass
+class Section:
+    clips: List[ClipRef] = field(default_factory=list)
+    overlays: List[Overlay] = field(default_factory=list)
+    voice: Optional[AudioTrack] = None
+    audio_lead: float = 0.0
+    transition: Optional[dict] = None
+    meta: dict = field(default_factory=dict)
+
+    @property
+    def duration(self):
+        return sum(c.duration for c in self.clips)
+
+    @property
+    def overlap(self):
+        """Seconds this section overlaps the previous one (crossfade)"""
+        if self.transition and self.transition.get("type") == "crossfade":
+            return min(float(self.transition.get("duration", 0.5)), self.duration)
+        return 0.0
+
+@dataclass
+class Timeline:
+    sections: List[Section] = field(default_factory=list)
+    audio_tracks: List[AudioTrack] = field(default_factory=list)
+    width: Optional[int] = None
+    height: Optional[int] = None
+    fps: Optional[float] = None
+    encoder: dict = field(default_factory=dict)
+    meta: dict = field(default_factory=dict)
+
+    @property
+    def duration(self):
+        starts = self.section_starts()
+        return starts[-1] + self.sections[-1].duration if starts else 0.0
+
+    def section_starts(self):
+        starts, t = [], 0.0
+        for i, s in enumerate(self.sections):
+            if i > 0:
+                t -= s.overlap
+            starts.append(t)
+            t += s.duration
+        return starts
+
+    def snap_to_frames(self, fps=None):
+        """
+        Trim every section's last clip so the section lasts a whole number of
+        frames (rounded down, never below one frame). Sections encoded on their
+        own then concatenate to exactly section_starts(), which the audio mix
+        and overlays are placed on. Returns self.
+        """
+        fps = fps or self.fps
+        if not fps:
+            return self
+        for section in self.sections:
+            if not section.clips:
+                continue
+            frames = max(1, int(section.duration * fps + 1e-6))
+            ref = section.clips[-1]
+            ref.end = max(ref.start, ref.end - (section.duration - frames / fps))
+        return self
+
+    def voice_starts(self):
+        """Timeline start of every section's voice (None where a section has no voice)"""
+        return [max(0.0, start - sec.audio_lead) if sec.voice else None
+                for start, sec in zip(self.section_starts(), self.sections)]
+
+    # --- Serialization ---
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        def audio(d):
+            return AudioTrack(**d) if d else None
+
+        sections = []
+        for s in data.get("sections", []):
+            sections.append(Section(
+                clips=[ClipRef(source=c["source"], start=c["start"], end=c["end"],
+                               effects=[Effect(**e) for e in c.get("effects", [])],
+                               audio_volume=c.get("audio_volume", 0.0)) for c in s.get("clips", [])],
+                overlays=[Overlay(**o) for o in s.get("overlays", [])],
+                voice=audio(s.get("voice")),
+                audio_lead=s.get("audio_lead", 0.0),
+                transition=s.get("transition"),
+                meta=s.get("meta", {})
+            ))
+        return cls(
+            sections=sections,
+            audio_tracks=[AudioTrack(**a) for a in data.get("audio_tracks", [])],
+            width=data.get("width"),
+            height=data.get("height"),
+            fps=data.get("fps"),
+            encoder=data.get("encoder", {}),
+            meta=data.get("meta", {})
+        )
+
+    def to_json(self, indent=2):
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=indent)
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_json())
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+# --- Renderer registry ---
+
+PREVIEW = os.environ.get("YUNSHU_PREVIEW", "") not in ("", "0") # Default of render_timeline(preview=...)
+
+RENDERERS = {}
+
+# Backends are imported on first use so the IR itself has no heavy dependencies
+_BACKEND_MODULES = {
+    "moviepy": "render_moviepy",
+    "ffmpeg": "render_ffmpeg",
+}
+
+def register_renderer(name):
+    def decorator(func):
+        RENDERERS[name] = func
+        return func
+    return decorator
+
+def get_renderer(backend):
+    if backend not in RENDERERS and backend in _BACKEND_MODULES:
+        importlib.import_module(_BACKEND_MODULES[backend])
+    if backend not in RENDERERS:
+        raise ValueError(f"Unknown render backend '{backend}' (available: {sorted(set(RENDERERS) | set(_BACKEND_MODULES))})")
+    return RENDERERS[backend]
+
+def render_timeline(timeline, output_path, backend="moviepy", save_plan=True, preview=None, dry_run=None, **options):
+    """
+    Render `timeline` to `output_path`; the plan is saved next to it as <name>.timeline.json.
+    preview=True renders a low-res, ultrafast copy to <name>_preview<ext> instead (no QA).
+    dry_run=True (default: edit_plan.DRY_RUN) renders nothing and writes <name>.plan.json.
+    Section durations are snapped to whole frames first (Timeline.snap_to_frames), dry runs included.
+    Returns the path written.
+    """
+    from edit_plan import DRY_RUN, write_plan
+    # Whole-frame sections: cuts, voices and captions stay on the frame grid
+    # (before the dry-run plan too, so it carries the durations a render produces)
+    timeline.snap_to_frames()
+    if DRY_RUN if dry_run is None else dry_run:
+        return write_plan(timeline, output_path)
+    if PREVIEW if preview is None else preview:
+        from preview import preview_timeline, preview_path
+        timeline = preview_timeline(timeline)
+        output_path = preview_path(output_path)
+        options.pop("qa", None)
+    if save_plan:
+        timeline.save(os.path.splitext(output_path)[0] + ".timeline.json")
+    get_renderer(backend)(timeline, output_path, **options)
+    return output_path
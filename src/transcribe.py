@@ -5,13 +5,48 @@ import os
 # If this fails, we might need to add current dir to PATH temporarily.
 os.environ["PATH"] += os.pathsep + os.getcwd()
 
+_models = {}
+
+def load_model(model_name="base"):
+    """Load a Whisper model once per process"""
+    if model_name not in _models:
+        print(f"Loading Whisper model '{model_name}'... (this may take a while)")
+        _models[model_name] = whisper.load_model(model_name)
+    return _models[model_name]
+
 def transcribe_audio(audio_path):
-    print(f"Loading Whisper model... (this may take a while)")
-    model = whisper.load_model("base")
+    model = load_model("base")
     print(f"Transcribing {audio_path}...")
     result = model.transcribe(audio_path, language="zh")
     return result["text"]
 
+def transcribe_words(media_path, model_name="base", language="zh"):
+    """
+    Transcribe with word-level timestamps.
+    Accepts audio or video files (Whisper decodes through ffmpeg).
+    Returns a flat list of tokens: [{"start": s, "end": e, "text": "..."}]
+    """
+    model = load_model(model_name)
+    print(f"Transcribing {media_path} (word timestamps)...")
+    result = model.transcribe(media_path, language=language, word_timestamps=True)
+
+    tokens = []
+    for segment in result.get("segments", []):
+        words = segment.get("words")
+        if not words:
+            # Older Whisper builds: fall back to segment granularity
+            words = [{"start": segment["start"], "end": segment["end"], "word": segment["text"]}]
+        for word in words:
+            text = word.get("word", "").strip()
+            if not text:
+                continue
+            tokens.append({
+                "start": round(float(word["start"]), 3),
+                "end": round(float(word["end"]), 3),
+                "text": text
+            })
+    return tokens
+
 if __name__ == "__main__":
     audio_file = "temp_audio.mp3"
     if not os.path.exists(audio_file):
@@ -20,6 +55,6 @@ if __name__ == "__main__":
         text = transcribe_audio(audio_file)
         print("\nTranscription Result:")
         print(text)
-        
+
         with open("transcript.txt", "w", encoding="utf-8") as f:
             f.write(text)
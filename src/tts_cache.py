@@ -0,0 +1,93 @@
+"""
+Content-addressed TTS cache.
+
+Every voice line is synthesized once per (text, voice, rate, pitch) and kept
+under ../data/cache/tts/:
+
+    <key>_default.mp3     the audio
+    <key>_default.json    {"text", "voice", "rate", "pitch", "duration", "words"}
+
+so reruns, dry runs and incremental renders never call edge-tts for a line
+that has not changed. Word boundaries (karaoke captions) come with every
+synthesis.
+
+Dry runs (edit_plan) resolve durations without synthesizing: the cached
+duration when the line was spoken before, otherwise an estimate from the text
+length and the speaking rate.
+"""
+import os
+import re
+import hashlib
+
+from media_utils import cache_path, load_json, save_json, moviepy_module
+
+CJK_PER_SECOND = 4.8   # Neural zh voices at rate +0%
+WORDS_PER_SECOND = 2.6 # Latin words at rate +0%
+PAUSE = 0.25           # Seconds per sentence/clause break
+
+_CJK = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]")
+_WORD = re.compile(r"[A-Za-z0-9]+")
+_BREAK = re.compile(r"[，。！？；：,.!?;:…]+")
+
+def tts_key(text, voice, rate="+0%", pitch=None):
+    blob = "\x1f".join([text, voice, rate, pitch or ""])
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()[:16]
+
+def _paths(key):
+    return cache_path("tts", key, ext=".mp3"), cache_path("tts", key)
+
+def lookup(text, voice, rate="+0%", pitch=None):
+    """Cached entry (with "path") or None - never synthesizes"""
+    audio_path, meta_path = _paths(tts_key(text, voice, rate, pitch))
+    entry = load_json(meta_path)
+    if entry is None or not os.path.exists(audio_path):
+        return None
+    return dict(entry, path=audio_path)
+
+def _speed(rate):
+    """edge-tts rate string ("+30%", "-10%") -> speed factor"""
+    m = re.match(r"^([+-]?\d+(?:\.\d+)?)%$", (rate or "+0%").strip())
+    return max(0.1, 1.0 + float(m.group(1)) / 100.0) if m else 1.0
+
+def estimate_duration(text, rate="+0%"):
+    """Spoken length from the text alone: CJK characters, Latin words and pauses"""
+    cjk = len(_CJK.findall(text))
+    words = len(_WORD.findall(text))
+    breaks = len(_BREAK.findall(text.strip()))
+    seconds = cjk / CJK_PER_SECOND + words / WORDS_PER_SECOND + breaks * PAUSE
+    return round(max(0.5, seconds / _speed(rate)), 3)
+
+async def synthesize(text, voice, rate="+0%", pitch=None):
+    """Cached entry for a line ({"path", "duration", "words", ...}), synthesizing it on a miss"""
+    entry = lookup(text, voice, rate, pitch)
+    if entry is not None:
+        return entry
+
+    from karaoke_captions import synthesize_with_timings
+    audio_path, meta_path = _paths(tts_key(text, voice, rate, pitch))
+    _, words = await synthesize_with_timings(text, audio_path, voice, rate=rate, pitch=pitch)
+    # Decoded length (MoviePy's bundled ffmpeg; ffprobe is not required)
+    audio = moviepy_module().AudioFileClip(audio_path)
+    try:
+        duration = float(audio.duration)
+    finally:
+        audio.close()
+    entry = {"text": text, "voice": voice, "rate": rate, "pitch": pitch,
+             "duration": round(duration, 3), "words": words}
+    save_json(meta_path, entry)
+    return dict(entry, path=audio_path)
+
+async def get_voice(text, voice, rate="+0%", pitch=None, dry_run=False):
+    """
+    Voice line for planning. dry_run=True never synthesizes: "duration_source"
+    is "cache" for lines spoken before, "estimate" otherwise (path then points
+    where the audio will be written).
+    """
+    if not dry_run:
+        return dict(await synthesize(text, voice, rate, pitch), duration_source="tts")
+    entry = lookup(text, voice, rate, pitch)
+    if entry is not None:
+        return dict(entry, duration_source="cache")
+    return {"text": text, "voice": voice, "rate": rate, "pitch": pitch,
+            "path": _paths(tts_key(text, voice, rate, pitch))[0],
+            "duration": estimate_duration(text, rate), "words": [], "duration_source": "estimate"}
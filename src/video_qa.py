@@ -2,138 +2,233 @@ import cv2
 import numpy as np
 import sys
 import os
-try:
-    # MoviePy v2.0+
-    from moviepy import VideoFileClip
-    MOVIEPY_V2 = True
-except ImportError:
-    # MoviePy v1.x
-    from moviepy.editor import VideoFileClip
-    MOVIEPY_V2 = False
-
-def analyze_video_quality(video_path):
+import json
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+from analysis_pipeline import laplacian_sharpness, mean_brightness, motion_energy
+from media_utils import find_ffmpeg
+
+# Sampling: Analyze 1 frame every 0.5 seconds to save time
+SAMPLE_INTERVAL = 0.5
+HOOK_SECONDS = 3.0
+# Files shorter than this are analyzed in a single process (pool startup isn't worth it)
+PARALLEL_MIN_DURATION = 120.0
+
+def _analyze_range(args):
     """
-    Analyzes video for technical quality and 'viral potential' (pacing/motion).
+    Worker: sample frames [start_frame, end_frame) every `step` frames.
+    Unsampled frames are grab()-ed (demuxed, not decoded to BGR).
+    Returns [(t, blur, brightness, motion_or_None), ...]
     """
-    print(f"🕵️ Analyzing Quality for: {os.path.basename(video_path)}")
-    
+    video_path, start_frame, end_frame, step, fps = args
     cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        print("❌ Error: Could not open video.")
-        return
 
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    duration = frame_count / fps
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-
-    print(f"📊 Metadata: {width}x{height} | {fps:.2f}fps | {duration:.2f}s")
-
-    # Metrics
-    blur_scores = []
-    brightness_scores = []
-    motion_scores = []
-    prev_frame = None
-    
-    # Sampling: Analyze 1 frame every 0.5 seconds to save time
-    sample_rate = int(fps * 0.5) 
-    
-    frame_idx = 0
-    while True:
+    # Start one sample early so the first motion value of this range has a predecessor
+    first = max(0, start_frame - step)
+    if first > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, first)
+
+    samples = []
+    prev_gray = None
+    for frame_idx in range(first, end_frame):
+        if frame_idx % step != 0:
+            if not cap.grab():
+                break
+            continue
+
         ret, frame = cap.read()
         if not ret:
             break
-        
-        if frame_idx % sample_rate == 0:
-            # 1. Blur Detection (Laplacian Variance)
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            blur_val = cv2.Laplacian(gray, cv2.CV_64F).var()
-            blur_scores.append(blur_val)
-            
-            # 2. Brightness
-            brightness_val = np.mean(gray)
-            brightness_scores.append(brightness_val)
-            
-            # 3. Motion (Frame Difference)
-            if prev_frame is not None:
-                diff = cv2.absdiff(gray, prev_frame)
-                motion_val = np.mean(diff)
-                motion_scores.append(motion_val)
-            
-            prev_frame = gray
-
-        frame_idx += 1
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        motion = motion_energy(gray, prev_gray) if prev_gray is not None else None
+        prev_gray = gray
+        if frame_idx < start_frame:
+            continue # Predecessor only
+        samples.append((frame_idx / fps, laplacian_sharpness(gray), mean_brightness(gray), motion))
 
     cap.release()
-    
-    # --- Analysis Report ---
-    
+    return samples
+
+def sample_video(video_path, fps, frame_count, workers=None, sample_interval=SAMPLE_INTERVAL):
+    """Sample the whole file, split into parallel time ranges when it is long enough"""
+    step = max(1, int(fps * sample_interval))
+    duration = frame_count / fps
+    workers = workers or os.cpu_count() or 1
+
+    if workers <= 1 or duration < PARALLEL_MIN_DURATION:
+        return _analyze_range((video_path, 0, frame_count, step, fps))
+
+    # Chunk boundaries aligned to the sampling grid
+    chunk = int(np.ceil(frame_count / workers / step)) * step
+    ranges = [(video_path, s, min(s + chunk, frame_count), step, fps) for s in range(0, frame_count, chunk)]
+    print(f"⚡ Parallel QA: {len(ranges)} ranges on {workers} workers")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = list(pool.map(_analyze_range, ranges))
+    return [s for part in parts for s in part]
+
+def hook_peak_volume(video_path, seconds=HOOK_SECONDS):
+    """
+    Peak absolute amplitude (0-1) of the first `seconds` of audio,
+    read as streamed 16-bit PCM from ffmpeg. None if there is no audio.
+    """
+    cmd = [find_ffmpeg(), "-v", "error", "-t", str(seconds), "-i", video_path,
+           "-vn", "-f", "s16le", "-acodec", "pcm_s16le", "-"]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    peak = 0
+    got_audio = False
+    while True:
+        chunk = proc.stdout.read(65536)
+        if not chunk:
+            break
+        got_audio = True
+        pcm = np.frombuffer(chunk[:len(chunk) // 2 * 2], dtype=np.int16)
+        if len(pcm):
+            peak = max(peak, int(np.max(np.abs(pcm.astype(np.int32)))))
+    proc.wait()
+    if not got_audio:
+        return None
+    return peak / 32768.0
+
+def build_report(video_path, meta, samples, hook_volume):
+    """
+    Metrics + verdicts from sampled (t, blur, brightness, motion) tuples.
+    Shared with the inline render QA tap.
+    """
+    blur_scores = [s[1] for s in samples]
+    brightness_scores = [s[2] for s in samples]
+    motion = [(s[0], s[3]) for s in samples if s[3] is not None]
+    motion_scores = [m for _, m in motion]
+    duration = meta["duration"]
+
     # Technical Thresholds
-    avg_blur = np.mean(blur_scores) if blur_scores else 0
-    avg_bright = np.mean(brightness_scores) if brightness_scores else 0
-    
-    # Heuristics
-    is_blurry = avg_blur < 100  # Threshold varies, <100 often means blurry
-    is_dark = avg_bright < 40   # <40 is quite dark
-    
+    avg_blur = float(np.mean(blur_scores)) if blur_scores else 0.0
+    avg_bright = float(np.mean(brightness_scores)) if brightness_scores else 0.0
+
+    # 1. Gold 3 Seconds Check
+    hook_samples = [m for t, m in motion if t <= HOOK_SECONDS + 1e-6]
+    avg_hook_motion = float(np.mean(hook_samples)) if hook_samples else 0.0
+    avg_overall_motion = float(np.mean(motion_scores)) if motion_scores else 0.0
+
+    # 2. Pacing (Shot detection simulation via motion spikes)
+    # A "cut" usually causes a massive spike in frame difference
+    # We look for spikes > 3 * standard_deviation
+    cuts = 0
+    if motion_scores:
+        motion_arr = np.array(motion_scores)
+        threshold = np.mean(motion_arr) + 3 * np.std(motion_arr)
+        cuts = int(np.sum(motion_arr > threshold))
+    est_shot_duration = duration / (cuts + 1)
+
+    if avg_hook_motion > 5.0: # Arbitrary threshold, needs tuning
+        hook_verdict = "strong"
+    elif avg_hook_motion > 2.0:
+        hook_verdict = "moderate"
+    else:
+        hook_verdict = "static"
+
+    return {
+        "file": os.path.basename(video_path),
+        "metadata": meta,
+        "samples": len(samples),
+        "technical": {
+            "blur_score": round(avg_blur, 2),
+            "is_blurry": avg_blur < 100,  # Threshold varies, <100 often means blurry
+            "brightness": round(avg_bright, 2),
+            "is_dark": avg_bright < 40    # <40 is quite dark
+        },
+        "viral": {
+            "hook_motion": round(avg_hook_motion, 2),
+            "overall_motion": round(avg_overall_motion, 2),
+            "hook_verdict": hook_verdict,
+            "cuts": cuts,
+            "cut_rate_per_min": round(cuts / duration * 60, 2) if duration else 0.0,
+            "est_shot_duration": round(est_shot_duration, 2),
+            "pacing_fast": est_shot_duration < 4.0,
+            "hook_volume": None if hook_volume is None else round(hook_volume, 3),
+            "hook_audio_ok": None if hook_volume is None else hook_volume >= 0.2
+        }
+    }
+
+def print_report(report):
+    meta = report["metadata"]
+    tech = report["technical"]
+    viral = report["viral"]
+    print(f"📊 Metadata: {meta['width']}x{meta['height']} | {meta['fps']:.2f}fps | {meta['duration']:.2f}s")
+
     print("\n--- 🛠️ Technical Quality ---")
-    print(f"Blur Score: {avg_blur:.2f} ({'⚠️ Blurry' if is_blurry else '✅ Sharp'})")
-    print(f"Brightness: {avg_bright:.2f} ({'⚠️ Dark' if is_dark else '✅ OK'})")
-    
+    print(f"Blur Score: {tech['blur_score']:.2f} ({'⚠️ Blurry' if tech['is_blurry'] else '✅ Sharp'})")
+    print(f"Brightness: {tech['brightness']:.2f} ({'⚠️ Dark' if tech['is_dark'] else '✅ OK'})")
+
     # Viral Potential (Pacing & Hook)
     print("\n--- 🚀 Viral Potential ---")
-    
-    # 1. Gold 3 Seconds Check
-    # First 3 seconds = first 6 samples (since we sample every 0.5s)
-    hook_samples = motion_scores[:6]
-    avg_hook_motion = np.mean(hook_samples) if hook_samples else 0
-    avg_overall_motion = np.mean(motion_scores) if motion_scores else 0
-    
-    print(f"Hook Motion (First 3s): {avg_hook_motion:.2f}")
-    print(f"Overall Motion: {avg_overall_motion:.2f}")
-    
-    if avg_hook_motion > 5.0: # Arbitrary threshold, needs tuning
+    print(f"Hook Motion (First 3s): {viral['hook_motion']:.2f}")
+    print(f"Overall Motion: {viral['overall_motion']:.2f}")
+    if viral["hook_verdict"] == "strong":
         print("✅ Hook: Strong visual motion detected in first 3s!")
-    elif avg_hook_motion > 2.0:
-         print("⚠️ Hook: Moderate motion. Could be punchier.")
+    elif viral["hook_verdict"] == "moderate":
+        print("⚠️ Hook: Moderate motion. Could be punchier.")
     else:
         print("❌ Hook: Static start. Risk of scroll-away!")
-        
-    # 2. Pacing (Shot detection simulation via motion spikes)
-    # Simple peak detection in motion scores
-    motion_arr = np.array(motion_scores)
-    # A "cut" usually causes a massive spike in frame difference
-    # We look for spikes > 3 * standard_deviation
-    threshold = np.mean(motion_arr) + 3 * np.std(motion_arr)
-    cuts = np.sum(motion_arr > threshold)
-    
-    est_shot_duration = duration / (cuts + 1)
-    print(f"Est. Shot Duration: ~{est_shot_duration:.1f}s")
-    
-    if est_shot_duration < 4.0:
+
+    print(f"Est. Shot Duration: ~{viral['est_shot_duration']:.1f}s")
+    if viral["pacing_fast"]:
         print("✅ Pacing: Fast (Good for TikTok/Shorts)")
     else:
         print("⚠️ Pacing: Slow. Consider more cuts.")
 
     # 3. Audio Check (Volume)
-    try:
-        clip = VideoFileClip(video_path)
-        # Check first 3s audio volume
-        if MOVIEPY_V2:
-            audio_sub = clip.subclipped(0, min(3, duration))
+    if viral["hook_volume"] is None:
+        print("⚠️ Audio check failed: no audio stream")
+    else:
+        print(f"Hook Audio Vol: {viral['hook_volume']:.2f}")
+        if viral["hook_audio_ok"]:
+            print("✅ Hook Audio: Good volume.")
         else:
-            audio_sub = clip.subclip(0, min(3, duration))
-            
-        max_vol = audio_sub.audio.max_volume()
-        print(f"Hook Audio Vol: {max_vol:.2f}")
-        if max_vol < 0.2:
             print("❌ Hook Audio: Too quiet! Add SFX or louder speech.")
-        else:
-            print("✅ Hook Audio: Good volume.")
-        clip.close()
+
+def save_report(report, video_path, report_path=None):
+    """Machine-readable report next to the video: <name>.qa.json"""
+    report_path = report_path or os.path.splitext(video_path)[0] + ".qa.json"
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n📝 QA report saved: {report_path}")
+    return report_path
+
+def analyze_video_quality(video_path, workers=None, report_path=None):
+    """
+    Analyzes video for technical quality and 'viral potential' (pacing/motion).
+    Returns the report dict (also printed and saved as JSON).
+    """
+    print(f"🕵️ Analyzing Quality for: {os.path.basename(video_path)}")
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        print("❌ Error: Could not open video.")
+        return None
+
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    meta = {
+        "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        "fps": fps,
+        "duration": frame_count / fps
+    }
+    cap.release()
+
+    samples = sample_video(video_path, fps, frame_count, workers=workers)
+
+    try:
+        hook_volume = hook_peak_volume(video_path, min(HOOK_SECONDS, meta["duration"]))
     except Exception as e:
         print(f"⚠️ Audio check failed: {e}")
+        hook_volume = None
+
+    report = build_report(video_path, meta, samples, hook_volume)
+    print_report(report)
+    save_report(report, video_path, report_path)
+    return report
 
 if __name__ == "__main__":
     if len(sys.argv) > 1:
@@ -0,0 +1,180 @@
+"""
+Tiered output validation.
+
+    fast     container structure, stream durations and the keyframe index
+             (ffprobe only - nothing is decoded)
+    sampled  fast + decode N evenly spaced GOPs in parallel
+    full     fast + decode the whole file as parallel keyframe-aligned ranges
+
+Every tier reports what it covered (seconds decoded, coverage ratio), so batch
+pipelines can choose their own cost/assurance trade-off.
+"""
+import os
+import sys
+import time
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from media_utils import find_ffmpeg, probe_media, probe_keyframes
+
+TIERS = ("fast", "sampled", "full")
+MIN_SIZE = 1024 * 1024 # < 1MB is almost certainly a broken export
+MAX_DURATION_MISMATCH = 1.0 # seconds between audio and video streams
+MAX_KEYFRAME_GAP = 10.0
+
+def _fast_checks(file_path, report, min_size):
+    """Container-level checks. Returns keyframe times (or None on fatal failure)."""
+    if not os.path.exists(file_path):
+        report["errors"].append("Output file not found")
+        return None
+
+    size = os.path.getsize(file_path)
+    report["checks"]["size_bytes"] = size
+    if size < min_size:
+        report["errors"].append("File size too small (possible corruption)")
+        return None
+
+    try:
+        info = probe_media(file_path)
+    except (subprocess.CalledProcessError, ValueError) as e:
+        report["errors"].append(f"Container unreadable: {getattr(e, 'stderr', e)}")
+        return None
+    except OSError as e:
+        # ffprobe missing (only ffmpeg.exe is bundled)
+        report["errors"].append(f"ffprobe unavailable: {e}")
+        return None
+
+    fmt = info.get("format", {})
+    streams = info.get("streams", [])
+    video = [s for s in streams if s.get("codec_type") == "video"]
+    audio = [s for s in streams if s.get("codec_type") == "audio"]
+    container_dur = float(fmt.get("duration", 0) or 0)
+    report["checks"].update({
+        "format": fmt.get("format_name"),
+        "duration": container_dur,
+        "video_streams": len(video),
+        "audio_streams": len(audio)
+    })
+    report["duration"] = container_dur
+
+    if not video:
+        report["errors"].append("No video stream")
+        return None
+    if container_dur <= 0:
+        report["errors"].append("Container reports zero duration")
+        return None
+
+    # Stream duration consistency (truncated writes usually show up here)
+    stream_durs = {}
+    for s in video[:1] + audio[:1]:
+        if s.get("duration") not in (None, "N/A"):
+            stream_durs[s["codec_type"]] = float(s["duration"])
+    report["checks"]["stream_durations"] = stream_durs
+    if "video" in stream_durs and "audio" in stream_durs:
+        mismatch = abs(stream_durs["video"] - stream_durs["audio"])
+        if mismatch > MAX_DURATION_MISMATCH:
+            report["warnings"].append(f"Audio/video duration mismatch: {mismatch:.2f}s")
+
+    # Keyframe index
+    try:
+        keyframes = probe_keyframes(file_path)
+    except subprocess.CalledProcessError as e:
+        report["errors"].append(f"Packet index unreadable: {e.stderr}")
+        return None
+    except OSError as e:
+        report["errors"].append(f"ffprobe unavailable: {e}")
+        return None
+    report["checks"]["keyframes"] = len(keyframes)
+    if not keyframes:
+        report["errors"].append("No keyframes in video stream")
+        return None
+    if keyframes[0] > 0.5:
+        report["warnings"].append(f"First keyframe at {keyframes[0]:.2f}s")
+    gaps = [b - a for a, b in zip(keyframes, keyframes[1:] + [container_dur])]
+    report["checks"]["max_keyframe_gap"] = round(max(gaps), 3)
+    if max(gaps) > MAX_KEYFRAME_GAP:
+        report["warnings"].append(f"Sparse keyframes (max gap {max(gaps):.1f}s)")
+    return keyframes
+
+def _decode_range(file_path, start, duration):
+    """Decode [start, start+duration) of every stream to null. Returns stderr text."""
+    cmd = [find_ffmpeg(), "-v", "error", "-ss", f"{start:.3f}", "-i", file_path,
+           "-t", f"{duration:.3f}", "-map", "0", "-f", "null", "-"]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+    except OSError as e:
+        return f"Error: ffmpeg unavailable ({e})"
+    if result.returncode != 0 and not result.stderr:
+        return f"ffmpeg exited with {result.returncode}"
+    return result.stderr
+
+def _decode_ranges(file_path, ranges, report, workers):
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        outputs = list(pool.map(lambda r: _decode_range(file_path, r[0], r[1] - r[0]), ranges))
+    for (start, end), stderr in zip(ranges, outputs):
+        if not stderr:
+            continue
+        # Some warnings might be ignorable, but "Error" is bad.
+        target = report["errors"] if ("Error" in stderr or "Invalid" in stderr) else report["warnings"]
+        target.append(f"[{start:.1f}s-{end:.1f}s] {stderr.strip()[:300]}")
+    report["ranges_decoded"] = len(ranges)
+    report["covered_seconds"] = round(sum(e - s for s, e in ranges), 3)
+
+def validate(file_path, tier="fast", samples=8, workers=None, min_size=MIN_SIZE):
+    """Validate a rendered file. Returns a report dict with report["ok"]."""
+    if tier not in TIERS:
+        raise ValueError(f"Unknown tier '{tier}', expected one of {TIERS}")
+    workers = workers or os.cpu_count() or 1
+    t0 = time.time()
+    report = {"file": file_path, "tier": tier, "ok": False, "checks": {}, "errors": [], "warnings": [],
+              "duration": 0.0, "ranges_decoded": 0, "covered_seconds": 0.0, "coverage": 0.0}
+
+    keyframes = _fast_checks(file_path, report, min_size)
+    if keyframes is not None and tier != "fast":
+        duration = report["duration"]
+        bounds = keyframes + [duration]
+        gops = [(bounds[i], bounds[i + 1]) for i in range(len(keyframes)) if bounds[i + 1] > bounds[i]]
+
+        if tier == "sampled":
+            # N evenly spaced GOPs, always including the first and the last one
+            n = min(samples, len(gops))
+            picks = sorted({round(i * (len(gops) - 1) / max(1, n - 1)) for i in range(n)})
+            ranges = [gops[i] for i in picks]
+        else:
+            # Whole file, split at keyframes into ~equal parallel ranges
+            per_range = duration / workers
+            ranges = []
+            range_start = gops[0][0]
+            for start, end in gops:
+                if end - range_start >= per_range:
+                    ranges.append((range_start, end))
+                    range_start = end
+            if range_start < duration:
+                ranges.append((range_start, duration))
+            if gops[0][0] > 0:
+                ranges.insert(0, (0.0, gops[0][0]))
+
+        _decode_ranges(file_path, ranges, report, workers)
+        report["coverage"] = round(report["covered_seconds"] / duration, 4) if duration else 0.0
+
+    report["ok"] = keyframes is not None and not report["errors"]
+    report["elapsed"] = round(time.time() - t0, 3)
+    return report
+
+def print_validation(report):
+    checks = report["checks"]
+    print(f"Validation tier '{report['tier']}': {checks.get('keyframes', 0)} keyframes, "
+          f"decoded {report['ranges_decoded']} ranges / {report['covered_seconds']:.1f}s "
+          f"({report['coverage'] * 100:.0f}% coverage) in {report.get('elapsed', 0):.1f}s")
+    for w in report["warnings"]:
+        print(f"⚠️ {w}")
+    for e in report["errors"]:
+        print(f"❌ {e}")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python video_validator.py <video_path> [fast|sampled|full]")
+    else:
+        r = validate(sys.argv[1], tier=sys.argv[2] if len(sys.argv) > 2 else "sampled")
+        print_validation(r)
+        print("✅ Passed" if r["ok"] else "❌ Failed")